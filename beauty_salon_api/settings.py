@@ -2,6 +2,7 @@ from pathlib import Path
 from decouple import config
 from datetime import timedelta
 import os
+import tempfile
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -125,6 +126,37 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Хранилище файлов изображений: local - MEDIA_ROOT (общий том web/nginx),
+# s3 - S3-совместимое хранилище, узлы web и воркеров не делят файловую систему
+IMAGE_STORAGE_BACKEND = config('IMAGE_STORAGE_BACKEND', default='local')
+IMAGE_STORAGE = {'BACKEND': 'django.core.files.storage.FileSystemStorage'}
+if IMAGE_STORAGE_BACKEND == 's3':
+    IMAGE_STORAGE = {
+        'BACKEND': 'images.storage_s3.ImageS3Storage',
+        'OPTIONS': {
+            'bucket_name': config('IMAGE_S3_BUCKET'),
+            'endpoint_url': config('IMAGE_S3_ENDPOINT_URL', default=None),
+            'region_name': config('IMAGE_S3_REGION', default=None),
+            'access_key': config('IMAGE_S3_ACCESS_KEY', default=None),
+            'secret_key': config('IMAGE_S3_SECRET_KEY', default=None),
+            'custom_domain': config('IMAGE_S3_CUSTOM_DOMAIN', default=None),
+            'location': 'media',
+            'querystring_auth': False,
+            # Имена производных содержат хэш содержимого
+            'object_parameters': {'CacheControl': 'public, max-age=31536000, immutable'},
+        },
+    }
+# Параллельная multipart-загрузка больших объектов в S3
+IMAGE_S3_MULTIPART_THRESHOLD = 8 * 1024 * 1024
+IMAGE_S3_MULTIPART_CHUNKSIZE = 8 * 1024 * 1024
+IMAGE_S3_MAX_CONCURRENCY = 10
+
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    'images': IMAGE_STORAGE,
+}
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # REST Framework settings
@@ -236,6 +268,13 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'Europe/Moscow'
 
+# Обработка изображений идет в отдельной очереди, чтобы тяжелые задачи Pillow
+# не задерживали остальные задачи и масштабировались числом воркеров
+CELERY_TASK_ROUTES = {
+    'images.tasks.*': {'queue': 'images'},
+}
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+
 # Периодические задачи
 from celery.schedules import crontab
 
@@ -244,6 +283,14 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'quotes.tasks.update_daily_quote',
         'schedule': crontab(hour=0, minute=0),  # Каждый день в полночь
     },
+    'purge-deleted-image-files': {
+        'task': 'images.tasks.purge_file_deletions',
+        'schedule': crontab(minute='*/10'),  # Дочистка очереди удаления после сбоев
+    },
+    'purge-upload-sessions': {
+        'task': 'images.tasks.purge_upload_sessions',
+        'schedule': crontab(minute=30),  # Раз в час: истекшие сессии возобновляемой загрузки
+    },
 }
 
 
@@ -256,7 +303,9 @@ AUTHENTICATION_BACKENDS = [
 ]
 
 
-FILE_UPLOAD_MAX_MEMORY_SIZE = 128 * 1024 * 1024  # 128MB
+# Файлы больше 2.5MB пишутся во временный файл, а не держатся в памяти;
+# эндпоинты изображений всегда пишут потоком (images.uploadhandlers)
+FILE_UPLOAD_MAX_MEMORY_SIZE = 2621440  # 2.5MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 128 * 1024 * 1024  # 128MB
 DATA_UPLOAD_MAX_NUMBER_FIELDS = 1000
 
@@ -264,6 +313,86 @@ DATA_UPLOAD_MAX_NUMBER_FIELDS = 1000
 ALLOWED_IMAGE_EXTENSIONS = ['jpg', 'jpeg', 'png', 'webp']
 MAX_IMAGE_SIZE = 128 * 1024 * 1024  # 128MB
 CROP_SIZE = 600
+# Бюджет на декодирование одного изображения: лимит пикселей по заголовку
+# (защита от decompression bomb) и объема буфера после уменьшенного декодирования
+IMAGE_MAX_PIXELS = 60 * 1000 * 1000
+IMAGE_MAX_DECODE_BYTES = 256 * 1024 * 1024
+# Ширины адаптивных копий (srcset), генерируются из одного декодирования оригинала
+IMAGE_VARIANT_WIDTHS = [320, 640, 960, 1280, 1920]
+# Форматы копий; клиенту отдается самый компактный из поддерживаемых (Accept)
+IMAGE_VARIANT_FORMATS = ['avif', 'webp', 'jpeg']
+# Профили кодирования (см. images/profiles.py): качество подбирается двоичным
+# поиском один раз на формат за обработку; профиль выбирается при загрузке
+# (поле encoder_profile). min_ssim - минимальный SSIM, bytes_per_megapixel -
+# бюджет (масштабируется по площади), quality - свои диапазоны по форматам;
+# профиль без порогов кодирует с фиксированными параметрами ENCODE_OPTIONS
+IMAGE_DEFAULT_ENCODER_PROFILE = 'standard'
+IMAGE_ENCODER_PROFILES = {
+    'standard': {'min_ssim': 0.95},
+    'hero': {'min_ssim': 0.98, 'quality': {'avif': (40, 75), 'webp': (60, 92), 'jpeg': (60, 92)}},
+    'card': {'min_ssim': 0.94, 'bytes_per_megapixel': 250 * 1024},
+    'thumb': {'min_ssim': 0.92, 'bytes_per_megapixel': 150 * 1024},
+    'fixed': {},
+}
+# Анимированные GIF/WebP перекодируются в анимированный WebP (images/animation.py):
+# рамка кадра, максимум кадров (остальные отбрасываются), частота (более короткие
+# кадры сливаются) и качество; все кадры должны уложиться в IMAGE_MAX_DECODE_BYTES
+IMAGE_ANIMATION_MAX_SIZE = (800, 800)
+IMAGE_ANIMATION_MAX_FRAMES = 300
+IMAGE_ANIMATION_MAX_FPS = 25
+IMAGE_ANIMATION_QUALITY = 75
+# Рендер копий по запросу (/backend/images/<id>/render/): ключ подписи параметров,
+# максимальная сторона и ограниченный по размеру кэш на диске (вытеснение LRU)
+IMAGE_RENDER_SIGNING_KEY = config('IMAGE_RENDER_SIGNING_KEY', default=SECRET_KEY)
+IMAGE_RENDER_MAX_DIMENSION = 3840
+IMAGE_RENDER_CACHE_DIR = os.path.join(MEDIA_ROOT, 'images', 'cache')
+IMAGE_RENDER_CACHE_MAX_BYTES = config('IMAGE_RENDER_CACHE_MAX_BYTES', default=1024 * 1024 * 1024, cast=int)
+# Каталог кэша обходится, когда учтенные процессом записи превышают лимит или раз в N секунд
+IMAGE_RENDER_CACHE_CHECK_INTERVAL = 60
+# Отдача файлов через nginx: Django проверяет файл и возвращает X-Accel-Redirect
+# на internal-локацию (см. nginx.conf), тело файла не проходит через воркер
+IMAGE_MEDIA_ACCEL_REDIRECT = config('IMAGE_MEDIA_ACCEL_REDIRECT', default=False, cast=bool)
+IMAGE_MEDIA_ACCEL_PREFIX = '/protected-media/'
+# Имена производных содержат хэш содержимого, поэтому кэш без ревалидации
+IMAGE_MEDIA_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# Поиск похожих изображений по dHash: расстояние Хэмминга по умолчанию
+# и верхняя граница для параметра distance
+IMAGE_SIMILAR_MAX_DISTANCE = 8
+IMAGE_SIMILAR_DISTANCE_LIMIT = 12
+# Возобновляемая загрузка (/backend/images/uploads/): каталог сессий (общий для
+# всех экземпляров, вне MEDIA_ROOT), срок жизни без активности и предел одного чанка
+IMAGE_UPLOAD_SESSION_DIR = config('IMAGE_UPLOAD_SESSION_DIR', default=os.path.join(BASE_DIR, 'upload_sessions'))
+IMAGE_UPLOAD_SESSION_TTL = 24 * 60 * 60
+IMAGE_UPLOAD_CHUNK_MAX_SIZE = 8 * 1024 * 1024
+# URL-поля других приложений, ссылающиеся на загруженные изображения: индекс
+# ImageReference обновляется при сохранении, списки отдают копии и заглушки (поле images)
+IMAGE_REFERENCE_FIELDS = {
+    'masters.Master': ['image'],
+    'products.Product': ['image'],
+    'portfolio.Portfolio': ['image'],
+    'service_types.ServiceType': ['main_image', 'benefits_images'],
+    'services.Service': ['main_images'],
+}
+# Максимум файлов в одном запросе POST /backend/images/batch/
+IMAGE_BATCH_MAX_FILES = 50
+# False - обработка выполняется синхронно в процессе (без брокера, для отладки)
+IMAGE_PROCESSING_ASYNC = config('IMAGE_PROCESSING_ASYNC', default=True, cast=bool)
+# Контроль нагрузки (images/admission.py): при глубине очереди обработки от лимита
+# загрузки получают 429 с Retry-After (оценка по темпу обработки, без него - значение
+# по умолчанию). Декодирование и кодирование идут в ограниченном числе слотов на хост
+# (рендер без свободного слота - 503), каталог слотов общий для процессов хоста
+IMAGE_PROCESSING_QUEUE_LIMIT = config('IMAGE_PROCESSING_QUEUE_LIMIT', default=500, cast=int)
+IMAGE_PROCESSING_QUEUE_WINDOW = 60 * 60
+IMAGE_PROCESSING_RETRY_AFTER = 30
+IMAGE_PROCESSING_RETRY_AFTER_MAX = 300
+# Повторы задачи обработки при временных сбоях хранилища или базы
+IMAGE_PROCESSING_MAX_RETRIES = 5
+IMAGE_PROCESSING_CONCURRENCY = config('IMAGE_PROCESSING_CONCURRENCY', default=2, cast=int)
+IMAGE_PROCESSING_SLOT_TIMEOUT = 60
+IMAGE_RENDER_CONCURRENCY = config('IMAGE_RENDER_CONCURRENCY', default=2, cast=int)
+IMAGE_RENDER_SLOT_TIMEOUT = 1
+IMAGE_RENDER_RETRY_AFTER = 2
+IMAGE_SLOT_DIR = config('IMAGE_SLOT_DIR', default=os.path.join(tempfile.gettempdir(), 'image-slots'))
 
 LOGGING = {
     'version': 1,
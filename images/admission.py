@@ -0,0 +1,223 @@
+"""
+Контроль нагрузки обработки изображений.
+
+Очередь: загрузки отклоняются с 429, пока в ней (ожидающие и обрабатываемые
+изображения) не меньше IMAGE_PROCESSING_QUEUE_LIMIT записей; Retry-After
+оценивается по темпу обработки за последние минуты.
+
+Слоты хоста: тяжелое декодирование и кодирование выполняется не более чем
+в N процессах одного хоста одновременно (flock на N файлах в IMAGE_SLOT_DIR,
+блокировка снимается ядром и при падении процесса). Рендер по запросу без
+свободного слота сразу получает 503, задача обработки ждет слот.
+"""
+import fcntl
+import math
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.throttling import BaseThrottle
+from .models import ImageUpload
+
+QUEUE_COUNTS_CACHE_KEY = 'images:processing_queue_counts'
+THROUGHPUT_CACHE_KEY = 'images:processing_throughput'
+# Счетчики очереди кэшируются на пару секунд: при всплеске загрузок
+# проверка не превращается в COUNT на каждый запрос
+QUEUE_COUNTS_CACHE_TTL = 2
+THROUGHPUT_CACHE_TTL = 10
+# Темп обработки оценивается по изображениям, обработанным за это окно
+THROUGHPUT_WINDOW = timedelta(minutes=5)
+SLOT_POLL_INTERVAL = 0.1
+
+RENDER_SLOTS = 'render'
+PROCESSING_SLOTS = 'processing'
+
+
+class ServiceBusy(APIException):
+    """503 с Retry-After: обработчик исключений DRF берет заголовок из wait"""
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Сервис обработки изображений перегружен, повторите запрос позже'
+    default_code = 'service_busy'
+    
+    def __init__(self, wait, detail=None):
+        super().__init__(detail)
+        self.wait = wait
+
+
+class SlotUnavailable(Exception):
+    """Все слоты хоста заняты"""
+
+
+def get_queue_limit():
+    return getattr(settings, 'IMAGE_PROCESSING_QUEUE_LIMIT', 500)
+
+
+def get_queue_counts():
+    """
+    Число ожидающих и обрабатываемых изображений. Учитываются записи,
+    обновленные за IMAGE_PROCESSING_QUEUE_WINDOW: задача, потерянная
+    при сбое брокера, не блокирует загрузки навсегда.
+    """
+    counts = cache.get(QUEUE_COUNTS_CACHE_KEY)
+    if counts is None:
+        window = getattr(settings, 'IMAGE_PROCESSING_QUEUE_WINDOW', 60 * 60)
+        rows = (
+            ImageUpload.objects
+            .filter(
+                status__in=[ImageUpload.STATUS_PENDING, ImageUpload.STATUS_PROCESSING],
+                updated_at__gte=timezone.now() - timedelta(seconds=window),
+            )
+            .order_by()
+            .values('status')
+            .annotate(count=Count('id'))
+        )
+        counts = {ImageUpload.STATUS_PENDING: 0, ImageUpload.STATUS_PROCESSING: 0}
+        counts.update((row['status'], row['count']) for row in rows)
+        cache.set(QUEUE_COUNTS_CACHE_KEY, counts, QUEUE_COUNTS_CACHE_TTL)
+    return counts
+
+
+def get_queue_depth():
+    return sum(get_queue_counts().values())
+
+
+def get_throughput():
+    """Обработанных изображений в секунду за последние THROUGHPUT_WINDOW"""
+    throughput = cache.get(THROUGHPUT_CACHE_KEY)
+    if throughput is None:
+        done = ImageUpload.objects.filter(
+            status=ImageUpload.STATUS_DONE,
+            updated_at__gte=timezone.now() - THROUGHPUT_WINDOW,
+        ).count()
+        throughput = done / THROUGHPUT_WINDOW.total_seconds()
+        cache.set(THROUGHPUT_CACHE_KEY, throughput, THROUGHPUT_CACHE_TTL)
+    return throughput
+
+
+def estimate_retry_after(depth):
+    """
+    Секунды до освобождения места в очереди: превышение лимита, деленное на
+    темп обработки. Без обработанных за окно изображений -
+    IMAGE_PROCESSING_RETRY_AFTER.
+    """
+    default = getattr(settings, 'IMAGE_PROCESSING_RETRY_AFTER', 30)
+    maximum = getattr(settings, 'IMAGE_PROCESSING_RETRY_AFTER_MAX', 300)
+    throughput = get_throughput()
+    if not throughput:
+        return default
+    excess = depth - get_queue_limit() + 1
+    return min(max(math.ceil(excess / throughput), 1), maximum)
+
+
+def get_queue_stats():
+    counts = get_queue_counts()
+    depth = sum(counts.values())
+    limit = get_queue_limit()
+    oldest = (
+        ImageUpload.objects.filter(status=ImageUpload.STATUS_PENDING)
+        .order_by('created_at')
+        .values_list('created_at', flat=True)
+        .first()
+    )
+    return {
+        'pending': counts[ImageUpload.STATUS_PENDING],
+        'processing': counts[ImageUpload.STATUS_PROCESSING],
+        'depth': depth,
+        'limit': limit,
+        'saturated': depth >= limit,
+        'oldest_pending_seconds': int((timezone.now() - oldest).total_seconds()) if oldest else None,
+        'throughput_per_minute': round(get_throughput() * 60, 1),
+        'render_slots': {
+            'limit': get_slot_limit(RENDER_SLOTS),
+            'busy': count_busy_slots(RENDER_SLOTS),
+        },
+        'processing_slots': {
+            'limit': get_slot_limit(PROCESSING_SLOTS),
+            'busy': count_busy_slots(PROCESSING_SLOTS),
+        },
+    }
+
+
+class ProcessingQueueThrottle(BaseThrottle):
+    """Отказ (429 с Retry-After) в загрузке, пока очередь обработки заполнена"""
+    
+    def allow_request(self, request, view):
+        self.depth = get_queue_depth()
+        return self.depth < get_queue_limit()
+    
+    def wait(self):
+        return estimate_retry_after(self.depth)
+
+
+def get_slot_dir():
+    return getattr(settings, 'IMAGE_SLOT_DIR', os.path.join(tempfile.gettempdir(), 'image-slots'))
+
+
+def get_slot_limit(pool):
+    if pool == RENDER_SLOTS:
+        return getattr(settings, 'IMAGE_RENDER_CONCURRENCY', os.cpu_count() or 1)
+    return getattr(settings, 'IMAGE_PROCESSING_CONCURRENCY', os.cpu_count() or 1)
+
+
+def get_slot_path(pool, index):
+    return os.path.join(get_slot_dir(), f'{pool}-{index}.lock')
+
+
+def try_lock_slot(pool, index):
+    """Открытый файл с захваченной блокировкой слота или None, если слот занят"""
+    handle = open(get_slot_path(pool, index), 'a')
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        handle.close()
+        return None
+    return handle
+
+
+@contextmanager
+def host_slot(pool, timeout=0):
+    """
+    Захват одного из слотов пула на время блока. Если свободного слота нет
+    дольше timeout секунд - SlotUnavailable.
+    """
+    os.makedirs(get_slot_dir(), exist_ok=True)
+    limit = get_slot_limit(pool)
+    deadline = time.monotonic() + timeout
+    
+    handle = None
+    while handle is None:
+        for index in range(limit):
+            handle = try_lock_slot(pool, index)
+            if handle is not None:
+                break
+        else:
+            if time.monotonic() >= deadline:
+                raise SlotUnavailable(f'Все слоты {pool} ({limit}) заняты')
+            time.sleep(SLOT_POLL_INTERVAL)
+    
+    # Закрытие файла снимает блокировку
+    with handle:
+        yield
+
+
+def count_busy_slots(pool):
+    """Число занятых слотов пула (пробный захват каждого)"""
+    busy = 0
+    for index in range(get_slot_limit(pool)):
+        try:
+            handle = try_lock_slot(pool, index)
+        except FileNotFoundError:
+            # Каталог слотов еще не создан - слоты не использовались
+            return 0
+        if handle is None:
+            busy += 1
+        else:
+            handle.close()
+    return busy
@@ -0,0 +1,121 @@
+"""
+Анимированные изображения (GIF, WebP): перекодирование в анимированный WebP.
+Исходник декодируется по одному кадру; в памяти держатся только уменьшенные
+кадры, а их размер подбирается так, чтобы все кадры уложились в бюджет
+IMAGE_MAX_DECODE_BYTES. Частота кадров ограничивается слиянием слишком
+коротких кадров, длина - IMAGE_ANIMATION_MAX_FRAMES.
+"""
+import io
+import math
+from collections import namedtuple
+from django.conf import settings
+from PIL import Image, ImageSequence
+from .processing import ImageTooLargeError
+
+ANIMATION_MAX_SIZE = (800, 800)
+ANIMATION_MAX_FRAMES = 300
+ANIMATION_MAX_FPS = 25
+ANIMATION_QUALITY = 75
+# Браузеры показывают кадры с задержкой до 10 мс (и без задержки) 100 мс
+MIN_FRAME_DURATION = 10
+DEFAULT_FRAME_DURATION = 100
+BYTES_PER_PIXEL = 4
+
+Animation = namedtuple('Animation', ['data', 'size', 'cropped_data', 'cropped_size', 'frame_count', 'first_frame'])
+
+
+def is_animated(img):
+    return getattr(img, 'is_animated', False) and getattr(img, 'n_frames', 1) > 1
+
+
+def get_frame_size(source_size, box, frame_count, max_bytes, extra_bytes=0):
+    """
+    Размер кадра: вписанный в box и уменьшенный настолько, чтобы frame_count
+    кадров (плюс extra_bytes на кадр) поместились в max_bytes.
+    """
+    width, height = source_size
+    scale = min(1, box[0] / width, box[1] / height)
+    if max_bytes:
+        available = max_bytes / frame_count - extra_bytes
+        if available < BYTES_PER_PIXEL:
+            raise ImageTooLargeError(f'Анимация из {frame_count} кадров не помещается в {max_bytes} байт')
+        scale = min(scale, math.sqrt(available / (width * height * BYTES_PER_PIXEL)))
+    return (max(1, int(width * scale)), max(1, int(height * scale)))
+
+
+def pad_square(frame, size):
+    """Кадр, вписанный в квадрат size x size с прозрачными полями"""
+    fitted = frame.copy()
+    fitted.thumbnail((size, size), Image.Resampling.LANCZOS)
+    square = Image.new('RGBA', (size, size), (255, 255, 255, 0))
+    square.paste(fitted, ((size - fitted.width) // 2, (size - fitted.height) // 2))
+    return square
+
+
+def encode_animation(frames, durations, loop):
+    quality = getattr(settings, 'IMAGE_ANIMATION_QUALITY', ANIMATION_QUALITY)
+    buffer = io.BytesIO()
+    frames[0].save(
+        buffer,
+        'WEBP',
+        save_all=True,
+        append_images=frames[1:],
+        duration=durations,
+        loop=loop,
+        quality=quality,
+        method=4,
+    )
+    return buffer.getvalue()
+
+
+def transcode_animation(source, crop_size=None, max_pixels=None, max_bytes=None):
+    """
+    Анимированный WebP из открытого анимированного изображения и, если задан
+    crop_size, квадратная анимированная копия. Кадры короче 1/IMAGE_ANIMATION_MAX_FPS
+    сливаются со следующими (показывается последний, длительности суммируются).
+    """
+    width, height = source.size
+    if max_pixels and width * height > max_pixels:
+        raise ImageTooLargeError(f'Изображение {width}x{height} превышает лимит {max_pixels} пикселей')
+    
+    max_frames = getattr(settings, 'IMAGE_ANIMATION_MAX_FRAMES', ANIMATION_MAX_FRAMES)
+    min_interval = 1000 / getattr(settings, 'IMAGE_ANIMATION_MAX_FPS', ANIMATION_MAX_FPS)
+    box = getattr(settings, 'IMAGE_ANIMATION_MAX_SIZE', ANIMATION_MAX_SIZE)
+    crop_bytes = crop_size * crop_size * BYTES_PER_PIXEL if crop_size else 0
+    frame_size = get_frame_size(source.size, box, min(source.n_frames, max_frames), max_bytes, crop_bytes)
+    # У GIF без блока NETSCAPE нет loop - он проигрывается один раз
+    loop = source.info.get('loop', 1)
+    
+    frames = []
+    squares = []
+    durations = []
+    for frame in ImageSequence.Iterator(source):
+        duration = frame.info.get('duration') or 0
+        if duration <= MIN_FRAME_DURATION:
+            duration = DEFAULT_FRAME_DURATION
+        
+        if frames and durations[-1] < min_interval:
+            # Предыдущий кадр слишком короткий - заменяется текущим
+            frames.pop()
+            if squares:
+                squares.pop()
+            duration += durations.pop()
+        elif len(frames) >= max_frames:
+            break
+        
+        rgba = frame.convert('RGBA')
+        frames.append(rgba.resize(frame_size, Image.Resampling.LANCZOS))
+        if crop_size:
+            squares.append(pad_square(rgba, crop_size))
+        durations.append(duration)
+    
+    # Первый кадр на белом фоне - для заглушки и перцептивного хэша
+    first_frame = Image.alpha_composite(Image.new('RGBA', frame_size, (255, 255, 255, 255)), frames[0]).convert('RGB')
+    return Animation(
+        data=encode_animation(frames, durations, loop),
+        size=frame_size,
+        cropped_data=encode_animation(squares, durations, loop) if crop_size else None,
+        cropped_size=(crop_size, crop_size) if crop_size else None,
+        frame_count=len(frames),
+        first_frame=first_frame,
+    )
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ImagesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'images'
+    
+    def ready(self):
+        from .signals import connect_reference_signals
+        connect_reference_signals()
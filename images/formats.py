@@ -0,0 +1,87 @@
+import io
+from PIL import features
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Форматы в порядке предпочтения: от самого компактного к самому совместимому
+FORMAT_PREFERENCE = ['avif', 'webp', 'jpeg']
+
+FORMAT_EXTENSIONS = {
+    'avif': 'avif',
+    'webp': 'webp',
+    'jpeg': 'jpg',
+}
+
+FORMAT_MIME_TYPES = {
+    'avif': 'image/avif',
+    'webp': 'image/webp',
+    'jpeg': 'image/jpeg',
+}
+
+PIL_FORMATS = {
+    'avif': 'AVIF',
+    'webp': 'WEBP',
+    'jpeg': 'JPEG',
+}
+
+# Параметры кодировщиков по умолчанию. JPEG - базовый (не progressive) как
+# максимально совместимый запасной вариант
+ENCODE_OPTIONS = {
+    'avif': {'quality': 60, 'speed': 6},
+    'webp': {'quality': 85, 'method': 4},
+    'jpeg': {'quality': 85, 'optimize': True, 'progressive': False},
+}
+
+
+def encode_image(img, fmt, options=None):
+    """Кодирование изображения в байты заданного формата (по умолчанию с ENCODE_OPTIONS)"""
+    buffer = io.BytesIO()
+    img.save(buffer, PIL_FORMATS[fmt], **(ENCODE_OPTIONS[fmt] if options is None else options))
+    return buffer.getvalue()
+
+
+def available_formats(formats):
+    """Фильтрация списка форматов по поддержке в текущей сборке Pillow"""
+    result = []
+    for fmt in formats:
+        if fmt not in PIL_FORMATS:
+            logger.warning(f"Unknown image format in settings: {fmt}")
+            continue
+        if fmt in ('avif', 'webp') and not features.check(fmt):
+            logger.warning(f"Pillow is built without {fmt} support, skipping")
+            continue
+        result.append(fmt)
+    return result
+
+
+def negotiate_format(request, available, default='webp'):
+    """
+    Выбор самого компактного формата, который поддерживает клиент.
+
+    Явный параметр ?image_format= имеет приоритет (?format= занят DRF). Иначе смотрим заголовок Accept:
+    браузеры перечисляют в нем image/avif и image/webp при запросе картинок.
+    JSON-запросы к API форматы изображений не перечисляют, для них
+    возвращается default.
+    """
+    if not available:
+        return None
+    
+    if request is not None:
+        query_params = getattr(request, 'query_params', request.GET)
+        requested = query_params.get('image_format')
+        if requested in available:
+            return requested
+        
+        accept = request.META.get('HTTP_ACCEPT', '')
+        for fmt in FORMAT_PREFERENCE:
+            if fmt in available and FORMAT_MIME_TYPES[fmt] in accept:
+                return fmt
+    
+    if default in available:
+        return default
+    # Самый совместимый из имеющихся
+    for fmt in reversed(FORMAT_PREFERENCE):
+        if fmt in available:
+            return fmt
+    return available[0]
@@ -0,0 +1,87 @@
+import time
+from PIL import Image
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from images.models import ImageUpload
+from images.storage import get_image_storage
+
+
+METADATA_FIELDS = [
+    'original_width', 'original_height', 'original_size', 'original_mime_type',
+    'processed_width', 'processed_height', 'processed_size',
+    'cropped_width', 'cropped_height', 'cropped_size',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполнение размеров, объема и MIME файлов для изображений, загруженных '
+        'до появления этих полей. Читаются только заголовки файлов'
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Размер пачки записей')
+        parser.add_argument('--all', action='store_true', help='Перечитать метаданные всех изображений')
+    
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        queryset = ImageUpload.objects.order_by('id')
+        if not options['all']:
+            queryset = queryset.filter(
+                Q(original_width__isnull=True)
+                | Q(processed_width__isnull=True, processed_image__isnull=False) & ~Q(processed_image='')
+                | Q(cropped_width__isnull=True, cropped_image__isnull=False) & ~Q(cropped_image='')
+            )
+        
+        started = time.monotonic()
+        updated = 0
+        missing = 0
+        batch = []
+        
+        fields = ['id', 'original_image', 'processed_image', 'cropped_image', *METADATA_FIELDS]
+        for image_upload in queryset.only(*fields).iterator(chunk_size=batch_size):
+            for prefix in ('original', 'processed', 'cropped'):
+                name = getattr(image_upload, f'{prefix}_image').name
+                if not name:
+                    continue
+                metadata = self.read_metadata(name)
+                if metadata is None:
+                    missing += 1
+                    self.stdout.write(self.style.WARNING(f'  изображение {image_upload.id}: нет файла {name}'))
+                    continue
+                width, height, size, mime_type = metadata
+                setattr(image_upload, f'{prefix}_width', width)
+                setattr(image_upload, f'{prefix}_height', height)
+                setattr(image_upload, f'{prefix}_size', size)
+                if prefix == 'original':
+                    image_upload.original_mime_type = mime_type
+            
+            batch.append(image_upload)
+            if len(batch) >= batch_size:
+                ImageUpload.objects.bulk_update(batch, METADATA_FIELDS)
+                updated += len(batch)
+                batch = []
+        
+        if batch:
+            ImageUpload.objects.bulk_update(batch, METADATA_FIELDS)
+            updated += len(batch)
+        
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Обновлено {updated} изображений за {elapsed:.1f} с, отсутствующих файлов {missing}'
+        ))
+    
+    def read_metadata(self, name):
+        """(ширина, высота, байты, MIME) по заголовку файла или None, если файла нет"""
+        storage = get_image_storage()
+        try:
+            if not storage.exists(name):
+                return None
+            size = storage.size(name)
+            with storage.open(name, 'rb') as file, Image.open(file) as img:
+                return img.width, img.height, size, Image.MIME.get(img.format, '')
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            self.stdout.write(self.style.WARNING(f'  {name}: {str(e)}'))
+            return None
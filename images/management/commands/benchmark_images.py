@@ -0,0 +1,333 @@
+import io
+import json
+import math
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+import PIL
+from PIL import Image
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from images.formats import ENCODE_OPTIONS
+from images.models import ImageUpload
+
+
+CORPUS_FORMATS = {
+    'jpeg': ('JPEG', 'jpg', {'quality': 90}),
+    'png': ('PNG', 'png', {}),
+    'webp': ('WEBP', 'webp', {'quality': 90}),
+    'gif': ('GIF', 'gif', {}),
+    'tiff': ('TIFF', 'tiff', {'compression': 'tiff_lzw'}),
+}
+DEFAULT_SIZES = [0.3, 2, 12, 24, 50]
+PATHS = ['compress', 'crop', 'upload']
+# peak_rss_mb растет по ходу запуска, поэтому сравнивается прирост за замер
+METRICS = ['wall_s', 'cpu_s', 'rss_delta_mb', 'output_bytes']
+
+
+class RssSampler:
+    """
+    Пиковый RSS процесса за время замера: фоновый поток читает /proc/self/statm.
+    Pillow отпускает GIL при декодировании и кодировании, поэтому поток
+    успевает снимать показания. Без /proc используется ru_maxrss (пик за всю жизнь процесса).
+    """
+    
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.baseline = 0
+        self.peak = 0
+        self.page_size = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+        self.stop_event = threading.Event()
+        self.thread = None
+    
+    def read_rss(self):
+        try:
+            with open('/proc/self/statm') as statm:
+                return int(statm.read().split()[1]) * self.page_size
+        except (OSError, IndexError, ValueError):
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    
+    def sample(self):
+        while not self.stop_event.is_set():
+            self.peak = max(self.peak, self.read_rss())
+            self.stop_event.wait(self.interval)
+    
+    def __enter__(self):
+        self.baseline = self.peak = self.read_rss()
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+        self.thread.start()
+        return self
+    
+    def __exit__(self, *exc):
+        self.stop_event.set()
+        self.thread.join()
+        self.peak = max(self.peak, self.read_rss())
+
+
+class Command(BaseCommand):
+    help = (
+        'Бенчмарк обработки изображений на сгенерированном корпусе (JPEG/PNG/WebP/GIF/TIFF, '
+        'от 0.3 до 50 МП): время, CPU, пиковый RSS и объем результата для путей compress, crop '
+        'и загрузки через API. Результаты пишутся в JSON для сравнения между коммитами. '
+        'Файлы пишутся во временный MEDIA_ROOT, записи создаются в транзакции, которая откатывается '
+        'в конце запуска. Без DEBUG запускается только с --allow-production'
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output', default=os.path.join(tempfile.gettempdir(), 'image_benchmark.json'),
+            help='Файл для результатов (JSON, по умолчанию - во временном каталоге системы)'
+        )
+        parser.add_argument(
+            '--sizes', type=float, nargs='+', default=DEFAULT_SIZES,
+            help='Размеры изображений корпуса в мегапикселях'
+        )
+        parser.add_argument(
+            '--formats', nargs='+', choices=list(CORPUS_FORMATS), default=list(CORPUS_FORMATS),
+            help='Форматы исходных файлов'
+        )
+        parser.add_argument('--paths', nargs='+', choices=PATHS, default=PATHS, help='Замеряемые пути обработки')
+        parser.add_argument('--repeat', type=int, default=3, help='Число повторов каждого замера')
+        parser.add_argument('--corpus-dir', help='Каталог для корпуса (переиспользуется между запусками)')
+        parser.add_argument('--compare', help='JSON предыдущего запуска для сравнения')
+        parser.add_argument(
+            '--allow-production', action='store_true',
+            help='Разрешить запуск при DEBUG=False (нагрузка на рабочую базу и процессор)'
+        )
+    
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat должен быть не меньше 1')
+        if not settings.DEBUG and not options['allow_production']:
+            raise CommandError('DEBUG выключен: похоже на рабочее окружение. Запустите с --allow-production, если это намеренно')
+        
+        corpus_dir = options['corpus_dir'] or tempfile.mkdtemp(prefix='image-bench-corpus-')
+        os.makedirs(corpus_dir, exist_ok=True)
+        corpus = self.build_corpus(corpus_dir, options['formats'], options['sizes'])
+        
+        results = []
+        with tempfile.TemporaryDirectory(prefix='image-bench-media-') as media_root, override_settings(
+            MEDIA_ROOT=media_root,
+            IMAGE_PROCESSING_ASYNC=False,
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+        ), transaction.atomic():
+            try:
+                for case in corpus:
+                    for path in options['paths']:
+                        result = self.run_case(case, path, options['repeat'])
+                        results.append(result)
+                        self.stdout.write(
+                            f"{case['name']:>14} {path:>8}: {result['wall_s']:.3f} с, CPU {result['cpu_s']:.3f} с, "
+                            f"RSS {result['peak_rss_mb']:.0f} МБ (+{result['rss_delta_mb']:.0f}), результат {result['output_bytes'] / 1024:.0f} КБ"
+                        )
+            finally:
+                # Все записи бенчмарка откатываются, в базе ничего не остается
+                transaction.set_rollback(True)
+        
+        report = {'meta': self.get_meta(options), 'results': results}
+        with open(options['output'], 'w') as output:
+            json.dump(report, output, indent=2, ensure_ascii=False)
+        self.stdout.write(self.style.SUCCESS(f"Результаты записаны в {options['output']}"))
+        
+        if options['compare']:
+            self.compare(options['compare'], results)
+    
+    def build_corpus(self, corpus_dir, formats, sizes):
+        """
+        Синтетический корпус: градиенты с шумом сжимаются похоже на фотографии,
+        в отличие от однотонных картинок. Файлы генерируются один раз на размер.
+        """
+        corpus = []
+        for megapixels in sizes:
+            width = int(math.sqrt(megapixels * 1000 * 1000 * 3 / 2))
+            height = int(width * 2 / 3)
+            source = None
+            
+            for fmt in formats:
+                pil_format, ext, save_options = CORPUS_FORMATS[fmt]
+                name = f'{fmt}_{megapixels:g}mp'
+                path = os.path.join(corpus_dir, f'{name}.{ext}')
+                
+                if not os.path.exists(path):
+                    if source is None:
+                        source = self.generate_image(width, height)
+                    self.stdout.write(f'Генерация {path} ({width}x{height})')
+                    image = source.quantize(256) if fmt == 'gif' else source
+                    image.save(path, pil_format, **save_options)
+                
+                corpus.append({
+                    'name': name,
+                    'format': fmt,
+                    'megapixels': megapixels,
+                    'width': width,
+                    'height': height,
+                    'path': path,
+                    'input_bytes': os.path.getsize(path),
+                })
+        
+        return corpus
+    
+    def generate_image(self, width, height):
+        size = (width, height)
+        return Image.merge('RGB', [
+            Image.linear_gradient('L').resize(size),
+            Image.effect_noise(size, 48),
+            Image.radial_gradient('L').resize(size),
+        ])
+    
+    def run_case(self, case, path, repeat):
+        runs = []
+        for attempt in range(repeat):
+            if path == 'upload':
+                runs.append(self.measure_upload(case, attempt))
+            else:
+                runs.append(self.measure_processing(case, compress=path == 'compress', crop=path == 'crop'))
+        
+        return {
+            'case': case['name'],
+            'format': case['format'],
+            'megapixels': case['megapixels'],
+            'width': case['width'],
+            'height': case['height'],
+            'input_bytes': case['input_bytes'],
+            'path': path,
+            'runs': repeat,
+            'wall_s': statistics.median(run['wall_s'] for run in runs),
+            'wall_min_s': min(run['wall_s'] for run in runs),
+            'cpu_s': statistics.median(run['cpu_s'] for run in runs),
+            'peak_rss_mb': max(run['peak_rss_mb'] for run in runs),
+            'rss_delta_mb': max(run['rss_delta_mb'] for run in runs),
+            'output_bytes': runs[-1]['output_bytes'],
+        }
+    
+    def measure(self, func):
+        started_cpu = time.process_time()
+        started = time.perf_counter()
+        with RssSampler() as sampler:
+            func()
+        return {
+            'wall_s': time.perf_counter() - started,
+            'cpu_s': time.process_time() - started_cpu,
+            'peak_rss_mb': sampler.peak / 1024 / 1024,
+            'rss_delta_mb': (sampler.peak - sampler.baseline) / 1024 / 1024,
+        }
+    
+    def measure_processing(self, case, compress, crop):
+        """Только ImageUpload.process_image: запись создается без постановки обработки в очередь"""
+        with open(case['path'], 'rb') as source:
+            image_upload = ImageUpload(
+                original_image=File(source, name=os.path.basename(case['path'])),
+                is_compressed=compress,
+                is_cropped=crop,
+            )
+            image_upload.commit_original()
+        # bulk_create не вызывает save() и не планирует обработку
+        image_upload = ImageUpload.objects.bulk_create([image_upload])[0]
+        
+        run = self.measure(image_upload.process_image)
+        run['output_bytes'] = self.get_output_bytes(image_upload.id)
+        return run
+    
+    def measure_upload(self, case, attempt):
+        """
+        POST /backend/images/ целиком: хэширование, запись оригинала и обработка.
+        Транзакция запуска не фиксируется, и обработка, отложенная до on_commit,
+        не запустится: она выполняется сразу после запроса в том же замере
+        """
+        client = APIClient()
+        client.force_authenticate(user=get_user_model()(username='benchmark'))
+        
+        # Уникальное имя и содержимое, чтобы не сработала дедупликация по хэшу
+        with open(case['path'], 'rb') as source:
+            upload = io.BytesIO(source.read() + f'bench-{time.time_ns()}-{attempt}'.encode())
+        upload.name = os.path.basename(case['path'])
+        
+        response = None
+        
+        def post():
+            nonlocal response
+            response = client.post(reverse('image-list'), {'original_image': upload, 'crop': 'true'}, format='multipart')
+            if response.status_code in (200, 202):
+                ImageUpload.objects.get(id=response.data['id']).process_image()
+        
+        try:
+            run = self.measure(post)
+        finally:
+            upload.close()
+        
+        if response.status_code not in (200, 202):
+            raise CommandError(f"Загрузка {case['name']} вернула {response.status_code}: {response.data}")
+        
+        run['output_bytes'] = self.get_output_bytes(response.data['id'])
+        return run
+    
+    def get_output_bytes(self, image_id):
+        """Суммарный объем производных: обработанное, обрезанное и все копии"""
+        image_upload = ImageUpload.objects.get(id=image_id)
+        total = sum(image_upload.variants.values_list('size', flat=True))
+        cropped_name = image_upload.cropped_image.name if image_upload.cropped_image else None
+        if image_upload.processed_image:
+            total += image_upload.processed_image.size
+        # WebP-версия квадрата уже учтена среди копий
+        if cropped_name and not image_upload.variants.filter(file=cropped_name).exists():
+            total += image_upload.cropped_image.size
+        return total
+    
+    def get_meta(self, options):
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, cwd=settings.BASE_DIR, timeout=5
+            ).stdout.strip() or None
+        except (OSError, subprocess.SubprocessError):
+            commit = None
+        
+        return {
+            'commit': commit,
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'pillow': PIL.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'repeat': options['repeat'],
+            'settings': {
+                'IMAGE_VARIANT_WIDTHS': getattr(settings, 'IMAGE_VARIANT_WIDTHS', None),
+                'IMAGE_VARIANT_FORMATS': getattr(settings, 'IMAGE_VARIANT_FORMATS', None),
+                'CROP_SIZE': getattr(settings, 'CROP_SIZE', None),
+                'ENCODE_OPTIONS': ENCODE_OPTIONS,
+            },
+        }
+    
+    def compare(self, baseline_path, results):
+        """Изменение метрик относительно предыдущего запуска по совпадающим замерам"""
+        with open(baseline_path) as baseline_file:
+            baseline = json.load(baseline_file)
+        
+        previous = {(item['case'], item['path']): item for item in baseline.get('results', [])}
+        self.stdout.write(f"Сравнение с {baseline_path} (коммит {baseline.get('meta', {}).get('commit')})")
+        
+        for result in results:
+            before = previous.get((result['case'], result['path']))
+            if not before:
+                continue
+            deltas = []
+            for metric in METRICS:
+                if before.get(metric):
+                    change = (result[metric] - before[metric]) / before[metric] * 100
+                    deltas.append(f'{metric} {change:+.1f}%')
+            line = f"{result['case']:>14} {result['path']:>8}: {', '.join(deltas)}"
+            # Замедление больше чем на 10% подсвечивается
+            if before.get('wall_s') and result['wall_s'] > before['wall_s'] * 1.1:
+                self.stdout.write(self.style.WARNING(line))
+            else:
+                self.stdout.write(line)
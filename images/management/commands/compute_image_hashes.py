@@ -0,0 +1,49 @@
+import time
+from django.core.management.base import BaseCommand
+from images.models import ImageUpload
+
+
+HASH_FIELDS = ['dhash', 'dhash_0', 'dhash_1', 'dhash_2', 'dhash_3']
+
+
+class Command(BaseCommand):
+    help = 'Вычисление перцептивного хэша (dHash) для изображений, загруженных до появления поиска похожих'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Размер пачки записей')
+        parser.add_argument('--all', action='store_true', help='Пересчитать хэш и для изображений, где он уже есть')
+    
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        queryset = ImageUpload.objects.exclude(original_image='').order_by('id')
+        if not options['all']:
+            queryset = queryset.filter(dhash__isnull=True)
+        
+        started = time.monotonic()
+        updated = 0
+        failed = 0
+        batch = []
+        
+        for image_upload in queryset.only('id', 'original_image').iterator(chunk_size=batch_size):
+            try:
+                with image_upload.original_image.open('rb') as file:
+                    image_upload.set_dhash(ImageUpload.compute_file_dhash(file))
+            except Exception as e:
+                failed += 1
+                self.stdout.write(self.style.WARNING(f'  изображение {image_upload.id}: {str(e)}'))
+                continue
+            
+            batch.append(image_upload)
+            if len(batch) >= batch_size:
+                ImageUpload.objects.bulk_update(batch, HASH_FIELDS)
+                updated += len(batch)
+                batch = []
+        
+        if batch:
+            ImageUpload.objects.bulk_update(batch, HASH_FIELDS)
+            updated += len(batch)
+        
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Хэши вычислены для {updated} изображений за {elapsed:.1f} с, ошибок {failed}'
+        ))
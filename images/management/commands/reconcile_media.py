@@ -0,0 +1,141 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from images.models import ImageUpload, ImageVariant, file_key
+from images.references import find_referenced_names
+from images.storage import get_image_storage, iter_image_files
+
+
+MEDIA_DIRS = ['images/original', 'images/processed', 'images/cropped']
+FILE_FIELDS = ['original_image', 'processed_image', 'cropped_image']
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверка файлов в хранилище изображений (images/) с таблицами изображений: поиск файлов-сирот '
+        '(нет ссылок в базе) и записей, ссылающихся на отсутствующие файлы'
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--delete', action='store_true', help='Удалять найденные файлы-сироты')
+        parser.add_argument('--dry-run', action='store_true', help='Только отчет, ничего не удалять (по умолчанию)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Размер пачки файлов/записей')
+        parser.add_argument(
+            '--min-age', type=int, default=3600,
+            help='Не трогать файлы моложе N секунд (загрузки и обработка в процессе)'
+        )
+        parser.add_argument('--verbose-list', type=int, default=20, help='Сколько путей выводить в отчете')
+    
+    def handle(self, *args, **options):
+        self.delete = options['delete'] and not options['dry_run']
+        self.batch_size = options['batch_size']
+        self.min_mtime = time.time() - options['min_age']
+        self.list_limit = options['verbose_list']
+        self.storage = get_image_storage()
+        
+        mode = 'удаление' if self.delete else 'dry-run'
+        self.stdout.write(f'Сверка медиафайлов ({mode}), хранилище {self.storage.__class__.__name__}')
+        
+        self.reconcile_files()
+        self.find_dangling_rows()
+    
+    def iter_files(self):
+        """Обход каталогов изображений без построения полного списка: (имя, размер, mtime)"""
+        for media_dir in MEDIA_DIRS:
+            yield from iter_image_files(media_dir)
+    
+    def reconcile_files(self):
+        started = time.monotonic()
+        scanned = 0
+        orphans = 0
+        orphan_bytes = 0
+        skipped_recent = 0
+        batch = []
+        
+        def flush():
+            nonlocal orphans, orphan_bytes
+            for name, size in self.find_orphans(batch):
+                orphans += 1
+                orphan_bytes += size
+                if orphans <= self.list_limit:
+                    self.stdout.write(f'  сирота: {name} ({size} байт)')
+                if self.delete:
+                    self.storage.delete(name)
+            batch.clear()
+        
+        for name, size, mtime in self.iter_files():
+            scanned += 1
+            if mtime > self.min_mtime:
+                skipped_recent += 1
+                continue
+            batch.append((name, size))
+            if len(batch) >= self.batch_size:
+                flush()
+        flush()
+        
+        elapsed = time.monotonic() - started
+        rate = scanned / elapsed if elapsed else scanned
+        action = 'удалено' if self.delete else 'найдено'
+        self.stdout.write(self.style.SUCCESS(
+            f'Файлы: просмотрено {scanned} за {elapsed:.1f} с ({rate:.0f} файлов/с), '
+            f'пропущено свежих {skipped_recent}, сирот {action} {orphans} '
+            f'({orphan_bytes / 1024 / 1024:.1f} МБ)'
+        ))
+    
+    def find_orphans(self, batch):
+        """
+        Файлы пачки, на которые нет ссылок в базе: ни в изображениях и копиях,
+        ни в URL-полях каталога (ImageReference - файлы, замененные повторной
+        обработкой, но еще используемые). Кандидаты выбираются по индексированным
+        ключам, затем сверяются точные имена.
+        """
+        keys = {file_key(name) for name, _ in batch}
+        referenced = set()
+        
+        rows = ImageUpload.objects.filter(
+            Q(original_key__in=keys) | Q(processed_key__in=keys) | Q(cropped_key__in=keys)
+        ).values_list(*FILE_FIELDS)
+        for row in rows:
+            referenced.update(name for name in row if name)
+        
+        referenced.update(
+            ImageVariant.objects.filter(key__in=keys).values_list('file', flat=True)
+        )
+        referenced.update(find_referenced_names([name for name, _ in batch if name not in referenced]))
+        
+        return [(name, size) for name, size in batch if name not in referenced]
+    
+    def find_dangling_rows(self):
+        started = time.monotonic()
+        checked = 0
+        dangling = 0
+        
+        images = ImageUpload.objects.order_by('id').values_list('id', *FILE_FIELDS)
+        for image_id, *names in images.iterator(chunk_size=self.batch_size):
+            checked += 1
+            missing = [name for name in names if name and not self.file_exists(name)]
+            if missing:
+                dangling += 1
+                if dangling <= self.list_limit:
+                    self.stdout.write(self.style.WARNING(f'  изображение {image_id}: нет файлов {missing}'))
+        
+        dangling_variants = 0
+        variants = ImageVariant.objects.order_by('id').values_list('id', 'image_id', 'file')
+        for variant_id, image_id, name in variants.iterator(chunk_size=self.batch_size):
+            checked += 1
+            if not self.file_exists(name):
+                dangling_variants += 1
+                if dangling_variants <= self.list_limit:
+                    self.stdout.write(self.style.WARNING(
+                        f'  вариант {variant_id} изображения {image_id}: нет файла {name}'
+                    ))
+        
+        elapsed = time.monotonic() - started
+        rate = checked / elapsed if elapsed else checked
+        self.stdout.write(self.style.SUCCESS(
+            f'Записи: проверено {checked} за {elapsed:.1f} с ({rate:.0f} записей/с), '
+            f'изображений с отсутствующими файлами {dangling}, вариантов {dangling_variants}'
+        ))
+    
+    def file_exists(self, name):
+        return self.storage.exists(name)
@@ -0,0 +1,138 @@
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from images.models import ImageUpload
+from images.reprocessing import init_worker, reprocess_image
+
+
+class Command(BaseCommand):
+    help = (
+        'Повторная обработка библиотеки изображений (после смены качества, размеров или форматов) '
+        'в пуле процессов. Прогресс сохраняется в файл контрольной точки по последнему '
+        'обработанному id, прерванный запуск продолжается с него. Записи выбираются пачками '
+        'по ключу (id > последнего обработанного) вместо .iterator(): серверный курсор '
+        'не держится открытым, и та же граница служит контрольной точкой'
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help='Число процессов (по умолчанию - число ядер)'
+        )
+        parser.add_argument('--batch-size', type=int, default=200, help='Размер пачки id между контрольными точками')
+        parser.add_argument(
+            '--checkpoint', default=os.path.join(tempfile.gettempdir(), 'reprocess_images.checkpoint.json'),
+            help='Файл контрольной точки (по умолчанию - во временном каталоге системы)'
+        )
+        parser.add_argument('--restart', action='store_true', help='Начать заново, игнорируя контрольную точку')
+        parser.add_argument('--only-failed', action='store_true', help='Только изображения с ошибкой обработки')
+        parser.add_argument('--verbose-list', type=int, default=20, help='Сколько ошибок выводить')
+    
+    def handle(self, *args, **options):
+        if options['workers'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--workers и --batch-size должны быть положительными')
+        
+        self.checkpoint_path = options['checkpoint']
+        self.workers = options['workers']
+        self.list_limit = options['verbose_list']
+        state = self.load_checkpoint() if not options['restart'] else None
+        state = state or {'last_id': 0, 'processed': 0, 'failed': 0}
+        if state['last_id']:
+            self.stdout.write(f"Продолжение с id > {state['last_id']} (уже обработано {state['processed']})")
+        
+        # Изображения в очереди обрабатывает Celery, их не трогаем
+        statuses = [ImageUpload.STATUS_FAILED]
+        if not options['only_failed']:
+            statuses.append(ImageUpload.STATUS_DONE)
+        queryset = ImageUpload.objects.filter(status__in=statuses).order_by('id')
+        
+        total = queryset.filter(id__gt=state['last_id']).count()
+        self.stdout.write(f"К обработке {total} изображений, процессов {options['workers']}")
+        if not total:
+            return
+        
+        self.started = time.monotonic()
+        self.total = total
+        self.done = 0
+        self.errors = 0
+        
+        # spawn: у каждого процесса свое подключение к базе и своя настройка Django
+        executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_worker,
+        )
+        try:
+            # Пачки выбираются по ключу (id > последнего): курсор не держится открытым,
+            # пока процессы пишут в базу
+            while True:
+                batch = list(
+                    queryset.filter(id__gt=state['last_id']).values_list('id', flat=True)[:options['batch_size']]
+                )
+                if not batch:
+                    break
+                self.run_batch(executor, batch, state)
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING(
+                f"Прервано, продолжить можно с id > {state['last_id']} (файл {self.checkpoint_path})"
+            ))
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        else:
+            executor.shutdown()
+        finally:
+            connections.close_all()
+        
+        elapsed = time.monotonic() - self.started
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: обработано {self.done} за {timedelta(seconds=round(elapsed))} '
+            f'({self.done / elapsed:.1f} изобр/с), ошибок {self.errors}'
+        ))
+        # Полный проход завершен - следующий запуск начнется сначала
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+    
+    def run_batch(self, executor, batch, state):
+        """Обработка пачки в пуле; контрольная точка пишется, когда завершена вся пачка"""
+        chunksize = max(1, len(batch) // (self.workers * 4))
+        for image_id, error, _ in executor.map(reprocess_image, batch, chunksize=chunksize):
+            self.done += 1
+            if error:
+                self.errors += 1
+                state['failed'] += 1
+                if self.errors <= self.list_limit:
+                    self.stdout.write(self.style.WARNING(f'  изображение {image_id}: {error}'))
+        
+        state['last_id'] = batch[-1]
+        state['processed'] += len(batch)
+        self.save_checkpoint(state)
+        
+        elapsed = time.monotonic() - self.started
+        rate = self.done / elapsed if elapsed else 0
+        eta = timedelta(seconds=round((self.total - self.done) / rate)) if rate else '?'
+        self.stdout.write(
+            f'{self.done}/{self.total} ({self.done * 100 // self.total}%), '
+            f'{rate:.1f} изобр/с, осталось ~{eta}, ошибок {self.errors}'
+        )
+    
+    def load_checkpoint(self):
+        try:
+            with open(self.checkpoint_path) as checkpoint:
+                return json.load(checkpoint)
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            raise CommandError(f'Поврежден файл контрольной точки {self.checkpoint_path}, запустите с --restart')
+    
+    def save_checkpoint(self, state):
+        """Атомарная запись: при прерывании во время записи остается предыдущая точка"""
+        tmp_path = f'{self.checkpoint_path}.tmp'
+        with open(tmp_path, 'w') as checkpoint:
+            json.dump(state, checkpoint)
+        os.replace(tmp_path, self.checkpoint_path)
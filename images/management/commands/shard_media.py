@@ -0,0 +1,122 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from images.models import ImageUpload, ImageVariant, shard_name
+from images.references import find_referenced_names, rewrite_image_urls
+from images.storage import copy_image_file, get_image_storage
+
+
+FILE_FIELDS = ['original_image', 'processed_image', 'cropped_image']
+
+
+def get_sharded_name(name):
+    """Имя файла в хэшированном подкаталоге того же раздела (images/original и т.д.)"""
+    parts = name.split('/')
+    if len(parts) < 3:
+        return name
+    return shard_name('/'.join(parts[:2]), parts[-1])
+
+
+class Command(BaseCommand):
+    help = (
+        'Перенос файлов изображений из плоских каталогов (images/original, images/processed, '
+        'images/cropped) в двухуровневые хэшированные подкаталоги с обновлением имен в базе '
+        'и URL в полях каталога (IMAGE_REFERENCE_FIELDS; индекс ссылок должен быть актуален - '
+        'sync_image_references). Повторный запуск продолжает прерванный перенос'
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Размер пачки записей')
+        parser.add_argument('--dry-run', action='store_true', help='Только подсчитать файлы к переносу')
+        parser.add_argument('--verbose-list', type=int, default=20, help='Сколько предупреждений выводить')
+    
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть положительным')
+        
+        self.dry_run = options['dry_run']
+        self.list_limit = options['verbose_list']
+        self.storage = get_image_storage()
+        self.moved = 0
+        self.missing = 0
+        self.conflicts = 0
+        started = time.monotonic()
+        
+        mode = 'dry-run' if self.dry_run else 'перенос'
+        self.stdout.write(f'Шардирование медиафайлов ({mode}), хранилище {self.storage.__class__.__name__}')
+        
+        self.shard_model(ImageUpload, FILE_FIELDS, options['batch_size'])
+        self.shard_model(ImageVariant, ['file'], options['batch_size'])
+        
+        elapsed = time.monotonic() - started
+        action = 'к переносу' if self.dry_run else 'перенесено'
+        self.stdout.write(self.style.SUCCESS(
+            f'Файлов {action} {self.moved} за {elapsed:.1f} с, отсутствующих {self.missing}, '
+            f'измененных во время переноса {self.conflicts}'
+        ))
+    
+    def shard_model(self, model, fields, batch_size):
+        # Пачки по ключу (id > последнего): курсор не держится открытым во время копирования
+        last_id = 0
+        while True:
+            rows = list(
+                model.objects.filter(id__gt=last_id).order_by('id').values_list('id', *fields)[:batch_size]
+            )
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            
+            moves = []
+            for row_id, *names in rows:
+                for field, name in zip(fields, names):
+                    if not name:
+                        continue
+                    target = get_sharded_name(name)
+                    if target != name:
+                        moves.append((row_id, field, name, target))
+            
+            if self.dry_run:
+                self.moved += len(moves)
+                continue
+            self.move_files(model, moves)
+    
+    def move_files(self, model, moves):
+        """
+        Копия под новым именем -> обновление записи и URL в полях каталога
+        в одной транзакции -> удаление старого файла.
+        Запись обновляется, только если в ней все еще старое имя: параллельная
+        обработка могла уже записать новые файлы. Такую копию не удаляем (имя
+        по хэшу содержимого может совпасть с новым файлом) - ее найдет reconcile_media.
+        """
+        copied = []
+        for row_id, field, name, target in moves:
+            try:
+                copy_image_file(name, target)
+            except FileNotFoundError:
+                self.warn(f'  {model.__name__} {row_id}: нет файла {name}')
+                self.missing += 1
+                continue
+            copied.append((row_id, field, name, target))
+        
+        renames = {}
+        with transaction.atomic():
+            for row_id, field, name, target in copied:
+                updated = model.objects.filter(id=row_id, **{field: name}).update(**{field: target})
+                if updated:
+                    self.moved += 1
+                    renames[name] = target
+                else:
+                    self.conflicts += 1
+            rewrite_image_urls(renames)
+            # URL, которые не удалось заменить, держат старый файл до reconcile_media
+            kept = find_referenced_names(renames)
+        
+        # WebP-копия cropped_image - тот же файл, что и у варианта: старое имя
+        # удаляется, когда на него не осталось ссылок
+        for name in renames:
+            if name not in kept and not ImageUpload.objects.filter_by_file_name(name).exists():
+                self.storage.delete(name)
+    
+    def warn(self, message):
+        if self.missing < self.list_limit:
+            self.stdout.write(self.style.WARNING(message))
\ No newline at end of file
@@ -0,0 +1,44 @@
+import time
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from images.models import ImageReference
+from images.references import get_reference_fields, sync_image_references
+
+
+class Command(BaseCommand):
+    help = (
+        'Построение индекса ссылок на изображения (ImageReference) по URL-полям моделей '
+        'из IMAGE_REFERENCE_FIELDS для существующих записей. Повторный запуск '
+        'сопоставляет заново изменившиеся и ненайденные ранее URL'
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Размер пачки записей')
+    
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size должен быть положительным')
+        
+        started = time.monotonic()
+        for label in get_reference_fields():
+            model = apps.get_model(label)
+            synced = 0
+            last_id = 0
+            # Пачки по ключу: курсор не держится открытым во время записи ссылок
+            while True:
+                batch = list(model.objects.filter(pk__gt=last_id).order_by('pk')[:batch_size])
+                if not batch:
+                    break
+                last_id = batch[-1].pk
+                for instance in batch:
+                    sync_image_references(instance)
+                synced += len(batch)
+            self.stdout.write(f'{label}: записей {synced}')
+        
+        linked = ImageReference.objects.filter(image__isnull=False).count()
+        unresolved = ImageReference.objects.filter(image__isnull=True).count()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Ссылок на изображения {linked}, не найдено в хранилище {unresolved} ({elapsed:.1f} с)'
+        ))
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:32
+
+from django.db import migrations, models
+
+
+def mark_existing_done(apps, schema_editor):
+    # Существующие записи обработаны синхронно при загрузке
+    ImageUpload = apps.get_model('images', 'ImageUpload')
+    ImageUpload.objects.all().update(status='done')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0002_alter_imageupload_cropped_image_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imageupload',
+            name='processing_error',
+            field=models.TextField(blank=True, default='', verbose_name='Ошибка обработки'),
+        ),
+        migrations.AddField(
+            model_name='imageupload',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Ожидает обработки'), ('processing', 'Обрабатывается'), ('done', 'Обработано'), ('failed', 'Ошибка обработки')], db_index=True, default='pending', max_length=20, verbose_name='Статус обработки'),
+        ),
+        migrations.RunPython(mark_existing_done, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:33
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0003_imageupload_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageVariant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file', models.ImageField(max_length=255, upload_to='', verbose_name='Файл')),
+                ('width', models.PositiveIntegerField(verbose_name='Ширина')),
+                ('height', models.PositiveIntegerField(verbose_name='Высота')),
+                ('size', models.PositiveIntegerField(verbose_name='Размер (байт)')),
+                ('image', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='variants', to='images.imageupload', verbose_name='Изображение')),
+            ],
+            options={
+                'verbose_name': 'Вариант изображения',
+                'verbose_name_plural': 'Варианты изображений',
+                'ordering': ['width'],
+            },
+        ),
+    ]
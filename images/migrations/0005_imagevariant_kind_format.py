@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0004_imagevariant'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imagevariant',
+            name='format',
+            field=models.CharField(choices=[('avif', 'AVIF'), ('webp', 'WebP'), ('jpeg', 'JPEG')], default='webp', max_length=10, verbose_name='Формат'),
+        ),
+        migrations.AddField(
+            model_name='imagevariant',
+            name='kind',
+            field=models.CharField(choices=[('responsive', 'Адаптивная копия'), ('cropped', 'Квадратная копия')], default='responsive', max_length=20, verbose_name='Тип копии'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:35
+
+import hashlib
+from django.db import migrations, models
+
+
+def backfill_content_hash(apps, schema_editor):
+    # Для уже существующих дубликатов хеш получает только первая запись
+    ImageUpload = apps.get_model('images', 'ImageUpload')
+    seen = set()
+    for image in ImageUpload.objects.exclude(original_image='').order_by('id').iterator():
+        try:
+            sha256 = hashlib.sha256()
+            with image.original_image.open('rb') as f:
+                for chunk in f.chunks():
+                    sha256.update(chunk)
+        except (FileNotFoundError, ValueError):
+            continue
+        content_hash = sha256.hexdigest()
+        if content_hash in seen:
+            continue
+        seen.add(content_hash)
+        ImageUpload.objects.filter(id=image.id).update(content_hash=content_hash)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0005_imagevariant_kind_format'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imageupload',
+            name='content_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, unique=True, verbose_name='SHA-256 содержимого'),
+        ),
+        migrations.RunPython(backfill_content_hash, migrations.RunPython.noop),
+    ]
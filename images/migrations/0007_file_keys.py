@@ -0,0 +1,69 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:35
+
+import os
+from urllib.parse import urlparse, unquote
+from django.db import migrations, models
+
+
+def file_key(value):
+    """Ключ файла на момент миграции: имя без расширения в нижнем регистре"""
+    if not value:
+        return ''
+    path = unquote(urlparse(str(value)).path)
+    return os.path.splitext(os.path.basename(path.rstrip('/')))[0].lower()
+
+
+def backfill_file_keys(apps, schema_editor):
+    ImageUpload = apps.get_model('images', 'ImageUpload')
+    ImageVariant = apps.get_model('images', 'ImageVariant')
+    
+    batch = []
+    for image in ImageUpload.objects.order_by('id').iterator(chunk_size=1000):
+        image.original_key = file_key(image.original_image.name)
+        image.processed_key = file_key(image.processed_image.name)
+        image.cropped_key = file_key(image.cropped_image.name)
+        batch.append(image)
+        if len(batch) >= 1000:
+            ImageUpload.objects.bulk_update(batch, ['original_key', 'processed_key', 'cropped_key'])
+            batch = []
+    ImageUpload.objects.bulk_update(batch, ['original_key', 'processed_key', 'cropped_key'])
+    
+    batch = []
+    for variant in ImageVariant.objects.order_by('id').iterator(chunk_size=1000):
+        variant.key = file_key(variant.file.name)
+        batch.append(variant)
+        if len(batch) >= 1000:
+            ImageVariant.objects.bulk_update(batch, ['key'])
+            batch = []
+    ImageVariant.objects.bulk_update(batch, ['key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0006_imageupload_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imageupload',
+            name='cropped_key',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='imageupload',
+            name='original_key',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='imageupload',
+            name='processed_key',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='imagevariant',
+            name='key',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(backfill_file_keys, migrations.RunPython.noop),
+    ]
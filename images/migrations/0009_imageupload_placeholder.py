@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0008_filedeletion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imageupload',
+            name='placeholder',
+            field=models.TextField(blank=True, default='', verbose_name='Заглушка (LQIP)'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0009_imageupload_placeholder'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imageupload',
+            name='dhash',
+            field=models.BigIntegerField(blank=True, editable=False, null=True, verbose_name='Перцептивный хэш (dHash)'),
+        ),
+        migrations.AddField(
+            model_name='imageupload',
+            name='dhash_0',
+            field=models.PositiveIntegerField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='imageupload',
+            name='dhash_1',
+            field=models.PositiveIntegerField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='imageupload',
+            name='dhash_2',
+            field=models.PositiveIntegerField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='imageupload',
+            name='dhash_3',
+            field=models.PositiveIntegerField(blank=True, db_index=True, editable=False, null=True),
+        ),
+    ]
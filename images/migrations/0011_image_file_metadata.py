@@ -0,0 +1,68 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0010_imageupload_dhash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imageupload',
+            name='cropped_height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='imageupload',
+            name='cropped_size',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='imageupload',
+            name='cropped_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='imageupload',
+            name='original_height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Высота оригинала'),
+        ),
+        migrations.AddField(
+            model_name='imageupload',
+            name='original_mime_type',
+            field=models.CharField(blank=True, default='', editable=False, max_length=50, verbose_name='MIME оригинала'),
+        ),
+        migrations.AddField(
+            model_name='imageupload',
+            name='original_size',
+            field=models.PositiveBigIntegerField(blank=True, editable=False, null=True, verbose_name='Размер оригинала (байт)'),
+        ),
+        migrations.AddField(
+            model_name='imageupload',
+            name='original_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Ширина оригинала'),
+        ),
+        migrations.AddField(
+            model_name='imageupload',
+            name='processed_height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='imageupload',
+            name='processed_size',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='imageupload',
+            name='processed_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name='imageupload',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+    ]
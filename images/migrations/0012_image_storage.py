@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:59
+
+import django.core.validators
+from django.db import migrations, models
+import images.models
+import images.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0011_image_file_metadata'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='imageupload',
+            name='cropped_image',
+            field=models.ImageField(blank=True, null=True, storage=images.storage.get_image_storage, upload_to=images.models.upload_to_cropped, verbose_name='Обрезанное изображение'),
+        ),
+        migrations.AlterField(
+            model_name='imageupload',
+            name='original_image',
+            field=models.ImageField(storage=images.storage.get_image_storage, upload_to=images.models.upload_to_original, validators=[django.core.validators.FileExtensionValidator(allowed_extensions=['jpg', 'jpeg', 'png', 'webp', 'gif', 'bmp', 'tiff'])], verbose_name='Оригинальное изображение'),
+        ),
+        migrations.AlterField(
+            model_name='imageupload',
+            name='processed_image',
+            field=models.ImageField(blank=True, null=True, storage=images.storage.get_image_storage, upload_to=images.models.upload_to_processed, verbose_name='Обработанное изображение'),
+        ),
+        migrations.AlterField(
+            model_name='imagevariant',
+            name='file',
+            field=models.ImageField(max_length=255, storage=images.storage.get_image_storage, upload_to='', verbose_name='Файл'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.7 on 2026-10-18 17:07
+
+from django.db import migrations, models
+import images.profiles
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0013_sharded_media_paths'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imageupload',
+            name='encoder_profile',
+            field=models.CharField(default=images.profiles.get_default_profile_name, max_length=32, verbose_name='Профиль кодирования'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-18 17:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('images', '0014_encoder_profile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageReference',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('field', models.CharField(max_length=64, verbose_name='Поле')),
+                ('position', models.PositiveSmallIntegerField(default=0)),
+                ('url', models.TextField(verbose_name='URL')),
+                ('key', models.CharField(blank=True, db_index=True, default='', editable=False, max_length=255)),
+                ('kind', models.CharField(choices=[('responsive', 'Адаптивная копия'), ('cropped', 'Квадратная копия')], default='responsive', max_length=20, verbose_name='Тип копий')),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+                ('image', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='references', to='images.imageupload', verbose_name='Изображение')),
+            ],
+            options={
+                'verbose_name': 'Использование изображения',
+                'verbose_name_plural': 'Использования изображений',
+                'ordering': ['field', 'position'],
+                'unique_together': {('content_type', 'object_id', 'field', 'position')},
+            },
+        ),
+    ]
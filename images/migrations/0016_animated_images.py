@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-18 17:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0015_image_references'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imageupload',
+            name='frame_count',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Кадров'),
+        ),
+        migrations.AddField(
+            model_name='imageupload',
+            name='is_animated',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Анимация'),
+        ),
+    ]
@@ -1,14 +1,42 @@
-from django.db import models
+from django.contrib.contenttypes.models import ContentType
+from django.db import InterfaceError, OperationalError, models, transaction
+from django.db.models import Q
 from django.core.validators import FileExtensionValidator
 from PIL import Image
+from botocore.exceptions import BotoCoreError, ClientError
 import os
 import uuid
+import hashlib
+from urllib.parse import urlparse, unquote
 from django.conf import settings
 from django.utils.text import slugify
 import logging
+from .animation import is_animated, transcode_animation
+from .processing import build_width_ladder, fit_image, decode_for_size, make_placeholder, FIT_PAD
+from .formats import FORMAT_EXTENSIONS, available_formats
+from .profiles import encode_with_profile, get_default_profile_name, get_encoder_profile, new_search_cache
+from .storage import get_image_storage, save_image_file
+from .similarity import CHUNK_COUNT, compute_dhash, to_signed, to_unsigned, split_hash, hamming_distance, chunk_neighbours
 
 logger = logging.getLogger(__name__)
 
+# Временные сбои хранилища и базы: обработка повторяется, статус failed не ставится.
+# OSError целиком не подходит - им же Pillow сообщает о поврежденном файле
+TRANSIENT_PROCESSING_ERRORS = (
+    ConnectionError, TimeoutError, OperationalError, InterfaceError, BotoCoreError, ClientError,
+)
+
+
+def shard_name(directory, filename):
+    """
+    Имя файла в двухуровневом хэшированном подкаталоге: directory/ab/cd/filename.
+    65536 подкаталогов держат каталоги маленькими при сотнях тысяч файлов.
+    Хэш считается по имени без расширения: форматы одной копии лежат
+    в одном каталоге и отличаются только расширением.
+    """
+    digest = hashlib.md5(os.path.splitext(filename)[0].encode()).hexdigest()
+    return f'{directory}/{digest[:2]}/{digest[2:4]}/{filename}'
+
 
 def upload_to_original(instance, filename):
     """Генерация безопасного пути для оригинального файла"""
@@ -18,7 +46,7 @@ def upload_to_original(instance, filename):
     # Добавляем уникальный идентификатор
     unique_id = uuid.uuid4().hex[:8]
     new_filename = f"{unique_id}_{name_part}.{ext}"
-    return f'images/original/{new_filename}'
+    return shard_name('images/original', new_filename)
 
 
 def upload_to_processed(instance, filename):
@@ -26,7 +54,7 @@ def upload_to_processed(instance, filename):
     ext = 'webp'  # Всегда конвертируем в webp
     unique_id = uuid.uuid4().hex[:8]
     new_filename = f"{unique_id}_processed.{ext}"
-    return f'images/processed/{new_filename}'
+    return shard_name('images/processed', new_filename)
 
 
 def upload_to_cropped(instance, filename):
@@ -34,33 +62,215 @@ def upload_to_cropped(instance, filename):
     ext = 'webp'  # Всегда конвертируем в webp
     unique_id = uuid.uuid4().hex[:8]
     new_filename = f"{unique_id}_cropped.{ext}"
-    return f'images/cropped/{new_filename}'
+    return shard_name('images/cropped', new_filename)
+
+
+def file_key(value):
+    """
+    Нормализованный ключ файла для точного поиска: имя файла без расширения.
+    Принимает имя в хранилище, путь или полный URL (query и домен отбрасываются).
+    """
+    if not value:
+        return ''
+    path = unquote(urlparse(str(value)).path)
+    return os.path.splitext(os.path.basename(path.rstrip('/')))[0].lower()
+
+
+def content_digest(*blobs, salt=''):
+    """
+    Короткий SHA-256 содержимого для имени производного файла: при любом
+    изменении байтов меняется и URL, поэтому файлы можно кэшировать навсегда.
+    Соль (id изображения) не дает двум записям делить один файл.
+    """
+    sha256 = hashlib.sha256(str(salt).encode())
+    for blob in blobs:
+        sha256.update(blob)
+    return sha256.hexdigest()[:16]
+
+
+def schedule_file_purge():
+    """Удаление файлов из очереди FileDeletion после коммита транзакции"""
+    from .tasks import purge_file_deletions
+    
+    if getattr(settings, 'IMAGE_PROCESSING_ASYNC', True):
+        transaction.on_commit(lambda: purge_file_deletions.delay())
+    else:
+        transaction.on_commit(lambda: purge_file_deletions.apply())
+
+
+class ImageUploadQuerySet(models.QuerySet):
+    def find_by_slug(self, slug):
+        """
+        Поиск изображения по URL или имени любого его файла
+        (оригинал, обработанное, обрезанное или адаптивная копия).
+        Один запрос по индексированным ключам.
+        """
+        key = file_key(slug)
+        if not key:
+            return None
+        
+        return self.filter_by_slugs([slug]).first()
+    
+    def filter_by_slugs(self, slugs):
+        """Все изображения, которым принадлежит хотя бы один из URL/имен файлов"""
+        keys = {file_key(slug) for slug in slugs} - {''}
+        
+        return self.filter(
+            Q(original_key__in=keys)
+            | Q(processed_key__in=keys)
+            | Q(cropped_key__in=keys)
+            | Q(id__in=ImageVariant.objects.filter(key__in=keys).values('image_id'))
+        )
+    
+    def filter_by_file_name(self, name):
+        """Изображения, которым принадлежит файл с точно таким именем в хранилище"""
+        key = file_key(name)
+        
+        return self.filter(
+            Q(original_key=key, original_image=name)
+            | Q(processed_key=key, processed_image=name)
+            | Q(cropped_key=key, cropped_image=name)
+            | Q(id__in=ImageVariant.objects.filter(key=key, file=name).values('image_id'))
+        )
+    
+    def similar_to(self, dhash, max_distance):
+        """
+        Изображения с dHash на расстоянии Хэмминга не больше max_distance.
+        Multi-index hashing: хэш разбит на 4 индексированные части по 16 бит,
+        и у близкого хэша хотя бы одна часть отличается не больше чем
+        на max_distance // 4 бит. Кандидаты выбираются по индексам частей
+        (IN по соседним значениям), точное расстояние считается только для них.
+        Возвращает список (расстояние, id) по возрастанию расстояния.
+        """
+        radius = max_distance // CHUNK_COUNT
+        condition = Q()
+        for index, chunk in enumerate(split_hash(dhash)):
+            condition |= Q(**{f'dhash_{index}__in': chunk_neighbours(chunk, radius)})
+        
+        matches = []
+        for image_id, value in self.filter(condition).values_list('id', 'dhash'):
+            distance = hamming_distance(dhash, value)
+            if distance <= max_distance:
+                matches.append((distance, image_id))
+        
+        return sorted(matches)
+    
+    def delete_with_files(self):
+        """
+        Удаление записей одной транзакцией. Файлы не удаляются в запросе:
+        их имена (и файлы кэша рендера) записываются в очередь FileDeletion
+        в той же транзакции и удаляются фоновой задачей, поэтому при падении
+        воркера файлы не остаются сиротами.
+        """
+        from .render import cache_deletion_name
+        
+        with transaction.atomic():
+            images = list(self.select_for_update().values_list(
+                'id', 'original_image', 'processed_image', 'cropped_image'
+            ))
+            image_ids = [row[0] for row in images]
+            names = {name for row in images for name in row[1:] if name}
+            names.update(
+                ImageVariant.objects.filter(image_id__in=image_ids).values_list('file', flat=True)
+            )
+            names.update(cache_deletion_name(image_id) for image_id in image_ids)
+            
+            FileDeletion.objects.bulk_create([FileDeletion(name=name) for name in names])
+            ImageUpload.objects.filter(id__in=image_ids).delete()
+        
+        if names:
+            schedule_file_purge()
+        
+        return image_ids
 
 
 class ImageUpload(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_PROCESSING = 'processing'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Ожидает обработки'),
+        (STATUS_PROCESSING, 'Обрабатывается'),
+        (STATUS_DONE, 'Обработано'),
+        (STATUS_FAILED, 'Ошибка обработки'),
+    ]
+
     original_image = models.ImageField(
         upload_to=upload_to_original,
+        max_length=255,
+        storage=get_image_storage,
         validators=[FileExtensionValidator(allowed_extensions=['jpg', 'jpeg', 'png', 'webp', 'gif', 'bmp', 'tiff'])],  # Добавлены форматы
         verbose_name='Оригинальное изображение'
     )
     processed_image = models.ImageField(
         upload_to=upload_to_processed,
+        max_length=255,
+        storage=get_image_storage,
         blank=True,
         null=True,
         verbose_name='Обработанное изображение'
     )
     cropped_image = models.ImageField(
         upload_to=upload_to_cropped,
+        max_length=255,
+        storage=get_image_storage,
         blank=True,
         null=True,
         verbose_name='Обрезанное изображение'
     )
+    content_hash = models.CharField(
+        max_length=64,
+        unique=True,
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='SHA-256 содержимого'
+    )
+    original_key = models.CharField(max_length=255, blank=True, default='', db_index=True, editable=False)
+    processed_key = models.CharField(max_length=255, blank=True, default='', db_index=True, editable=False)
+    cropped_key = models.CharField(max_length=255, blank=True, default='', db_index=True, editable=False)
+    # Размеры, объем и тип файлов хранятся в базе, чтобы выдача не обращалась к диску
+    original_width = models.PositiveIntegerField(null=True, blank=True, editable=False, verbose_name='Ширина оригинала')
+    original_height = models.PositiveIntegerField(null=True, blank=True, editable=False, verbose_name='Высота оригинала')
+    original_size = models.PositiveBigIntegerField(null=True, blank=True, editable=False, verbose_name='Размер оригинала (байт)')
+    original_mime_type = models.CharField(max_length=50, blank=True, default='', editable=False, verbose_name='MIME оригинала')
+    processed_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    processed_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    processed_size = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    cropped_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    cropped_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    cropped_size = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    placeholder = models.TextField(blank=True, default='', verbose_name='Заглушка (LQIP)')
+    dhash = models.BigIntegerField(null=True, blank=True, editable=False, verbose_name='Перцептивный хэш (dHash)')
+    # Части dHash по 16 бит для поиска похожих изображений без полного перебора
+    dhash_0 = models.PositiveIntegerField(null=True, blank=True, db_index=True, editable=False)
+    dhash_1 = models.PositiveIntegerField(null=True, blank=True, db_index=True, editable=False)
+    dhash_2 = models.PositiveIntegerField(null=True, blank=True, db_index=True, editable=False)
+    dhash_3 = models.PositiveIntegerField(null=True, blank=True, db_index=True, editable=False)
+    is_animated = models.BooleanField(default=False, editable=False, verbose_name='Анимация')
+    frame_count = models.PositiveIntegerField(null=True, blank=True, editable=False, verbose_name='Кадров')
     is_compressed = models.BooleanField(default=True, verbose_name='Сжато')
     is_cropped = models.BooleanField(default=False, verbose_name='Обрезано')
+    encoder_profile = models.CharField(
+        max_length=32,
+        default=get_default_profile_name,
+        verbose_name='Профиль кодирования'
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING,
+        db_index=True,
+        verbose_name='Статус обработки'
+    )
+    processing_error = models.TextField(blank=True, default='', verbose_name='Ошибка обработки')
     
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = ImageUploadQuerySet.as_manager()
+    
     class Meta:
         verbose_name = 'Изображение'
         verbose_name_plural = 'Изображения'
@@ -71,78 +281,465 @@ class ImageUpload(models.Model):
     
     def save(self, *args, **kwargs):
         is_new = self.pk is None
+        
+        self.commit_original()
+        if kwargs.get('update_fields') is not None and 'original_image' in kwargs['update_fields']:
+            kwargs['update_fields'] = set(kwargs['update_fields']) | {
+                'original_key', 'original_width', 'original_height', 'original_size', 'original_mime_type'
+            }
+        
         super().save(*args, **kwargs)
         
         if is_new and self.original_image:
-            try:
-                self.process_image()
-            except Exception as e:
-                logger.error(f"Error processing image {self.id}: {str(e)}")
+            self.schedule_processing()
+    
+    def commit_original(self):
+        """
+        Запись нового файла оригинала в хранилище до INSERT (то же делает
+        FileField.pre_save), чтобы ключ поиска попал в ту же запись.
+        Нужно и для bulk_create, который не вызывает save().
+        """
+        if self.original_image and not self.original_image._committed:
+            self.read_original_metadata(self.original_image.file)
+            self.original_image.save(self.original_image.name, self.original_image.file, save=False)
+        self.original_key = file_key(self.original_image.name)
+    
+    def read_original_metadata(self, file):
+        """Размеры и MIME оригинала по заголовку файла (без декодирования пикселей) и его объем"""
+        file.seek(0)
+        try:
+            with Image.open(file) as img:
+                self.original_width, self.original_height = img.size
+                self.original_mime_type = Image.MIME.get(img.format, '')
+        except Exception as e:
+            logger.warning(f"Could not read image header of {file}: {str(e)}")
+        file.seek(0)
+        self.original_size = file.size
+    
+    def reuse_for_upload(self, compress, crop, encoder_profile=None):
+        """
+        Повторная загрузка того же файла: оригинал и копии переиспользуются.
+        Обработка перезапускается только если запрошено то, чего еще нет
+        (в том числе другой профиль кодирования), или предыдущая обработка
+        завершилась ошибкой.
+        """
+        encoder_profile = encoder_profile or self.encoder_profile
+        needs_processing = (
+            (compress and not self.is_compressed)
+            or (crop and not self.is_cropped)
+            or encoder_profile != self.encoder_profile
+            or self.status == self.STATUS_FAILED
+        )
+        
+        if needs_processing:
+            self.is_compressed = self.is_compressed or compress
+            self.is_cropped = self.is_cropped or crop
+            self.encoder_profile = encoder_profile
+            self.status = self.STATUS_PENDING
+            self.save(update_fields=['is_compressed', 'is_cropped', 'encoder_profile', 'status', 'updated_at'])
+            self.schedule_processing()
+        
+        self.reused = True
+        return self
+    
+    def replace_original(self, file, content_hash, encoder_profile=None):
+        """
+        Замена оригинала другим файлом - как новая загрузка в ту же запись:
+        хэш содержимого заменяется, dHash и размеры считаются заново,
+        обработка перезапускается. URL прежнего оригинала в полях каталога
+        заменяются на новый, сам файл без ссылок и кэш рендера прежнего
+        оригинала ставятся в очередь FileDeletion; производные файлы заменит
+        обработка (retire_superseded_files). Вызывается в транзакции.
+        """
+        from .references import find_referenced_names, rewrite_image_urls
+        from .render import cache_deletion_name
+        
+        old_name = self.original_image.name
+        old_content_hash = self.content_hash or ''
+        self.original_image = file
+        self.content_hash = content_hash
+        self.dhash = self.dhash_0 = self.dhash_1 = self.dhash_2 = self.dhash_3 = None
+        self.original_width = self.original_height = None
+        self.original_mime_type = ''
+        self.encoder_profile = encoder_profile or self.encoder_profile
+        self.status = self.STATUS_PENDING
+        self.processing_error = ''
+        self.save()
+        
+        deleted = [cache_deletion_name(self.id, old_content_hash)]
+        if old_name and old_name != self.original_image.name:
+            rewrite_image_urls({old_name: self.original_image.name})
+            if not find_referenced_names([old_name]):
+                deleted.append(old_name)
+        FileDeletion.objects.bulk_create([FileDeletion(name=name) for name in deleted])
+        schedule_file_purge()
+        
+        self.schedule_processing()
+        self.reused = False
+        return self
+    
+    @staticmethod
+    def compute_content_hash(file):
+        """
+        Потоковый SHA-256 загруженного файла (без чтения целиком в память).
+        StreamingImageUploadHandler считает хэш при приеме - тогда файл не читается.
+        """
+        if getattr(file, 'content_hash', None):
+            return file.content_hash
+        
+        sha256 = hashlib.sha256()
+        file.seek(0)
+        for chunk in file.chunks():
+            sha256.update(chunk)
+        file.seek(0)
+        return sha256.hexdigest()
+    
+    def set_dhash(self, value):
+        """Запись перцептивного хэша и его частей для индекса"""
+        self.dhash = to_signed(value)
+        self.dhash_0, self.dhash_1, self.dhash_2, self.dhash_3 = split_hash(value)
+    
+    def get_file_metadata(self):
+        return {
+            field: getattr(self, field)
+            for prefix in ('original', 'processed', 'cropped')
+            for field in (f'{prefix}_width', f'{prefix}_height', f'{prefix}_size')
+        } | {'original_mime_type': self.original_mime_type}
+    
+    def get_image_metadata(self):
+        """Размеры, объем и MIME файла из get_image_url() по полям модели, без обращения к диску"""
+        if self.processed_image:
+            return {
+                'width': self.processed_width,
+                'height': self.processed_height,
+                'size': self.processed_size,
+                'mime_type': 'image/webp',
+            }
+        return {
+            'width': self.original_width,
+            'height': self.original_height,
+            'size': self.original_size,
+            'mime_type': self.original_mime_type or None,
+        }
+    
+    def get_dhash_fields(self):
+        return {
+            'dhash': self.dhash,
+            'dhash_0': self.dhash_0,
+            'dhash_1': self.dhash_1,
+            'dhash_2': self.dhash_2,
+            'dhash_3': self.dhash_3,
+        }
+    
+    def find_similar(self, max_distance=None):
+        """Похожие изображения (без самого изображения): список (расстояние, id)"""
+        if self.dhash is None:
+            return []
+        if max_distance is None:
+            max_distance = getattr(settings, 'IMAGE_SIMILAR_MAX_DISTANCE', 8)
+        
+        return ImageUpload.objects.exclude(id=self.id).similar_to(to_unsigned(self.dhash), max_distance)
+    
+    @staticmethod
+    def compute_file_dhash(file):
+        """dHash загруженного файла по уменьшенному декодированию (JPEG - через draft)"""
+        file.seek(0)
+        with Image.open(file) as source:
+            img = decode_for_size(
+                source,
+                (64, 64),
+                max_pixels=getattr(settings, 'IMAGE_MAX_PIXELS', None),
+                max_bytes=getattr(settings, 'IMAGE_MAX_DECODE_BYTES', None),
+            )
+            value = compute_dhash(img)
+        file.seek(0)
+        return value
+    
+    def schedule_processing(self):
+        """Постановка обработки в очередь Celery после коммита транзакции"""
+        from .tasks import process_image_task
+        
+        image_id = self.id
+        if getattr(settings, 'IMAGE_PROCESSING_ASYNC', True):
+            transaction.on_commit(lambda: process_image_task.delay(image_id))
+        else:
+            transaction.on_commit(lambda: process_image_task.apply(args=(image_id,)))
+    
+    @staticmethod
+    def schedule_batch_processing(image_ids):
+        """Параллельная обработка набора изображений группой задач Celery"""
+        from celery import group
+        from .tasks import process_image_task
+        
+        image_ids = list(image_ids)
+        if not image_ids:
+            return
+        
+        if getattr(settings, 'IMAGE_PROCESSING_ASYNC', True):
+            transaction.on_commit(
+                lambda: group(process_image_task.s(image_id) for image_id in image_ids).apply_async()
+            )
+        else:
+            transaction.on_commit(
+                lambda: [process_image_task.apply(args=(image_id,)) for image_id in image_ids]
+            )
     
     def process_image(self):
         """Обработка изображения: конвертация в webp, сжатие, обрезка"""
         try:
             if not self.original_image:
                 return
-                
-            image_path = self.original_image.path
             
-            if not os.path.exists(image_path):
-                logger.error(f"Image file not found: {image_path}")
-                return
+            storage = self.original_image.storage
             
-            with Image.open(image_path) as img:
-                if img.mode in ('RGBA', 'LA', 'P'):
-                    img = img.convert('RGB')
-                
-                if self.is_compressed:
-                    max_size = (1920, 1080)
-                    img.thumbnail(max_size, Image.Resampling.LANCZOS)
-                    
-                    processed_path = self.get_processed_path()
-                    os.makedirs(os.path.dirname(processed_path), exist_ok=True)
-                    img.save(processed_path, 'WEBP', quality=85, optimize=True)
-                    
-                    processed_relative_path = os.path.relpath(processed_path, settings.MEDIA_ROOT)
-                    self.processed_image.name = processed_relative_path
+            if not storage.exists(self.original_image.name):
+                raise FileNotFoundError(f"Image file not found: {self.original_image.name}")
+            
+            old_files = {'processed': self.processed_image.name, 'cropped': self.cropped_image.name}
+            
+            ImageUpload.objects.filter(id=self.id).update(status=self.STATUS_PROCESSING)
+            
+            with self.original_image.open('rb') as original, Image.open(original) as source:
+                if not self.original_width:
+                    self.original_width, self.original_height = source.size
+                    self.original_mime_type = Image.MIME.get(source.format, '')
+                    self.original_size = self.original_image.size
                 
-                if self.is_cropped:
-                    size = (600, 600)
-                    img_cropped = img.copy()
-                    img_cropped.thumbnail(size, Image.Resampling.LANCZOS)
-                    
-                    img_square = Image.new('RGB', size, (255, 255, 255))
-                    img_square.paste(
-                        img_cropped,
-                        ((size[0] - img_cropped.size[0]) // 2,
-                         (size[1] - img_cropped.size[1]) // 2)
+                self.is_animated = is_animated(source)
+                if self.is_animated:
+                    variants = self.build_animation(source)
+                else:
+                    img = decode_for_size(
+                        source,
+                        self.get_decode_size(),
+                        max_pixels=getattr(settings, 'IMAGE_MAX_PIXELS', None),
+                        max_bytes=getattr(settings, 'IMAGE_MAX_DECODE_BYTES', None),
                     )
+                    self.set_dhash(compute_dhash(img))
+                    profile = get_encoder_profile(self.encoder_profile)
+                    search_cache = new_search_cache(img)
+                    
+                    if self.is_compressed:
+                        max_size = (1920, 1080)
+                        # Уменьшается копия: srcset строится из декодированного изображения
+                        processed_img = img.copy()
+                        processed_img.thumbnail(max_size, Image.Resampling.LANCZOS)
+                        
+                        processed_data = encode_with_profile(processed_img, 'webp', profile, search_cache)
+                        processed_name = self.get_processed_name(content_digest(processed_data, salt=self.id))
+                        self.processed_image.name = save_image_file(processed_name, processed_data)
+                        self.processed_width, self.processed_height = processed_img.size
+                        self.processed_size = len(processed_data)
                     
-                    cropped_path = self.get_cropped_path()
-                    os.makedirs(os.path.dirname(cropped_path), exist_ok=True)
-                    img_square.save(cropped_path, 'WEBP', quality=85, optimize=True)
+                    if self.is_cropped:
+                        crop_size = getattr(settings, 'CROP_SIZE', 600)
+                        img_square = fit_image(img, crop_size, crop_size, FIT_PAD)
+                        
+                        # Квадрат кодируется во все форматы сразу: хэш в имени общий,
+                        # копии отличаются только расширением
+                        cropped_data = {'webp': encode_with_profile(img_square, 'webp', profile, search_cache)}
+                        for fmt in self.get_variant_formats():
+                            cropped_data.setdefault(fmt, encode_with_profile(img_square, fmt, profile, search_cache))
+                        cropped_name = self.get_cropped_name(content_digest(*cropped_data.values(), salt=self.id))
+                        self.cropped_image.name = save_image_file(cropped_name, cropped_data['webp'])
+                        self.cropped_width, self.cropped_height = img_square.size
+                        self.cropped_size = len(cropped_data['webp'])
                     
-                    cropped_relative_path = os.path.relpath(cropped_path, settings.MEDIA_ROOT)
-                    self.cropped_image.name = cropped_relative_path
+                    self.placeholder = make_placeholder(img)
+                    variants = self.build_variants(img, profile, search_cache)
+                    if self.is_cropped:
+                        variants += self.build_cropped_variants(img_square, cropped_data)
             
-            ImageUpload.objects.filter(id=self.id).update(
-                processed_image=self.processed_image.name if self.processed_image else None,
-                cropped_image=self.cropped_image.name if self.cropped_image else None
-            )
+            old_variants = list(self.variants.values_list('kind', 'format', 'width', 'file'))
             
+            self.status = self.STATUS_DONE
+            self.processing_error = ''
+            with transaction.atomic():
+                self.variants.all().delete()
+                ImageVariant.objects.bulk_create(variants)
+                ImageUpload.objects.filter(id=self.id).update(
+                    processed_image=self.processed_image.name if self.processed_image else None,
+                    cropped_image=self.cropped_image.name if self.cropped_image else None,
+                    processed_key=file_key(self.processed_image.name),
+                    cropped_key=file_key(self.cropped_image.name),
+                    placeholder=self.placeholder,
+                    is_animated=self.is_animated,
+                    frame_count=self.frame_count,
+                    **self.get_dhash_fields(),
+                    **self.get_file_metadata(),
+                    status=self.status,
+                    processing_error=self.processing_error
+                )
+                self.retire_superseded_files(old_files, old_variants, variants)
+        
+        except TRANSIENT_PROCESSING_ERRORS:
+            # Статус остается processing: повтор решает вызывающий
+            raise
         except Exception as e:
-            logger.error(f"Error processing image {self.id}: {str(e)}")
+            self.mark_failed(e)
             raise
     
-    def get_processed_path(self):
-        """Генерация пути для обработанного изображения"""
-        unique_id = uuid.uuid4().hex[:8]
-        return os.path.join(settings.MEDIA_ROOT, 'images', 'processed', f'{unique_id}_processed.webp')
+    def mark_failed(self, error):
+        """Статус failed с текстом ошибки (ошибка декодирования, проверки или исчерпанные повторы)"""
+        logger.error(f"Error processing image {self.id}: {str(error)}")
+        self.status = self.STATUS_FAILED
+        self.processing_error = str(error)
+        ImageUpload.objects.filter(id=self.id).update(
+            status=self.status,
+            processing_error=self.processing_error
+        )
+    
+    def retire_superseded_files(self, old_files, old_variants, variants):
+        """
+        Файлы предыдущей обработки, которые не дала новая (повторная обработка
+        с теми же параметрами дает те же имена). Вызывается в транзакции
+        обновления записи. URL этих файлов в полях каталога (IMAGE_REFERENCE_FIELDS)
+        заменяются на соответствующие новые файлы; файлы без ссылок ставятся
+        в очередь FileDeletion, а файлы, на которые ссылки остались (нет
+        соответствия), не удаляются - их удалит reconcile_media, когда ссылок не станет.
+        """
+        from .references import find_referenced_names, rewrite_image_urls
+        
+        new_files = {'processed': self.processed_image.name, 'cropped': self.cropped_image.name}
+        new_names = {variant.file.name for variant in variants} | set(new_files.values())
+        superseded = {name for name in [*old_files.values(), *(row[3] for row in old_variants)] if name} - new_names
+        if not superseded:
+            return
+        
+        renames = {
+            old_files[field]: new_files[field]
+            for field in old_files
+            if old_files[field] in superseded and new_files[field]
+        }
+        for kind, fmt, width, name in old_variants:
+            if name not in superseded or name in renames:
+                continue
+            # Ближайшая по ширине новая копия того же типа и формата
+            candidates = [variant for variant in variants if variant.kind == kind and variant.format == fmt]
+            if candidates:
+                renames[name] = min(candidates, key=lambda variant: abs(variant.width - width)).file.name
+        
+        rewrite_image_urls(renames)
+        deleted = superseded - find_referenced_names(superseded)
+        FileDeletion.objects.bulk_create([FileDeletion(name=name) for name in deleted])
+        if deleted:
+            schedule_file_purge()
+    
+    def build_animation(self, source):
+        """
+        Анимированный GIF/WebP: обработанное изображение и квадрат - анимированный
+        WebP (images/animation.py); кадры уменьшаются в пределах
+        IMAGE_ANIMATION_MAX_SIZE независимо от is_compressed. Заглушка и dHash -
+        по первому кадру. Адаптивные копии не строятся: статичный srcset потерял
+        бы анимацию, клиент получает image_url.
+        """
+        crop_size = getattr(settings, 'CROP_SIZE', 600) if self.is_cropped else None
+        animation = transcode_animation(
+            source,
+            crop_size,
+            max_pixels=getattr(settings, 'IMAGE_MAX_PIXELS', None),
+            max_bytes=getattr(settings, 'IMAGE_MAX_DECODE_BYTES', None),
+        )
+        self.frame_count = animation.frame_count
+        self.set_dhash(compute_dhash(animation.first_frame))
+        self.placeholder = make_placeholder(animation.first_frame)
+        
+        processed_name = self.get_processed_name(content_digest(animation.data, salt=self.id))
+        self.processed_image.name = save_image_file(processed_name, animation.data)
+        self.processed_width, self.processed_height = animation.size
+        self.processed_size = len(animation.data)
+        
+        if crop_size:
+            cropped_name = self.get_cropped_name(content_digest(animation.cropped_data, salt=self.id))
+            self.cropped_image.name = save_image_file(cropped_name, animation.cropped_data)
+            self.cropped_width, self.cropped_height = animation.cropped_size
+            self.cropped_size = len(animation.cropped_data)
+        
+        return []
+    
+    def get_decode_size(self):
+        """
+        Минимальный размер декодирования, достаточный для самой большой
+        производной: рамки обработанного изображения, верхней ступени
+        srcset и квадрата обрезки.
+        """
+        widths = getattr(settings, 'IMAGE_VARIANT_WIDTHS', [320, 640, 960, 1280, 1920])
+        crop_size = getattr(settings, 'CROP_SIZE', 600) if self.is_cropped else 1
+        
+        if self.is_compressed:
+            return (max(1920, crop_size), max(1080, crop_size))
+        return (max(max(widths), crop_size), crop_size)
+    
+    def get_variant_formats(self):
+        """Форматы адаптивных копий из IMAGE_VARIANT_FORMATS, доступные в Pillow"""
+        return available_formats(getattr(settings, 'IMAGE_VARIANT_FORMATS', ['avif', 'webp', 'jpeg']))
+    
+    def build_variants(self, img, profile, search_cache=None):
+        """
+        Генерация адаптивных копий (srcset) по ширинам из IMAGE_VARIANT_WIDTHS
+        в каждом формате из IMAGE_VARIANT_FORMATS с качеством по профилю кодирования.
+        Все ступени строятся из уже декодированного изображения.
+        """
+        widths = getattr(settings, 'IMAGE_VARIANT_WIDTHS', [320, 640, 960, 1280, 1920])
+        formats = self.get_variant_formats()
+        variants = []
+        
+        for width, variant_img in build_width_ladder(img, widths):
+            encoded = {fmt: encode_with_profile(variant_img, fmt, profile, search_cache) for fmt in formats}
+            digest = content_digest(*encoded.values(), salt=self.id)
+            for fmt, data in encoded.items():
+                variant_name = self.get_variant_name(digest, width, fmt)
+                variants.append(
+                    self.save_variant(variant_img, variant_name, fmt, ImageVariant.KIND_RESPONSIVE, data)
+                )
+        
+        return variants
     
-    def get_cropped_path(self):
-        """Генерация пути для обрезанного изображения"""
-        unique_id = uuid.uuid4().hex[:8]
-        return os.path.join(settings.MEDIA_ROOT, 'images', 'cropped', f'{unique_id}_cropped.webp')
+    def build_cropped_variants(self, img_square, encoded):
+        """
+        Копии квадратного изображения во всех форматах рядом с cropped_image.
+        WebP-версия - это сам файл cropped_image, он только регистрируется.
+        """
+        base_name = os.path.splitext(self.cropped_image.name)[0]
+        
+        return [
+            self.save_variant(
+                img_square, f'{base_name}.{FORMAT_EXTENSIONS[fmt]}', fmt, ImageVariant.KIND_CROPPED, encoded[fmt]
+            )
+            for fmt in self.get_variant_formats()
+        ]
+    
+    def save_variant(self, img, name, fmt, kind, data):
+        """Запись закодированной копии в хранилище и создание (несохраненной) записи ImageVariant"""
+        name = save_image_file(name, data)
+        
+        return ImageVariant(
+            image=self,
+            kind=kind,
+            format=fmt,
+            file=name,
+            key=file_key(name),
+            width=img.width,
+            height=img.height,
+            size=len(data),
+        )
+    
+    def get_variant_name(self, digest, width, fmt):
+        """
+        Генерация имени в хранилище для адаптивной копии заданной ширины.
+        Копии одной ширины отличаются только расширением (хэш считается
+        по всем форматам сразу); формат по заголовку Accept выбирает API
+        при выдаче srcset.
+        """
+        return shard_name('images/processed', f'{digest}_{width}w.{FORMAT_EXTENSIONS[fmt]}')
+    
+    def get_processed_name(self, digest):
+        """Генерация имени обработанного изображения по хэшу содержимого"""
+        return shard_name('images/processed', f'{digest}_processed.webp')
+    
+    def get_cropped_name(self, digest):
+        """Генерация имени обрезанного изображения по хэшу содержимого"""
+        return shard_name('images/cropped', f'{digest}_cropped.webp')
     
     def get_image_url(self):
         """Получение URL изображения (приоритет: обработанное -> оригинальное)"""
@@ -156,4 +753,107 @@ class ImageUpload(models.Model):
         """Получение URL обрезанного изображения"""
         if self.cropped_image:
             return self.cropped_image.url
-        return self.get_image_url()
\ No newline at end of file
+        return self.get_image_url()
+
+
+class ImageVariant(models.Model):
+    """Адаптивная копия изображения определенной ширины и формата (для srcset)"""
+    KIND_RESPONSIVE = 'responsive'
+    KIND_CROPPED = 'cropped'
+    KIND_CHOICES = [
+        (KIND_RESPONSIVE, 'Адаптивная копия'),
+        (KIND_CROPPED, 'Квадратная копия'),
+    ]
+    FORMAT_CHOICES = [
+        ('avif', 'AVIF'),
+        ('webp', 'WebP'),
+        ('jpeg', 'JPEG'),
+    ]
+    
+    image = models.ForeignKey(
+        ImageUpload,
+        on_delete=models.CASCADE,
+        related_name='variants',
+        verbose_name='Изображение'
+    )
+    kind = models.CharField(
+        max_length=20,
+        choices=KIND_CHOICES,
+        default=KIND_RESPONSIVE,
+        verbose_name='Тип копии'
+    )
+    format = models.CharField(
+        max_length=10,
+        choices=FORMAT_CHOICES,
+        default='webp',
+        verbose_name='Формат'
+    )
+    file = models.ImageField(max_length=255, storage=get_image_storage, verbose_name='Файл')
+    key = models.CharField(max_length=255, blank=True, default='', db_index=True, editable=False)
+    width = models.PositiveIntegerField(verbose_name='Ширина')
+    height = models.PositiveIntegerField(verbose_name='Высота')
+    size = models.PositiveIntegerField(verbose_name='Размер (байт)')
+    
+    class Meta:
+        verbose_name = 'Вариант изображения'
+        verbose_name_plural = 'Варианты изображений'
+        ordering = ['width']
+    
+    def __str__(self):
+        return f"{self.image_id}: {self.width}x{self.height} {self.format}"
+
+
+class FileDeletion(models.Model):
+    """Очередь (outbox) файлов на удаление после удаления записей из базы"""
+    name = models.CharField(max_length=255, verbose_name='Файл')
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name='Попытки')
+    last_error = models.TextField(blank=True, default='', verbose_name='Последняя ошибка')
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Файл на удаление'
+        verbose_name_plural = 'Файлы на удаление'
+        ordering = ['id']
+    
+    def __str__(self):
+        return self.name
+
+
+class ImageReference(models.Model):
+    """
+    Ссылка на изображение из URL-поля другой модели (Master.image,
+    Service.main_images и т.д.): по ней выдаются копии и заглушка для URL
+    и видно, какие изображения используются. Поддерживается сигналами
+    при сохранении (images/references.py).
+    """
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveBigIntegerField()
+    field = models.CharField(max_length=64, verbose_name='Поле')
+    # Номер URL в поле-списке (для одиночного поля - 0)
+    position = models.PositiveSmallIntegerField(default=0)
+    url = models.TextField(verbose_name='URL')
+    key = models.CharField(max_length=255, blank=True, default='', db_index=True, editable=False)
+    image = models.ForeignKey(
+        ImageUpload,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='references',
+        verbose_name='Изображение'
+    )
+    # Какие копии отдавать: URL квадратной копии получает квадратные варианты
+    kind = models.CharField(
+        max_length=20,
+        choices=ImageVariant.KIND_CHOICES,
+        default=ImageVariant.KIND_RESPONSIVE,
+        verbose_name='Тип копий'
+    )
+    
+    class Meta:
+        verbose_name = 'Использование изображения'
+        verbose_name_plural = 'Использования изображений'
+        ordering = ['field', 'position']
+        unique_together = [('content_type', 'object_id', 'field', 'position')]
+    
+    def __str__(self):
+        return f"{self.content_type_id}:{self.object_id}.{self.field}[{self.position}] -> {self.image_id}"
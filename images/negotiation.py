@@ -0,0 +1,13 @@
+from rest_framework.negotiation import DefaultContentNegotiation
+
+
+class ImageContentNegotiation(DefaultContentNegotiation):
+    """
+    Для эндпоинтов, отдающих файлы или редиректы на них: браузер запрашивает
+    картинку с Accept: image/avif,image/webp,..., что DRF по умолчанию
+    отклоняет с 406. Формат файла выбирается самим эндпоинтом, а JSON-рендерер
+    используется только для ошибок.
+    """
+    
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return (renderers[0], renderers[0].media_type)
@@ -0,0 +1,163 @@
+import base64
+import io
+import math
+from PIL import Image, ImageOps
+
+FIT_CONTAIN = 'contain'
+FIT_COVER = 'cover'
+FIT_PAD = 'pad'
+FIT_MODES = (FIT_CONTAIN, FIT_COVER, FIT_PAD)
+
+
+class ImageTooLargeError(ValueError):
+    """Изображение превышает бюджет по пикселям или памяти на декодирование"""
+
+
+def decode_for_size(img, target_size, max_pixels=None, max_bytes=None):
+    """
+    Декодирование открытого (еще не загруженного) изображения сразу
+    в уменьшенном виде, не меньше target_size по обеим сторонам.
+
+    Размер из заголовка проверяется по max_pixels до декодирования.
+    JPEG декодируется с масштабированием DCT (draft, 1/2-1/8), остальные
+    форматы - полностью, но сразу уменьшаются через reduce() до
+    преобразования режима, чтобы не держать две полноразмерные копии.
+    После draft проверяется объем буфера по max_bytes.
+    """
+    width, height = img.size
+    if max_pixels and width * height > max_pixels:
+        raise ImageTooLargeError(
+            f'Изображение {width}x{height} превышает лимит {max_pixels} пикселей'
+        )
+    
+    target_width = max(1, min(target_size[0], width))
+    target_height = max(1, min(target_size[1], height))
+    
+    if img.format == 'JPEG':
+        img.draft('RGB', (target_width, target_height))
+    
+    if max_bytes:
+        decoded_bytes = img.size[0] * img.size[1] * len(img.getbands())
+        if decoded_bytes > max_bytes:
+            raise ImageTooLargeError(
+                f'Декодирование {img.size[0]}x{img.size[1]} требует {decoded_bytes} байт, лимит {max_bytes}'
+            )
+    
+    img.load()
+    
+    # reduce() не работает с палитрой и 1-битными изображениями
+    if img.mode in ('P', '1'):
+        img = prepare_for_encoding(img)
+    
+    factor = min(img.size[0] // target_width, img.size[1] // target_height)
+    if factor >= 2:
+        img = img.reduce(factor)
+    
+    return prepare_for_encoding(img)
+
+
+def prepare_for_encoding(img):
+    """Приведение изображения к RGB (webp/jpeg не принимают палитру и альфа-канал)"""
+    if img.mode in ('RGBA', 'LA', 'P'):
+        return img.convert('RGB')
+    if img.mode not in ('RGB', 'L'):
+        return img.convert('RGB')
+    return img
+
+
+def resize_to_width(img, width):
+    """Пропорциональное уменьшение до заданной ширины (без увеличения)"""
+    if img.width <= width:
+        return img
+    height = max(1, round(img.height * width / img.width))
+    return img.resize((width, height), Image.Resampling.LANCZOS)
+
+
+def build_width_ladder(img, widths):
+    """
+    Генерация набора уменьшенных копий по списку ширин из одного
+    декодированного изображения.
+
+    Ширины обрабатываются по убыванию, и каждая ступень строится из
+    предыдущей, а не из оригинала: так основная работа ресемплинга
+    выполняется один раз. Ширины больше оригинала пропускаются,
+    вместо них добавляется сам оригинальный размер.
+    Возвращает список (width, image) по возрастанию ширины.
+    """
+    ladder = []
+    source = img
+    for width in sorted(set(widths), reverse=True):
+        if width >= img.width:
+            continue
+        source = resize_to_width(source, width)
+        ladder.append((source.width, source))
+    
+    if not widths or max(widths) >= img.width:
+        ladder.append((img.width, img))
+    
+    ladder.sort(key=lambda item: item[0])
+    return ladder
+
+
+def fit_scale(size, width, height, fit=FIT_CONTAIN):
+    """Масштаб, с которым изображение size попадает в рамку width x height при fit_image"""
+    scale_x = width / size[0]
+    scale_y = height / size[1]
+    return max(scale_x, scale_y) if fit == FIT_COVER else min(scale_x, scale_y)
+
+
+def fit_decode_size(size, width, height, fit=FIT_CONTAIN):
+    """Размер, до которого достаточно декодировать изображение size для fit_image"""
+    scale = fit_scale(size, width, height, fit)
+    return (max(1, math.ceil(size[0] * scale)), max(1, math.ceil(size[1] * scale)))
+
+
+def fit_box(size, width, height, fit=FIT_CONTAIN):
+    """
+    Рамка для fit_image без увеличения изображения size: если рамка требует
+    увеличения, она уменьшается целиком, с сохранением пропорций
+    (cover и pad дают запрошенное соотношение сторон и для маленького оригинала).
+    """
+    scale = fit_scale(size, width, height, fit)
+    if scale <= 1:
+        return (width, height)
+    return (max(1, round(width / scale)), max(1, round(height / scale)))
+
+
+def fit_image(img, width, height, fit=FIT_CONTAIN):
+    """
+    Приведение изображения к рамке width x height:
+    contain - вписать целиком, cover - заполнить с обрезкой по центру,
+    pad - вписать и дополнить белыми полями до точного размера.
+    """
+    if fit == FIT_COVER:
+        return ImageOps.fit(img, (width, height), Image.Resampling.LANCZOS)
+    
+    fitted = img.copy()
+    fitted.thumbnail((width, height), Image.Resampling.LANCZOS)
+    
+    if fit == FIT_PAD:
+        padded = Image.new('RGB', (width, height), (255, 255, 255))
+        padded.paste(
+            fitted,
+            ((width - fitted.size[0]) // 2,
+             (height - fitted.size[1]) // 2)
+        )
+        return padded
+    
+    return fitted
+
+
+def make_placeholder(img, size=16, quality=40):
+    """
+    Миниатюрная заглушка (LQIP) для показа до загрузки изображения:
+    WebP не больше size x size в виде data URI (обычно 100-200 байт).
+    Строится из уже декодированного изображения; размытие делает браузер
+    при растягивании (и CSS filter: blur).
+    """
+    tiny = img.copy()
+    tiny.thumbnail((size, size), Image.Resampling.BILINEAR, reducing_gap=2.0)
+    
+    buffer = io.BytesIO()
+    tiny.save(buffer, 'WEBP', quality=quality)
+    return 'data:image/webp;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii')
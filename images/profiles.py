@@ -0,0 +1,221 @@
+"""
+Профили кодирования производных изображений (IMAGE_ENCODER_PROFILES). Профиль
+задает порог качества (SSIM по яркости относительно исходного кадра) и/или
+бюджет байт на мегапиксель; качество кодировщика подбирается ограниченным
+двоичным поиском в памяти - каждая проба кодируется в BytesIO. Поиск идет
+один раз на формат за обработку, найденное качество используется для всех
+копий изображения; бюджет байт проверяется на каждой копии отдельно.
+"""
+import io
+import numpy as np
+from PIL import Image
+from django.conf import settings
+from .formats import ENCODE_OPTIONS, encode_image
+
+DEFAULT_PROFILE = 'standard'
+
+# Диапазоны поиска качества. Верхняя граница - прежнее фиксированное качество,
+# поэтому профиль по умолчанию может только уменьшить файл
+QUALITY_RANGES = {
+    'avif': (30, 60),
+    'webp': (40, 85),
+    'jpeg': (40, 85),
+}
+
+# Проб на один поиск: диапазон в 45 единиц качества сужается до 1-2
+MAX_SEARCH_STEPS = 6
+# Большие кадры ищутся на мозаике 2x2 из фрагментов 320x320 в исходном масштабе
+# (уменьшение сгладило бы мелкую текстуру, которую и теряет кодировщик).
+# 320 кратно блокам AVIF/WebP/JPEG, швы мозаики совпадают с границами блоков
+SEARCH_TILE = 320
+
+# Окно SSIM и константы стабилизации из оригинальной статьи (Wang et al., 2004)
+SSIM_WINDOW = 8
+SSIM_C1 = (0.01 * 255) ** 2
+SSIM_C2 = (0.03 * 255) ** 2
+
+
+def get_encoder_profiles():
+    return getattr(settings, 'IMAGE_ENCODER_PROFILES', {})
+
+
+def get_default_profile_name():
+    return getattr(settings, 'IMAGE_DEFAULT_ENCODER_PROFILE', DEFAULT_PROFILE)
+
+
+def get_encoder_profile(name):
+    """Параметры профиля; неизвестное имя (профиль убрали из настроек) - профиль по умолчанию"""
+    profiles = get_encoder_profiles()
+    if name in profiles:
+        return profiles[name]
+    return profiles.get(get_default_profile_name(), {})
+
+
+def get_quality_range(fmt, profile):
+    return profile.get('quality', {}).get(fmt, QUALITY_RANGES[fmt])
+
+
+def luma(img):
+    return np.asarray(img.convert('L'), dtype=np.float32)
+
+
+def ssim(reference, candidate):
+    """
+    Средний SSIM двух полутоновых массивов по неперекрывающимся окнам 8x8.
+    Грубее гауссова окна, но на порядок быстрее и для сравнения проб
+    одного кадра достаточно.
+    """
+    window = min(SSIM_WINDOW, reference.shape[0], reference.shape[1])
+    height = reference.shape[0] // window * window
+    width = reference.shape[1] // window * window
+    shape = (height // window, window, width // window, window)
+    a = reference[:height, :width].reshape(shape)
+    b = candidate[:height, :width].reshape(shape)
+    
+    mean_a = a.mean(axis=(1, 3), keepdims=True)
+    mean_b = b.mean(axis=(1, 3), keepdims=True)
+    var_a = ((a - mean_a) ** 2).mean(axis=(1, 3))
+    var_b = ((b - mean_b) ** 2).mean(axis=(1, 3))
+    covariance = ((a - mean_a) * (b - mean_b)).mean(axis=(1, 3))
+    mean_a = mean_a[:, 0, :, 0]
+    mean_b = mean_b[:, 0, :, 0]
+    
+    index = ((2 * mean_a * mean_b + SSIM_C1) * (2 * covariance + SSIM_C2)) / (
+        (mean_a ** 2 + mean_b ** 2 + SSIM_C1) * (var_a + var_b + SSIM_C2)
+    )
+    return float(index.mean())
+
+
+def search_lowest(low, high, accept, steps):
+    """Наименьшее значение из [low, high], для которого accept истинно (accept не убывает); иначе high"""
+    result = high
+    while low <= high and steps > 0:
+        middle = (low + high) // 2
+        steps -= 1
+        if accept(middle):
+            result = middle
+            high = middle - 1
+        else:
+            low = middle + 1
+    return result
+
+
+def search_highest(low, high, accept, steps):
+    """Наибольшее значение из [low, high], для которого accept истинно (accept не возрастает); иначе low"""
+    result = low
+    while low <= high and steps > 0:
+        middle = (low + high + 1) // 2
+        steps -= 1
+        if accept(middle):
+            result = middle
+            low = middle + 1
+        else:
+            high = middle - 1
+    return result
+
+
+def new_search_cache(img):
+    """
+    Кэш подбора качества для одной обработки изображения img: кадр проб
+    строится один раз по всему изображению, качество ищется один раз
+    на формат и используется для обработанного изображения, квадрата
+    и всех ступеней srcset.
+    """
+    return {'proxy': search_proxy(img), 'quality': {}, 'data': {}}
+
+
+def encode_with_profile(img, fmt, profile, search_cache=None):
+    """Кодирование с качеством, подобранным по профилю (см. find_quality и new_search_cache)"""
+    if fmt not in QUALITY_RANGES or not (profile.get('min_ssim') or profile.get('bytes_per_megapixel')):
+        return encode_image(img, fmt)
+    
+    if search_cache is None:
+        search_cache = new_search_cache(img)
+    qualities = search_cache['quality']
+    if fmt not in qualities:
+        qualities[fmt], search_cache['data'][fmt] = find_quality(search_cache['proxy'], fmt, profile)
+    # Поиск шел на самом изображении - выбранная проба и есть результат
+    if img is search_cache['proxy']:
+        return search_cache['data'][fmt]
+    
+    encode = cached_encoder(img, fmt)
+    return encode(fit_budget(img, fmt, profile, qualities[fmt], encode))
+
+
+def cached_encoder(img, fmt):
+    """Кодирование img в fmt с заданным качеством; пробы кэшируются по качеству"""
+    encoded = {}
+    
+    def encode(quality):
+        if quality not in encoded:
+            encoded[quality] = encode_image(img, fmt, {**ENCODE_OPTIONS[fmt], 'quality': quality})
+        return encoded[quality]
+    
+    return encode
+
+
+def fit_budget(img, fmt, profile, quality, encode):
+    """
+    Наибольшее качество не выше quality, при котором файл укладывается
+    в бюджет bytes_per_megapixel для размера img. Качество найдено на кадре
+    проб в исходном масштабе, а уменьшенная ступень содержит больше деталей
+    на пиксель и при том же качестве может выйти за бюджет.
+    """
+    bytes_per_megapixel = profile.get('bytes_per_megapixel')
+    if not bytes_per_megapixel:
+        return quality
+    
+    max_bytes = bytes_per_megapixel * img.width * img.height / 1_000_000
+    if len(encode(quality)) <= max_bytes:
+        return quality
+    
+    low = get_quality_range(fmt, profile)[0]
+    steps = profile.get('max_steps', MAX_SEARCH_STEPS)
+    return search_highest(low, quality - 1, lambda value: len(encode(value)) <= max_bytes, steps)
+
+
+def search_proxy(img):
+    """
+    Кадр для проб: само изображение, если оно не больше мозаики, иначе мозаика
+    из четырех фрагментов вокруг центров четвертей кадра.
+    """
+    size = SEARCH_TILE * 2
+    if img.width <= size or img.height <= size:
+        return img
+    
+    mosaic = Image.new(img.mode, (size, size))
+    for row in range(2):
+        for column in range(2):
+            left = img.width * (1 + 2 * column) // 4 - SEARCH_TILE // 2
+            top = img.height * (1 + 2 * row) // 4 - SEARCH_TILE // 2
+            tile = img.crop((left, top, left + SEARCH_TILE, top + SEARCH_TILE))
+            mosaic.paste(tile, (column * SEARCH_TILE, row * SEARCH_TILE))
+    return mosaic
+
+
+def find_quality(img, fmt, profile):
+    """
+    Подбор качества: (качество, байты выбранной пробы). Сначала ищется
+    наименьшее качество, дающее SSIM не ниже min_ssim; если порог не достигается
+    и на верхней границе диапазона, поиска нет - берется граница. Если результат
+    не укладывается в бюджет, берется наибольшее качество в пределах
+    бюджета (fit_budget). Пробы кэшируются по качеству.
+    """
+    min_ssim = profile.get('min_ssim')
+    low, high = get_quality_range(fmt, profile)
+    steps = profile.get('max_steps', MAX_SEARCH_STEPS)
+    encode = cached_encoder(img, fmt)
+    
+    quality = high
+    if min_ssim:
+        reference = luma(img)
+        
+        def similar_enough(value):
+            with Image.open(io.BytesIO(encode(value))) as decoded:
+                return ssim(reference, luma(decoded)) >= min_ssim
+        
+        if similar_enough(high):
+            quality = search_lowest(low, high, similar_enough, steps)
+    
+    quality = fit_budget(img, fmt, profile, quality, encode)
+    return quality, encode(quality)
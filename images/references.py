@@ -0,0 +1,243 @@
+"""
+Индекс ссылок на изображения из URL-полей других приложений (ImageReference).
+Поля перечислены в IMAGE_REFERENCE_FIELDS; при сохранении объекта его URL
+сопоставляются с ImageUpload по ключу имени файла (как find_by_slug),
+и сериализаторы списков получают копии и заглушки для всей страницы
+одним пакетом, без поиска по каждому URL.
+"""
+from urllib.parse import unquote, urlparse, urlunparse
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import models, transaction
+from .models import ImageReference, ImageUpload, ImageVariant, file_key
+
+# Ключи, под которыми лежит URL, если элемент JSON-списка - объект
+URL_ITEM_KEYS = ('url', 'image', 'src')
+KEY_MAX_LENGTH = 255
+
+
+def get_reference_fields():
+    """Модель -> URL-поля (URLField или JSON-список URL) из IMAGE_REFERENCE_FIELDS"""
+    return getattr(settings, 'IMAGE_REFERENCE_FIELDS', {})
+
+
+def get_model_reference_fields(model):
+    return get_reference_fields().get(model._meta.label, [])
+
+
+def is_list_field(model, field):
+    return isinstance(model._meta.get_field(field), models.JSONField)
+
+
+def extract_urls(value):
+    """Пары (позиция, URL) из значения поля: строка или список строк/объектов с URL"""
+    if not value:
+        return []
+    if isinstance(value, str):
+        return [(0, value)]
+    if not isinstance(value, list):
+        return []
+    
+    urls = []
+    for position, item in enumerate(value):
+        if isinstance(item, dict):
+            item = next((item[key] for key in URL_ITEM_KEYS if isinstance(item.get(key), str)), None)
+        if isinstance(item, str) and item:
+            urls.append((position, item))
+    return urls
+
+
+def reference_key(url):
+    return file_key(url)[:KEY_MAX_LENGTH]
+
+
+def url_points_to(url, name):
+    """URL ведет на файл хранилища name (путь URL заканчивается именем файла)"""
+    path = unquote(urlparse(url).path)
+    return path == name or path.endswith('/' + name)
+
+
+def group_names_by_key(names):
+    grouped = {}
+    for name in names:
+        grouped.setdefault(reference_key(name), []).append(name)
+    return grouped
+
+
+def find_referenced_names(names):
+    """Имена файлов хранилища из names, на которые ведет URL хотя бы одной ссылки ImageReference"""
+    names_by_key = group_names_by_key(names)
+    referenced = set()
+    for key, url in ImageReference.objects.filter(key__in=names_by_key).values_list('key', 'url'):
+        referenced.update(name for name in names_by_key[key] if url_points_to(url, name))
+    return referenced
+
+
+def rename_url(url, renames, names_by_key):
+    """URL с замененным именем файла, если он ведет на файл из renames ({старое имя: новое})"""
+    for name in names_by_key.get(reference_key(url), []):
+        if url_points_to(url, name):
+            parsed = urlparse(url)
+            path = unquote(parsed.path)
+            return urlunparse(parsed._replace(path=path[:len(path) - len(name)] + renames[name]))
+    return url
+
+
+def rename_urls(value, renames, names_by_key):
+    """Значение URL-поля (строка или JSON-список) с замененными именами файлов"""
+    if isinstance(value, str):
+        return rename_url(value, renames, names_by_key)
+    if not isinstance(value, list):
+        return value
+    
+    renamed = []
+    for item in value:
+        if isinstance(item, str):
+            item = rename_url(item, renames, names_by_key)
+        elif isinstance(item, dict):
+            item = {
+                key: rename_url(url, renames, names_by_key) if key in URL_ITEM_KEYS and isinstance(url, str) else url
+                for key, url in item.items()
+            }
+        renamed.append(item)
+    return renamed
+
+
+def rewrite_image_urls(renames):
+    """
+    Замена в URL-полях объектов ссылок на переименованные файлы хранилища
+    ({старое имя: новое}). Вызывается в транзакции, которая меняет имена
+    в ImageUpload/ImageVariant: строки объектов блокируются, поля перечитываются
+    и записываются через update() (без save() и его побочных эффектов),
+    затем синхронизируются ссылки. Возвращает число измененных объектов.
+    """
+    names_by_key = group_names_by_key(renames)
+    if not names_by_key:
+        return 0
+    
+    targets = {}
+    references = ImageReference.objects.filter(key__in=names_by_key).values_list(
+        'content_type_id', 'object_id', 'field', 'key', 'url'
+    )
+    for content_type_id, object_id, field, key, url in references:
+        if any(url_points_to(url, name) for name in names_by_key[key]):
+            targets.setdefault(content_type_id, {}).setdefault(object_id, set()).add(field)
+    
+    rewritten = 0
+    for content_type_id, objects in targets.items():
+        model = ContentType.objects.get_for_id(content_type_id).model_class()
+        if model is None:
+            continue
+        for instance in model.objects.select_for_update().filter(pk__in=objects):
+            changed = {}
+            for field in objects[instance.pk]:
+                value = rename_urls(getattr(instance, field), renames, names_by_key)
+                if value != getattr(instance, field):
+                    changed[field] = value
+            if not changed:
+                continue
+            model.objects.filter(pk=instance.pk).update(**changed)
+            for field, value in changed.items():
+                setattr(instance, field, value)
+            sync_image_references(instance)
+            rewritten += 1
+    return rewritten
+
+
+def resolve_urls(urls):
+    """
+    {ключ URL: (ImageUpload, тип копий)} для URL любого файла изображения.
+    URL квадратной копии получает тип cropped, остальные - responsive.
+    """
+    if not urls:
+        return {}
+    
+    resolved = {}
+    for image in ImageUpload.objects.filter_by_slugs(urls).prefetch_related('variants'):
+        for key in (image.original_key, image.processed_key):
+            resolved.setdefault(key, (image, ImageVariant.KIND_RESPONSIVE))
+        resolved[image.cropped_key] = (image, ImageVariant.KIND_CROPPED)
+        for variant in image.variants.all():
+            resolved.setdefault(variant.key, (image, variant.kind))
+    resolved.pop('', None)
+    return resolved
+
+
+def sync_image_references(instance):
+    """
+    Приведение ссылок объекта к текущим значениям его URL-полей.
+    Если URL не изменились и все найдены - один запрос; изменившиеся
+    и ненайденные ранее URL сопоставляются заново.
+    """
+    fields = get_model_reference_fields(type(instance))
+    wanted = {
+        (field, position): url
+        for field in fields
+        for position, url in extract_urls(getattr(instance, field))
+    }
+    content_type = ContentType.objects.get_for_model(instance)
+    current = {
+        (reference.field, reference.position): reference
+        for reference in ImageReference.objects.filter(content_type=content_type, object_id=instance.pk)
+    }
+    
+    stale = [
+        reference.id for slot, reference in current.items()
+        if wanted.get(slot) != reference.url or reference.image_id is None
+    ]
+    missing = {slot: url for slot, url in wanted.items() if slot not in current or current[slot].id in stale}
+    if not stale and not missing:
+        return
+    
+    resolved = resolve_urls(list(missing.values()))
+    new_references = []
+    for (field, position), url in missing.items():
+        key = reference_key(url)
+        image, kind = resolved.get(key, (None, ImageVariant.KIND_RESPONSIVE))
+        new_references.append(ImageReference(
+            content_type=content_type,
+            object_id=instance.pk,
+            field=field,
+            position=position,
+            url=url,
+            key=key,
+            image=image,
+            kind=kind,
+        ))
+    
+    with transaction.atomic():
+        ImageReference.objects.filter(id__in=stale).delete()
+        ImageReference.objects.bulk_create(new_references)
+
+
+def delete_image_references(instance):
+    ImageReference.objects.filter(
+        content_type=ContentType.objects.get_for_model(instance),
+        object_id=instance.pk,
+    ).delete()
+
+
+def load_image_references(instances):
+    """
+    Найденные ссылки для набора объектов одной модели:
+    {id объекта: {поле: {позиция: ImageReference}}}. Два запроса на любой
+    размер набора: ссылки с изображениями и копии этих изображений.
+    """
+    instances = [instance for instance in instances if instance.pk is not None]
+    if not instances:
+        return {}
+    
+    references = (
+        ImageReference.objects
+        .filter(
+            content_type=ContentType.objects.get_for_model(instances[0]),
+            object_id__in=[instance.pk for instance in instances],
+            image__isnull=False,
+        )
+        .select_related('image')
+        .prefetch_related('image__variants')
+    )
+    grouped = {}
+    for reference in references:
+        grouped.setdefault(reference.object_id, {}).setdefault(reference.field, {})[reference.position] = reference
+    return grouped
@@ -0,0 +1,218 @@
+import hmac
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode
+from django.conf import settings
+from django.urls import reverse
+from PIL import Image
+from .admission import RENDER_SLOTS, host_slot
+from .formats import FORMAT_EXTENSIONS, PIL_FORMATS, ENCODE_OPTIONS
+from .processing import decode_for_size, fit_box, fit_decode_size, fit_image
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Записи FileDeletion с этим префиксом - файлы кэша рендера, а не файлы хранилища
+CACHE_DELETION_PREFIX = 'render-cache:'
+
+# Оценка объема кэша в процессе: итог последнего обхода плюс свои записи после него
+_cache_size = {'bytes': 0, 'checked_at': float('-inf')}
+_cache_size_lock = threading.Lock()
+
+
+def get_cache_dir():
+    return getattr(settings, 'IMAGE_RENDER_CACHE_DIR', os.path.join(settings.MEDIA_ROOT, 'images', 'cache'))
+
+
+def sign_render_params(image_id, width, height, fit, fmt):
+    """
+    Подпись параметров рендера: HMAC-SHA256 от строки "id:w:h:fit:fmt".
+    Ключ IMAGE_RENDER_SIGNING_KEY можно передать SSR-серверу фронтенда,
+    чтобы он подписывал URL сам по той же схеме.
+    """
+    key = getattr(settings, 'IMAGE_RENDER_SIGNING_KEY', settings.SECRET_KEY)
+    message = f'{image_id}:{width}:{height}:{fit}:{fmt}'
+    return hmac.new(key.encode(), message.encode(), hashlib.sha256).hexdigest()[:32]
+
+
+def verify_render_signature(image_id, width, height, fit, fmt, signature):
+    expected = sign_render_params(image_id, width, height, fit, fmt)
+    return hmac.compare_digest(expected, signature or '')
+
+
+def build_render_url(image_id, width, height, fit, fmt):
+    """Относительный подписанный URL рендера"""
+    params = {
+        'w': width,
+        'h': height,
+        'fit': fit,
+        'fmt': fmt,
+        'sig': sign_render_params(image_id, width, height, fit, fmt),
+    }
+    return f"{reverse('image-render', kwargs={'pk': image_id})}?{urlencode(params)}"
+
+
+def get_cache_prefix(image_id, content_hash=None):
+    """
+    Начало имен файлов кэша изображения: всех версий или только версии
+    оригинала с content_hash (при замене оригинала старые записи не отдаются)
+    """
+    if content_hash is None:
+        return f'{image_id}_'
+    return f'{image_id}_{content_hash[:8]}_'
+
+
+def get_cache_path(image_upload, width, height, fit, fmt):
+    prefix = get_cache_prefix(image_upload.id, image_upload.content_hash or '')
+    filename = f'{prefix}{width}x{height}_{fit}.{FORMAT_EXTENSIONS[fmt]}'
+    return os.path.join(get_cache_dir(), filename)
+
+
+def cache_deletion_name(image_id, content_hash=None):
+    """Имя записи FileDeletion для файлов кэша изображения (см. get_cache_prefix)"""
+    return CACHE_DELETION_PREFIX + get_cache_prefix(image_id, content_hash)
+
+
+def delete_cached_renders(prefixes):
+    """
+    Удаление файлов кэша, имена которых начинаются с одного из prefixes,
+    за один обход каталога. Возвращает число удаленных файлов.
+    """
+    prefixes = tuple(prefixes)
+    removed = 0
+    removed_bytes = 0
+    
+    try:
+        with os.scandir(get_cache_dir()) as it:
+            entries = [entry for entry in it if entry.is_file() and entry.name.startswith(prefixes)]
+    except FileNotFoundError:
+        return 0
+    
+    for entry in entries:
+        try:
+            size = entry.stat().st_size
+            os.remove(entry.path)
+        except FileNotFoundError:
+            continue
+        removed += 1
+        removed_bytes += size
+    
+    with _cache_size_lock:
+        _cache_size['bytes'] = max(_cache_size['bytes'] - removed_bytes, 0)
+    return removed
+
+
+def render_image(image_upload, width, height, fit, fmt):
+    """
+    Открытый файл копии с заданными параметрами. При промахе копия
+    генерируется из оригинала и атомарно записывается в кэш,
+    при попадании обновляется mtime (порядок вытеснения LRU).
+    Файл открывается до вытеснения, поэтому параллельная очистка
+    кэша не мешает отдать его клиенту.
+    Кэш локальный для каждого узла, оригинал читается из хранилища изображений.
+    Генерация занимает слот рендера хоста; если свободного слота нет дольше
+    IMAGE_RENDER_SLOT_TIMEOUT - SlotUnavailable (попадания в кэш слот не ждут).
+    """
+    cache_path = get_cache_path(image_upload, width, height, fit, fmt)
+    
+    if os.path.exists(cache_path):
+        try:
+            os.utime(cache_path)
+            return open(cache_path, 'rb')
+        except FileNotFoundError:
+            # Запись вытеснена параллельным запросом - генерируем заново
+            pass
+    
+    slot_timeout = getattr(settings, 'IMAGE_RENDER_SLOT_TIMEOUT', 1)
+    with host_slot(RENDER_SLOTS, slot_timeout):
+        with image_upload.original_image.open('rb') as original, Image.open(original) as source:
+            img = decode_for_size(
+                source,
+                fit_decode_size(source.size, width, height, fit),
+                max_pixels=getattr(settings, 'IMAGE_MAX_PIXELS', None),
+                max_bytes=getattr(settings, 'IMAGE_MAX_DECODE_BYTES', None),
+            )
+            # Не увеличиваем изображение больше оригинала
+            img = fit_image(img, *fit_box(img.size, width, height, fit), fit)
+            
+            cache_dir = os.path.dirname(cache_path)
+            os.makedirs(cache_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as tmp_file:
+                    img.save(tmp_file, PIL_FORMATS[fmt], **ENCODE_OPTIONS[fmt])
+                os.replace(tmp_path, cache_path)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+    
+    rendered = open(cache_path, 'rb')
+    track_cache_write(os.fstat(rendered.fileno()).st_size)
+    return rendered
+
+
+def track_cache_write(size):
+    """
+    Учет записи в кэш без обхода каталога: процесс суммирует объем своих
+    записей с итогом последнего обхода и запускает enforce_cache_limit, только
+    когда сумма превышает лимит или с последнего обхода прошло
+    IMAGE_RENDER_CACHE_CHECK_INTERVAL секунд (записи других процессов).
+    """
+    max_bytes = getattr(settings, 'IMAGE_RENDER_CACHE_MAX_BYTES', 1024 * 1024 * 1024)
+    interval = getattr(settings, 'IMAGE_RENDER_CACHE_CHECK_INTERVAL', 60)
+    
+    with _cache_size_lock:
+        _cache_size['bytes'] += size
+        due = (
+            _cache_size['bytes'] > max_bytes
+            or time.monotonic() - _cache_size['checked_at'] >= interval
+        )
+        if not due:
+            return
+        # Пока идет обход, другие потоки его не повторяют
+        _cache_size['checked_at'] = time.monotonic()
+    
+    total = enforce_cache_limit()
+    with _cache_size_lock:
+        _cache_size['bytes'] = total
+
+
+def enforce_cache_limit():
+    """
+    Ограничение размера кэша IMAGE_RENDER_CACHE_MAX_BYTES: при превышении
+    удаляются самые давно использованные записи до 90% лимита.
+    Возвращает объем кэша после очистки.
+    """
+    max_bytes = getattr(settings, 'IMAGE_RENDER_CACHE_MAX_BYTES', 1024 * 1024 * 1024)
+    entries = []
+    total = 0
+    
+    with os.scandir(get_cache_dir()) as it:
+        for entry in it:
+            if not entry.is_file() or entry.name.endswith('.tmp'):
+                continue
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+    
+    if total <= max_bytes:
+        return total
+    
+    target = max_bytes * 0.9
+    evicted = 0
+    for _, size, path in sorted(entries):
+        if total <= target:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            continue
+        total -= size
+        evicted += 1
+    
+    logger.info(f"Render cache eviction: removed {evicted} files, {total} bytes left")
+    return total
@@ -0,0 +1,32 @@
+"""
+Задачи для пула процессов команды reprocess_images. Модуль не импортирует
+модели на верхнем уровне: дочерние процессы запускаются методом spawn
+и настраивают Django в init_worker со своим подключением к базе.
+"""
+import time
+
+
+def init_worker():
+    import django
+    django.setup()
+
+
+def reprocess_image(image_id):
+    """Повторная обработка одного изображения: (id, ошибка или None, секунды)"""
+    from .models import TRANSIENT_PROCESSING_ERRORS, ImageUpload
+    
+    started = time.monotonic()
+    image_upload = None
+    try:
+        # Запись могли удалить после выборки id - пропускаем
+        image_upload = ImageUpload.objects.filter(id=image_id).first()
+        if image_upload:
+            image_upload.process_image()
+    except TRANSIENT_PROCESSING_ERRORS as e:
+        # Повторов, как у задачи Celery, здесь нет: запись попадет в --only-failed
+        if image_upload:
+            image_upload.mark_failed(e)
+        return image_id, str(e), time.monotonic() - started
+    except Exception as e:
+        return image_id, str(e), time.monotonic() - started
+    return image_id, None, time.monotonic() - started
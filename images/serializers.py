@@ -1,35 +1,179 @@
 from rest_framework import serializers
-from .models import ImageUpload
+from django.db import IntegrityError, transaction
+from django.conf import settings
+from django.core.validators import FileExtensionValidator
+from .models import ImageReference, ImageUpload, ImageVariant
+from .formats import negotiate_format, FORMAT_MIME_TYPES
+from .profiles import get_encoder_profiles
+from .references import extract_urls, get_model_reference_fields, is_list_field, load_image_references
+import logging
 
+logger = logging.getLogger(__name__)
 
-class ImageUploadSerializer(serializers.ModelSerializer):
+
+def validate_encoder_profile(value):
+    """Профиль кодирования должен быть описан в IMAGE_ENCODER_PROFILES"""
+    profiles = get_encoder_profiles()
+    if value not in profiles:
+        raise serializers.ValidationError(f"Неизвестный профиль. Доступны: {', '.join(profiles)}")
+    return value
+
+
+class ImageVariantSerializer(serializers.ModelSerializer):
+    """Адаптивная копия изображения для srcset"""
+    url = serializers.SerializerMethodField()
+    mime_type = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = ImageVariant
+        fields = ['url', 'width', 'height', 'size', 'format', 'mime_type']
+    
+    def get_url(self, obj):
+        request = self.context.get('request')
+        if request:
+            return request.build_absolute_uri(obj.file.url)
+        return obj.file.url
+    
+    def get_mime_type(self, obj):
+        return FORMAT_MIME_TYPES.get(obj.format)
+
+
+class ImageVariantsMixin:
+    """
+    Выдача копий в формате, выбранном по заголовку Accept (или ?image_format=).
+    Работает по предзагруженным variants, без дополнительных запросов.
+    """
+    
+    def get_variants_for(self, obj, kind):
+        variants = [v for v in obj.variants.all() if v.kind == kind]
+        available = sorted({v.format for v in variants})
+        fmt = negotiate_format(self.context.get('request'), available)
+        return [v for v in variants if v.format == fmt]
+    
+    def get_srcset(self, obj):
+        variants = self.get_variants_for(obj, ImageVariant.KIND_RESPONSIVE)
+        return ImageVariantSerializer(variants, many=True, context=self.context).data
+    
+    def get_formats(self, obj):
+        return sorted({v.format for v in obj.variants.all()})
+
+
+class ImageUploadSerializer(ImageVariantsMixin, serializers.ModelSerializer):
     compress = serializers.BooleanField(write_only=True, default=True)
     crop = serializers.BooleanField(write_only=True, default=False)
+    check_similar = serializers.BooleanField(write_only=True, default=False)
     image_url = serializers.SerializerMethodField()
     cropped_url = serializers.SerializerMethodField()
+    srcset = serializers.SerializerMethodField()
+    formats = serializers.SerializerMethodField()
     
     class Meta:
         model = ImageUpload
         fields = [
             'id', 'original_image', 'processed_image', 'cropped_image',
-            'is_compressed', 'is_cropped', 'compress', 'crop',
-            'image_url', 'cropped_url', 'created_at', 'updated_at'
+            'is_compressed', 'is_cropped', 'compress', 'crop', 'check_similar', 'encoder_profile',
+            'status', 'processing_error', 'placeholder', 'is_animated', 'frame_count',
+            'original_width', 'original_height', 'original_size', 'original_mime_type',
+            'processed_width', 'processed_height', 'processed_size',
+            'cropped_width', 'cropped_height', 'cropped_size',
+            'image_url', 'cropped_url', 'srcset', 'formats', 'created_at', 'updated_at'
         ]
         read_only_fields = [
             'processed_image', 'cropped_image', 'is_compressed', 'is_cropped',
+            'status', 'processing_error', 'placeholder', 'is_animated', 'frame_count',
             'created_at', 'updated_at'
         ]
     
+    def validate_encoder_profile(self, value):
+        return validate_encoder_profile(value)
+    
     def create(self, validated_data):
+        """
+        Создание записи. С check_similar перцептивный хэш считается сразу
+        по уменьшенному декодированию, и в image_upload.similar попадают
+        похожие изображения (предупреждение о возможном дубликате).
+        """
+        check_similar = validated_data.pop('check_similar', False)
+        dhash = None
+        if check_similar:
+            try:
+                dhash = ImageUpload.compute_file_dhash(validated_data['original_image'])
+            except Exception as e:
+                logger.warning(f"Could not compute dHash for upload: {str(e)}")
+        
+        image_upload = self.create_or_reuse(validated_data, dhash)
+        
+        image_upload.similar = None
+        if dhash is not None:
+            image_upload.similar = ImageUpload.objects.exclude(id=image_upload.id).similar_to(
+                dhash, getattr(settings, 'IMAGE_SIMILAR_MAX_DISTANCE', 8)
+            )
+        return image_upload
+    
+    def update(self, instance, validated_data):
+        """
+        Смена профиля кодирования перезапускает обработку с новыми параметрами.
+        Новый original_image обрабатывается как загрузка в ту же запись
+        (ImageUpload.replace_original); если такой файл уже загружен в другую
+        запись, она переиспользуется, как в create_or_reuse, и возвращается вместо этой.
+        """
+        encoder_profile = validated_data.pop('encoder_profile', None)
+        original_image = validated_data.pop('original_image', None)
+        instance = super().update(instance, validated_data)
+        if original_image is not None:
+            return self.replace_original(instance, original_image, encoder_profile)
+        if encoder_profile:
+            instance.reuse_for_upload(False, False, encoder_profile)
+        return instance
+    
+    def replace_original(self, instance, original_image, encoder_profile=None):
+        content_hash = ImageUpload.compute_content_hash(original_image)
+        if content_hash == instance.content_hash:
+            return instance.reuse_for_upload(False, False, encoder_profile)
+        
+        existing = ImageUpload.objects.filter(content_hash=content_hash).first()
+        if existing:
+            return existing.reuse_for_upload(instance.is_compressed, instance.is_cropped, encoder_profile)
+        
+        try:
+            with transaction.atomic():
+                return instance.replace_original(original_image, content_hash, encoder_profile)
+        except IntegrityError:
+            # Такой же файл параллельно загрузили в другом запросе:
+            # новый файл уже записан в хранилище, убираем его
+            instance.original_image.delete(save=False)
+            instance.refresh_from_db()
+            existing = ImageUpload.objects.get(content_hash=content_hash)
+            return existing.reuse_for_upload(instance.is_compressed, instance.is_cropped, encoder_profile)
+    
+    def create_or_reuse(self, validated_data, dhash=None):
         compress = validated_data.pop('compress', True)
         crop = validated_data.pop('crop', False)
+        content_hash = ImageUpload.compute_content_hash(validated_data['original_image'])
+        
+        existing = ImageUpload.objects.filter(content_hash=content_hash).first()
+        if existing:
+            return existing.reuse_for_upload(compress, crop, validated_data.get('encoder_profile'))
         
-        image_upload = ImageUpload.objects.create(
+        image_upload = ImageUpload(
             is_compressed=compress,
             is_cropped=crop,
+            content_hash=content_hash,
             **validated_data
         )
+        if dhash is not None:
+            image_upload.set_dhash(dhash)
+        try:
+            with transaction.atomic():
+                image_upload.save()
+        except IntegrityError:
+            # Такой же файл параллельно загрузили в другом запросе:
+            # файл уже записан на диск до INSERT, убираем его
+            image_upload.original_image.delete(save=False)
+            existing = ImageUpload.objects.get(content_hash=content_hash)
+            return existing.reuse_for_upload(compress, crop, validated_data.get('encoder_profile'))
         
+        image_upload.reused = False
         return image_upload
     
     def get_image_url(self, obj):
@@ -40,21 +184,252 @@ class ImageUploadSerializer(serializers.ModelSerializer):
     
     def get_cropped_url(self, obj):
         request = self.context.get('request')
+        cropped = self.get_variants_for(obj, ImageVariant.KIND_CROPPED)
+        if cropped:
+            return ImageVariantSerializer(cropped[0], context=self.context).data['url']
         if request and obj.get_cropped_url():
             return request.build_absolute_uri(obj.get_cropped_url())
         return obj.get_cropped_url()
 
 
-class ImageListSerializer(serializers.ModelSerializer):
-    """Упрощенный сериализатор для списка изображений"""
+class ImageListSerializer(ImageVariantsMixin, serializers.ModelSerializer):
+    """
+    Упрощенный сериализатор для списка изображений. Размеры и объем
+    берутся из полей модели, чтобы фронтенд мог зарезервировать место
+    под картинку; диск не читается.
+    """
     image_url = serializers.SerializerMethodField()
+    width = serializers.SerializerMethodField()
+    height = serializers.SerializerMethodField()
+    size = serializers.SerializerMethodField()
+    mime_type = serializers.SerializerMethodField()
+    srcset = serializers.SerializerMethodField()
+    formats = serializers.SerializerMethodField()
     
     class Meta:
         model = ImageUpload
-        fields = ['id', 'image_url', 'is_compressed', 'is_cropped', 'created_at']
+        fields = [
+            'id', 'image_url', 'width', 'height', 'size', 'mime_type', 'placeholder', 'is_animated', 'srcset', 'formats',
+            'is_compressed', 'is_cropped', 'status', 'created_at'
+        ]
+    
+    def get_width(self, obj):
+        return obj.get_image_metadata()['width']
+    
+    def get_height(self, obj):
+        return obj.get_image_metadata()['height']
+    
+    def get_size(self, obj):
+        return obj.get_image_metadata()['size']
+    
+    def get_mime_type(self, obj):
+        return obj.get_image_metadata()['mime_type']
     
     def get_image_url(self, obj):
         request = self.context.get('request')
         if request and obj.get_image_url():
             return request.build_absolute_uri(obj.get_image_url())
         return obj.get_image_url()
+
+
+class ImageReferenceSerializer(ImageVariantsMixin, serializers.ModelSerializer):
+    """
+    Изображение по ссылке из URL-поля: актуальный адрес, размеры, заглушка
+    и копии того типа, на который указывает ссылка (квадратные для URL
+    обрезанного изображения). Копии берутся из предзагруженных variants.
+    """
+    image_url = serializers.SerializerMethodField()
+    width = serializers.SerializerMethodField()
+    height = serializers.SerializerMethodField()
+    placeholder = serializers.CharField(source='image.placeholder', read_only=True)
+    is_animated = serializers.BooleanField(source='image.is_animated', read_only=True)
+    srcset = serializers.SerializerMethodField()
+    formats = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = ImageReference
+        fields = ['image_id', 'kind', 'image_url', 'width', 'height', 'placeholder', 'is_animated', 'srcset', 'formats']
+    
+    def is_cropped(self, obj):
+        return obj.kind == ImageVariant.KIND_CROPPED
+    
+    def get_image_url(self, obj):
+        url = obj.image.get_cropped_url() if self.is_cropped(obj) else obj.image.get_image_url()
+        request = self.context.get('request')
+        if request and url:
+            return request.build_absolute_uri(url)
+        return url
+    
+    def get_width(self, obj):
+        if self.is_cropped(obj) and obj.image.cropped_image:
+            return obj.image.cropped_width
+        return obj.image.get_image_metadata()['width']
+    
+    def get_height(self, obj):
+        if self.is_cropped(obj) and obj.image.cropped_image:
+            return obj.image.cropped_height
+        return obj.image.get_image_metadata()['height']
+    
+    def get_srcset(self, obj):
+        variants = self.get_variants_for(obj.image, obj.kind)
+        return ImageVariantSerializer(variants, many=True, context=self.context).data
+    
+    def get_formats(self, obj):
+        return super().get_formats(obj.image)
+
+
+class ImageReferencesField(serializers.Field):
+    """
+    Изображения из URL-полей объекта (IMAGE_REFERENCE_FIELDS):
+    {поле: объект или null} для одиночного поля, {поле: [объект или null, ...]}
+    для списка - по позициям URL. Внутри ImageReferenceListSerializer ссылки
+    загружены для всей страницы, для одиночного объекта загружаются отдельно.
+    """
+    
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+    
+    def to_representation(self, instance):
+        references = self.context.get('image_references')
+        if references is None:
+            references = load_image_references([instance])
+        references = references.get(instance.pk, {})
+        
+        result = {}
+        for field in get_model_reference_fields(type(instance)):
+            value = getattr(instance, field)
+            urls = dict(extract_urls(value))
+            by_position = references.get(field, {})
+            if is_list_field(type(instance), field):
+                positions = range(len(value)) if isinstance(value, list) else []
+                result[field] = [self.represent(by_position.get(position), urls.get(position)) for position in positions]
+            else:
+                result[field] = self.represent(by_position.get(0), urls.get(0))
+        return result
+    
+    def represent(self, reference, url):
+        # Значение поля изменено в обход сигналов (update()) - ссылка устарела
+        if reference is None or reference.url != url:
+            return None
+        return ImageReferenceSerializer(reference, context=self.context).data
+
+
+class ImageReferenceListSerializer(serializers.ListSerializer):
+    """Список с пакетной загрузкой ссылок на изображения для ImageReferencesField"""
+    
+    def to_representation(self, data):
+        items = list(data.all() if hasattr(data, 'all') else data)
+        self.context['image_references'] = load_image_references(items)
+        return super().to_representation(items)
+
+
+class ImageUploadSessionSerializer(serializers.Serializer):
+    """Параметры сессии возобновляемой загрузки; применяются при завершении"""
+    length = serializers.IntegerField(min_value=1)
+    filename = serializers.CharField(max_length=255)
+    compress = serializers.BooleanField(default=True)
+    crop = serializers.BooleanField(default=False)
+    encoder_profile = serializers.CharField(required=False)
+    
+    def validate_encoder_profile(self, value):
+        return validate_encoder_profile(value)
+
+
+class ImageBatchUploadSerializer(serializers.Serializer):
+    """Загрузка нескольких изображений одним multipart-запросом"""
+    files = serializers.ListField(
+        child=serializers.ImageField(
+            validators=[FileExtensionValidator(allowed_extensions=['jpg', 'jpeg', 'png', 'webp', 'gif', 'bmp', 'tiff'])]
+        ),
+        allow_empty=False
+    )
+    compress = serializers.BooleanField(default=True)
+    crop = serializers.BooleanField(default=False)
+    encoder_profile = serializers.CharField(required=False)
+    
+    def validate_encoder_profile(self, value):
+        return validate_encoder_profile(value)
+    
+    def validate_files(self, value):
+        max_files = getattr(settings, 'IMAGE_BATCH_MAX_FILES', 50)
+        if len(value) > max_files:
+            raise serializers.ValidationError(f"Максимум {max_files} файлов за один запрос")
+        return value
+    
+    def create(self, validated_data):
+        """
+        Создание записей одним bulk_create и запуск обработки группой задач.
+        Дубликаты (в базе и внутри пакета) переиспользуют существующие записи.
+        Возвращает список (имя файла, ImageUpload, дубликат) в порядке загрузки:
+        повтор файла внутри пакета - тоже дубликат первой его записи.
+        """
+        compress = validated_data['compress']
+        crop = validated_data['crop']
+        encoder_profile = validated_data.get('encoder_profile')
+        files = validated_data['files']
+        
+        hashes = [ImageUpload.compute_content_hash(f) for f in files]
+        existing = ImageUpload.objects.in_bulk(set(hashes), field_name='content_hash')
+        
+        results = []
+        new_images = {}
+        for uploaded, content_hash in zip(files, hashes):
+            duplicate = True
+            if content_hash in existing:
+                image_upload = existing[content_hash]
+                if not getattr(image_upload, 'reused', False):
+                    image_upload.reuse_for_upload(compress, crop, encoder_profile)
+            elif content_hash in new_images:
+                image_upload = new_images[content_hash]
+            else:
+                duplicate = False
+                image_upload = ImageUpload(
+                    original_image=uploaded,
+                    is_compressed=compress,
+                    is_cropped=crop,
+                    content_hash=content_hash,
+                )
+                if encoder_profile:
+                    image_upload.encoder_profile = encoder_profile
+                image_upload.reused = False
+                new_images[content_hash] = image_upload
+            results.append((uploaded.name, image_upload, duplicate))
+        
+        for image_upload in new_images.values():
+            image_upload.commit_original()
+        
+        try:
+            with transaction.atomic():
+                ImageUpload.objects.bulk_create(new_images.values())
+        except IntegrityError:
+            # Часть файлов параллельно загрузили в другом запросе:
+            # создаем записи по одной, совпавшие переиспользуем
+            return self.create_one_by_one(results, new_images, compress, crop, encoder_profile)
+        
+        ImageUpload.schedule_batch_processing(image.id for image in new_images.values())
+        return results
+    
+    def create_one_by_one(self, results, new_images, compress, crop, encoder_profile=None):
+        # Файлы, запись для которых параллельно создал другой запрос, - тоже дубликаты
+        raced = set()
+        for content_hash, image_upload in list(new_images.items()):
+            try:
+                with transaction.atomic():
+                    image_upload.save()
+            except IntegrityError:
+                image_upload.original_image.delete(save=False)
+                new_images[content_hash] = ImageUpload.objects.get(
+                    content_hash=content_hash
+                ).reuse_for_upload(compress, crop, encoder_profile)
+                raced.add(content_hash)
+        
+        return [
+            (
+                name,
+                new_images.get(image_upload.content_hash, image_upload),
+                duplicate or image_upload.content_hash in raced,
+            )
+            for name, image_upload, duplicate in results
+        ]
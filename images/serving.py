@@ -0,0 +1,37 @@
+import os
+from urllib.parse import quote
+from django.conf import settings
+from django.http import HttpResponse, FileResponse
+
+# Производные файлы называются по хэшу содержимого и никогда не перезаписываются
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def get_media_name(path):
+    """Имя файла относительно MEDIA_ROOT или None, если путь вне медиа"""
+    media_root = os.path.abspath(settings.MEDIA_ROOT)
+    path = os.path.abspath(path)
+    if os.path.commonpath([media_root, path]) != media_root:
+        return None
+    return os.path.relpath(path, media_root).replace(os.sep, '/')
+
+
+def media_file_response(path, content_type, file=None):
+    """
+    Ответ с файлом из хранилища. При IMAGE_MEDIA_ACCEL_REDIRECT тело
+    не проходит через Python: nginx получает X-Accel-Redirect на
+    internal-локацию IMAGE_MEDIA_ACCEL_PREFIX и отдает файл сам,
+    сохраняя заголовки ответа (Content-Type, Cache-Control, Vary).
+    Без nginx (разработка) файл отдается через FileResponse.
+    """
+    name = get_media_name(path)
+    
+    if getattr(settings, 'IMAGE_MEDIA_ACCEL_REDIRECT', False) and name is not None:
+        if file is not None:
+            file.close()
+        prefix = getattr(settings, 'IMAGE_MEDIA_ACCEL_PREFIX', '/protected-media/')
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = quote(f"{prefix.rstrip('/')}/{name}")
+        return response
+    
+    return FileResponse(file or open(path, 'rb'), content_type=content_type)
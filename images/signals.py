@@ -0,0 +1,22 @@
+from django.apps import apps
+from django.db.models.signals import post_delete, post_save
+from .references import delete_image_references, get_reference_fields, sync_image_references
+
+
+def sync_references_on_save(sender, instance, raw=False, **kwargs):
+    # При loaddata связанные записи могут быть еще не загружены
+    if raw:
+        return
+    sync_image_references(instance)
+
+
+def delete_references_on_delete(sender, instance, **kwargs):
+    delete_image_references(instance)
+
+
+def connect_reference_signals():
+    """Подписка на сохранение и удаление моделей из IMAGE_REFERENCE_FIELDS"""
+    for label in get_reference_fields():
+        model = apps.get_model(label)
+        post_save.connect(sync_references_on_save, sender=model, dispatch_uid=f'image_references_save_{label}')
+        post_delete.connect(delete_references_on_delete, sender=model, dispatch_uid=f'image_references_delete_{label}')
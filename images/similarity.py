@@ -0,0 +1,55 @@
+from itertools import combinations
+import numpy as np
+from PIL import Image
+
+# 64-битный dHash делится на 4 части по 16 бит для multi-index hashing
+HASH_SIZE = 8
+CHUNK_COUNT = 4
+CHUNK_BITS = 16
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+
+
+def compute_dhash(img):
+    """
+    Перцептивный хэш (dHash): изображение уменьшается до 9x8 в оттенках
+    серого, каждый бит - ярче ли пиксель своего соседа справа.
+    Устойчив к пересжатию, смене формата и масштаба. Возвращает
+    беззнаковое 64-битное число.
+    """
+    small = img.convert('L').resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.BOX)
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = pixels[:, 1:] > pixels[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def to_signed(value):
+    """Беззнаковый 64-битный хэш в диапазон BigIntegerField"""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def to_unsigned(value):
+    return value + (1 << 64) if value < 0 else value
+
+
+def split_hash(value):
+    """Части хэша по 16 бит, от старших к младшим"""
+    return [
+        (value >> (CHUNK_BITS * (CHUNK_COUNT - 1 - index))) & CHUNK_MASK
+        for index in range(CHUNK_COUNT)
+    ]
+
+
+def hamming_distance(a, b):
+    return bin(to_unsigned(a) ^ to_unsigned(b)).count('1')
+
+
+def chunk_neighbours(chunk, radius):
+    """Все 16-битные значения на расстоянии Хэмминга не больше radius от chunk"""
+    neighbours = [chunk]
+    for distance in range(1, radius + 1):
+        for bits in combinations(range(CHUNK_BITS), distance):
+            value = chunk
+            for bit in bits:
+                value ^= 1 << bit
+            neighbours.append(value)
+    return neighbours
@@ -0,0 +1,122 @@
+import os
+import shutil
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage, storages
+
+
+def get_image_storage():
+    """
+    Хранилище файлов изображений: STORAGES['images'] (локальный диск или
+    S3-совместимое), если задано, иначе default_storage. Передается в поля
+    моделей как callable, поэтому смена драйвера не требует миграций.
+    """
+    if 'images' in settings.STORAGES:
+        return storages['images']
+    return default_storage
+
+
+def get_local_path(name, storage=None):
+    """Путь к файлу на локальном диске или None для удаленного хранилища"""
+    storage = storage or get_image_storage()
+    try:
+        return storage.path(name)
+    except NotImplementedError:
+        return None
+
+
+def save_image_file(name, data):
+    """
+    Запись файла с хэшированным именем. Существующий файл не перезаписывается:
+    по построению имени в нем те же байты. Возвращает имя, под которым файл
+    сохранен (при гонке локальное хранилище может выбрать другое имя).
+    """
+    storage = get_image_storage()
+    if storage.exists(name):
+        return name
+    return storage.save(name, ContentFile(data))
+
+
+def iter_image_files(prefix):
+    """
+    Обход файлов хранилища под prefix без построения полного списка.
+    Возвращает (имя, размер, mtime). Локальный диск обходится через
+    os.scandir, S3 - листингом бакета (размер и дата приходят в листинге,
+    без отдельного запроса на файл), остальные хранилища - через listdir.
+    """
+    storage = get_image_storage()
+    local_root = get_local_path(prefix, storage)
+    
+    if local_root is not None:
+        location = os.path.abspath(storage.location)
+        stack = [local_root]
+        while stack:
+            path = stack.pop()
+            try:
+                with os.scandir(path) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            stat = entry.stat()
+                            name = os.path.relpath(entry.path, location).replace(os.sep, '/')
+                            yield name, stat.st_size, stat.st_mtime
+            except FileNotFoundError:
+                continue
+        return
+    
+    bucket = getattr(storage, 'bucket', None)
+    if bucket is not None:
+        location = storage.location.strip('/')
+        key_prefix = f'{location}/{prefix}/' if location else f'{prefix}/'
+        for obj in bucket.objects.filter(Prefix=key_prefix):
+            name = obj.key[len(location) + 1:] if location else obj.key
+            yield name, obj.size, obj.last_modified.timestamp()
+        return
+    
+    stack = [prefix]
+    while stack:
+        directory = stack.pop()
+        dirs, files = storage.listdir(directory)
+        stack.extend(f'{directory}/{name}' for name in dirs)
+        for filename in files:
+            name = f'{directory}/{filename}'
+            yield name, storage.size(name), storage.get_modified_time(name).timestamp()
+
+
+def copy_image_file(source, target):
+    """
+    Копия файла хранилища под новым именем (для переноса в другой каталог).
+    Локальный диск - жесткая ссылка (без копирования байтов), S3 - копирование
+    на стороне сервера с сохранением метаданных (Cache-Control, Content-Type),
+    остальные хранилища - чтение и запись. Существующий target не трогается.
+    """
+    storage = get_image_storage()
+    if storage.exists(target):
+        return
+    if not storage.exists(source):
+        raise FileNotFoundError(f'File does not exist: {source}')
+    
+    source_path = get_local_path(source, storage)
+    if source_path is not None:
+        target_path = storage.path(target)
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        try:
+            os.link(source_path, target_path)
+        except OSError:
+            shutil.copy2(source_path, target_path)
+        return
+    
+    bucket = getattr(storage, 'bucket', None)
+    if bucket is not None:
+        location = storage.location.strip('/')
+        source_key = f'{location}/{source}' if location else source
+        target_key = f'{location}/{target}' if location else target
+        bucket.Object(target_key).copy_from(
+            CopySource={'Bucket': bucket.name, 'Key': source_key},
+            MetadataDirective='COPY',
+        )
+        return
+    
+    with storage.open(source, 'rb') as file:
+        storage.save(target, file)
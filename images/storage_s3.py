@@ -0,0 +1,25 @@
+from boto3.s3.transfer import TransferConfig
+from django.conf import settings
+from storages.backends.s3 import S3Storage
+
+
+class ImageS3Storage(S3Storage):
+    """
+    S3-совместимое хранилище изображений (AWS S3, MinIO, Yandex Object Storage).
+    Объекты больше IMAGE_S3_MULTIPART_THRESHOLD загружаются multipart upload,
+    части по IMAGE_S3_MULTIPART_CHUNKSIZE отправляются параллельно
+    в IMAGE_S3_MAX_CONCURRENCY потоков.
+    Требует django-storages[s3] (boto3).
+    """
+    
+    def __init__(self, **options):
+        # Иначе django-storages не проверяет наличие объекта (exists() всегда False),
+        # а запись производных с хэшированными именами на это опирается
+        options.setdefault('file_overwrite', False)
+        options.setdefault('transfer_config', TransferConfig(
+            multipart_threshold=getattr(settings, 'IMAGE_S3_MULTIPART_THRESHOLD', 8 * 1024 * 1024),
+            multipart_chunksize=getattr(settings, 'IMAGE_S3_MULTIPART_CHUNKSIZE', 8 * 1024 * 1024),
+            max_concurrency=getattr(settings, 'IMAGE_S3_MAX_CONCURRENCY', 10),
+            use_threads=True,
+        ))
+        super().__init__(**options)
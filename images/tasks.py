@@ -0,0 +1,122 @@
+from celery import shared_task
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from .admission import PROCESSING_SLOTS, SlotUnavailable, host_slot
+from .models import TRANSIENT_PROCESSING_ERRORS, ImageUpload, FileDeletion
+from .render import CACHE_DELETION_PREFIX, delete_cached_renders
+from .storage import get_image_storage
+from .upload_sessions import purge_expired_sessions
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(bind=True, acks_late=True, ignore_result=True, max_retries=None)
+def process_image_task(self, image_id):
+    """
+    Задача обработки загруженного изображения (сжатие, обрезка).
+    Выполняется в слоте обработки хоста: если все слоты заняты дольше
+    IMAGE_PROCESSING_SLOT_TIMEOUT, задача возвращается в очередь.
+    Временные сбои хранилища и базы повторяются с нарастающей паузой
+    (до IMAGE_PROCESSING_MAX_RETRIES раз), статус failed ставится только
+    для ошибок самого файла или после исчерпания повторов.
+    """
+    image_upload = ImageUpload.objects.filter(id=image_id).first()
+    
+    if not image_upload:
+        logger.warning(f"Image {image_id} not found, skipping processing")
+        return
+    
+    if image_upload.status == ImageUpload.STATUS_DONE:
+        logger.info(f"Image {image_id} already processed, skipping")
+        return
+    
+    try:
+        with host_slot(PROCESSING_SLOTS, getattr(settings, 'IMAGE_PROCESSING_SLOT_TIMEOUT', 60)):
+            image_upload.process_image()
+    except SlotUnavailable:
+        logger.info(f"No processing slot for image {image_id}, retrying later")
+        raise self.retry(countdown=getattr(settings, 'IMAGE_PROCESSING_RETRY_AFTER', 30))
+    except TRANSIENT_PROCESSING_ERRORS as e:
+        max_retries = getattr(settings, 'IMAGE_PROCESSING_MAX_RETRIES', 5)
+        if self.request.retries >= max_retries:
+            image_upload.mark_failed(e)
+            return
+        
+        countdown = min(
+            getattr(settings, 'IMAGE_PROCESSING_RETRY_AFTER', 30) * 2 ** self.request.retries,
+            getattr(settings, 'IMAGE_PROCESSING_RETRY_AFTER_MAX', 300),
+        )
+        logger.warning(f"Transient error processing image {image_id}, retrying in {countdown}s: {str(e)}")
+        raise self.retry(exc=e, countdown=countdown)
+    except Exception as e:
+        # Статус failed и текст ошибки уже сохранены в process_image
+        logger.error(f"Image processing task failed for {image_id}: {str(e)}")
+
+
+@shared_task(ignore_result=True)
+def purge_file_deletions(batch_size=500, max_attempts=5):
+    """
+    Удаление файлов из очереди FileDeletion пачками.
+    Строки блокируются с SKIP LOCKED, поэтому несколько воркеров
+    не мешают друг другу; запись удаляется только вместе с файлом.
+    Запускается после удаления изображений и периодически (beat),
+    чтобы дочистить очередь после сбоев. Записи с CACHE_DELETION_PREFIX -
+    файлы кэша рендера: они удаляются одним обходом каталога кэша на пачку.
+    """
+    storage = get_image_storage()
+    purged = 0
+    
+    while True:
+        with transaction.atomic():
+            batch = list(
+                FileDeletion.objects.select_for_update(skip_locked=True)
+                .filter(attempts__lt=max_attempts)[:batch_size]
+            )
+            if not batch:
+                break
+            
+            done_ids = []
+            cache_deletions = [deletion for deletion in batch if deletion.name.startswith(CACHE_DELETION_PREFIX)]
+            if cache_deletions:
+                try:
+                    delete_cached_renders(deletion.name[len(CACHE_DELETION_PREFIX):] for deletion in cache_deletions)
+                    done_ids.extend(deletion.id for deletion in cache_deletions)
+                except Exception as e:
+                    logger.warning(f"Error deleting render cache files: {str(e)}")
+                    FileDeletion.objects.filter(id__in=[deletion.id for deletion in cache_deletions]).update(
+                        attempts=F('attempts') + 1, last_error=str(e)
+                    )
+            
+            for deletion in batch:
+                if deletion.name.startswith(CACHE_DELETION_PREFIX):
+                    continue
+                try:
+                    # Отсутствующий файл не считается ошибкой
+                    storage.delete(deletion.name)
+                    done_ids.append(deletion.id)
+                except Exception as e:
+                    logger.warning(f"Error deleting file {deletion.name}: {str(e)}")
+                    deletion.attempts += 1
+                    deletion.last_error = str(e)
+                    deletion.save(update_fields=['attempts', 'last_error'])
+            
+            FileDeletion.objects.filter(id__in=done_ids).delete()
+            purged += len(done_ids)
+            
+            if len(batch) < batch_size:
+                break
+    
+    if purged:
+        logger.info(f"Purged {purged} deleted image files")
+    return purged
+
+
+@shared_task(ignore_result=True)
+def purge_upload_sessions():
+    """Удаление истекших сессий возобновляемой загрузки (периодически, beat)"""
+    purged = purge_expired_sessions()
+    if purged:
+        logger.info(f"Purged {purged} expired upload sessions")
+    return purged
@@ -1,3 +1,432 @@
-from django.test import TestCase
+import base64
+import io
+import os
+import shutil
+import tempfile
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import IntegrityError
+from django.test import override_settings
+from django.urls import reverse
+from PIL import Image
+from rest_framework.test import APITestCase
+from .models import FileDeletion, ImageUpload, ImageUploadQuerySet, ImageVariant
+from .render import build_render_url, get_cache_dir
+from .tasks import purge_file_deletions
 
-# Create your tests here.
+TEST_ROOT = tempfile.mkdtemp(prefix='image-tests-')
+
+
+def make_image(name='photo.jpg', size=(800, 600), color=(200, 10, 10), fmt='JPEG'):
+    """Файл изображения для загрузки через тестовый клиент"""
+    data = io.BytesIO()
+    Image.new('RGB', size, color).save(data, fmt)
+    data.seek(0)
+    data.name = name
+    return data
+
+
+@override_settings(
+    MEDIA_ROOT=os.path.join(TEST_ROOT, 'media'),
+    IMAGE_RENDER_CACHE_DIR=os.path.join(TEST_ROOT, 'render-cache'),
+    IMAGE_UPLOAD_SESSION_DIR=os.path.join(TEST_ROOT, 'sessions'),
+    IMAGE_SLOT_DIR=os.path.join(TEST_ROOT, 'slots'),
+    IMAGE_PROCESSING_ASYNC=False,
+    # Одна ширина и один формат без подбора качества: обработка за доли секунды
+    IMAGE_VARIANT_WIDTHS=[320],
+    IMAGE_VARIANT_FORMATS=['webp'],
+    IMAGE_DEFAULT_ENCODER_PROFILE='fixed',
+)
+class ImageAPITestCase(APITestCase):
+    """Общая настройка: файлы во временном каталоге, обработка синхронно после коммита"""
+    
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEST_ROOT, ignore_errors=True)
+    
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username='editor', email='editor@example.com', password='x')
+        self.client.force_authenticate(self.user)
+    
+    def upload(self, image=None, **data):
+        """POST /backend/images/ с обработкой, отложенной до on_commit"""
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('image-list'), {'original_image': image or make_image(), **data}, format='multipart'
+            )
+        return response
+    
+    def get_status(self, image_id):
+        return self.client.get(reverse('image-processing-status', kwargs={'pk': image_id})).data['status']
+
+
+class ImageUploadTests(ImageAPITestCase):
+    def test_upload_is_accepted_and_processed_in_background(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(reverse('image-list'), {'original_image': make_image()}, format='multipart')
+        
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['status'], ImageUpload.STATUS_PENDING)
+        self.assertFalse(response.data['duplicate'])
+        self.assertEqual(self.get_status(response.data['id']), ImageUpload.STATUS_PENDING)
+        
+        for callback in callbacks:
+            callback()
+        image = ImageUpload.objects.get(id=response.data['id'])
+        self.assertEqual(image.status, ImageUpload.STATUS_DONE)
+        self.assertTrue(image.processed_image)
+        self.assertEqual(image.processed_key, os.path.splitext(os.path.basename(image.processed_image.name))[0])
+        self.assertTrue(image.variants.filter(kind=ImageVariant.KIND_RESPONSIVE, format='webp').exists())
+        self.assertIsNotNone(image.dhash)
+    
+    def test_decode_error_marks_image_failed(self):
+        with mock.patch('images.models.decode_for_size', side_effect=ValueError('broken file')):
+            response = self.upload()
+        
+        image = ImageUpload.objects.get(id=response.data['id'])
+        self.assertEqual(image.status, ImageUpload.STATUS_FAILED)
+        self.assertEqual(image.processing_error, 'broken file')
+    
+    def test_transient_error_is_retried(self):
+        original = ImageUpload.process_image
+        calls = []
+        
+        def flaky(image):
+            calls.append(image.id)
+            if len(calls) == 1:
+                raise ConnectionError('storage timeout')
+            return original(image)
+        
+        with mock.patch.object(ImageUpload, 'process_image', flaky):
+            response = self.upload()
+        
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(self.get_status(response.data['id']), ImageUpload.STATUS_DONE)
+    
+    @override_settings(IMAGE_PROCESSING_MAX_RETRIES=2)
+    def test_transient_error_marks_failed_after_retries(self):
+        with mock.patch.object(ImageUpload, 'process_image', side_effect=TimeoutError('storage timeout')) as process:
+            response = self.upload()
+        
+        self.assertEqual(process.call_count, 3)
+        image = ImageUpload.objects.get(id=response.data['id'])
+        self.assertEqual(image.status, ImageUpload.STATUS_FAILED)
+        self.assertEqual(image.processing_error, 'storage timeout')
+    
+    def test_same_file_reuses_existing_image(self):
+        first = self.upload(make_image(color=(1, 2, 3)))
+        second = self.upload(make_image('copy.jpg', color=(1, 2, 3)))
+        
+        self.assertEqual(second.status_code, 200)
+        self.assertTrue(second.data['duplicate'])
+        self.assertEqual(second.data['id'], first.data['id'])
+        self.assertEqual(ImageUpload.objects.count(), 1)
+    
+    def test_duplicate_with_new_options_is_reprocessed(self):
+        first = self.upload(make_image(color=(1, 2, 3)))
+        second = self.upload(make_image(color=(1, 2, 3)), crop=True)
+        
+        self.assertEqual(second.data['id'], first.data['id'])
+        image = ImageUpload.objects.get(id=first.data['id'])
+        self.assertTrue(image.is_cropped)
+        self.assertTrue(image.cropped_image)
+    
+    def test_replacing_original_resets_hash_and_reprocesses(self):
+        image_id = self.upload(make_image(color=(1, 2, 3))).data['id']
+        before = ImageUpload.objects.get(id=image_id)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                reverse('image-detail', kwargs={'pk': image_id}),
+                {'original_image': make_image('new.jpg', size=(640, 480), color=(9, 200, 30))},
+                format='multipart',
+            )
+        
+        self.assertEqual(response.status_code, 200)
+        after = ImageUpload.objects.get(id=image_id)
+        self.assertNotEqual(after.content_hash, before.content_hash)
+        self.assertEqual(after.original_width, 640)
+        self.assertNotEqual(after.processed_image.name, before.processed_image.name)
+        self.assertEqual(after.status, ImageUpload.STATUS_DONE)
+        self.assertFalse(after.original_image.storage.exists(before.original_image.name))
+        
+        # Старый файл загружается заново как новое изображение, а не дубликат замененного
+        response = self.upload(make_image(color=(1, 2, 3)))
+        self.assertFalse(response.data['duplicate'])
+        self.assertNotEqual(response.data['id'], image_id)
+
+
+class FindBySlugTests(ImageAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.image = ImageUpload.objects.get(id=self.upload(crop=True).data['id'])
+    
+    def find(self, slug):
+        return self.client.get(reverse('image-find-by-slug'), {'slug': slug})
+    
+    def test_finds_image_by_url_of_any_file(self):
+        variant = self.image.variants.first()
+        slugs = [
+            self.image.original_image.name,
+            f'https://cdn.example.com{self.image.processed_image.url}?v=2',
+            self.image.cropped_image.url,
+            os.path.basename(variant.file.name),
+        ]
+        for slug in slugs:
+            with self.subTest(slug=slug):
+                response = self.find(slug)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.data['image']['id'], self.image.id)
+    
+    def test_lookup_is_a_single_query(self):
+        with self.assertNumQueries(1):
+            ImageUpload.objects.find_by_slug(self.image.processed_image.url)
+    
+    def test_unknown_and_missing_slug(self):
+        self.assertEqual(self.find('images/processed/00/00/unknown.webp').status_code, 404)
+        self.assertEqual(self.client.get(reverse('image-find-by-slug')).status_code, 400)
+
+
+class BatchUploadTests(ImageAPITestCase):
+    def batch_upload(self, files):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('image-batch-upload'), {'files': files}, format='multipart')
+    
+    def test_batch_creates_images_and_reports_in_batch_duplicates(self):
+        response = self.batch_upload([
+            make_image('a.jpg', color=(1, 1, 1)),
+            make_image('b.jpg', color=(2, 2, 2)),
+            make_image('a-again.jpg', color=(1, 1, 1)),
+        ])
+        
+        self.assertEqual(response.status_code, 202)
+        results = response.data['results']
+        self.assertEqual([item['duplicate'] for item in results], [False, False, True])
+        self.assertEqual(results[0]['id'], results[2]['id'])
+        self.assertEqual(ImageUpload.objects.count(), 2)
+        self.assertEqual(
+            set(ImageUpload.objects.values_list('status', flat=True)), {ImageUpload.STATUS_DONE}
+        )
+    
+    def test_batch_falls_back_to_one_by_one_on_conflict(self):
+        existing_id = self.upload(make_image(color=(1, 1, 1))).data['id']
+        
+        # Запись с тем же хэшем появилась после проверки: bulk_create упирается в unique
+        with mock.patch.object(ImageUploadQuerySet, 'in_bulk', return_value={}):
+            response = self.batch_upload([make_image('a.jpg', color=(1, 1, 1)), make_image('b.jpg', color=(2, 2, 2))])
+        
+        results = response.data['results']
+        self.assertEqual(results[0]['id'], existing_id)
+        self.assertTrue(results[0]['duplicate'])
+        self.assertFalse(results[1]['duplicate'])
+        self.assertEqual(ImageUpload.objects.count(), 2)
+    
+    def test_bulk_create_conflict_is_an_integrity_error(self):
+        self.upload(make_image(color=(1, 1, 1)))
+        duplicate = ImageUpload(content_hash=ImageUpload.objects.get().content_hash, original_image='x.jpg')
+        with self.assertRaises(IntegrityError):
+            ImageUpload.objects.bulk_create([duplicate])
+
+
+class FileDeletionTests(ImageAPITestCase):
+    def test_bulk_delete_queues_files_and_purge_removes_them(self):
+        images = [
+            ImageUpload.objects.get(id=self.upload(make_image(color=color)).data['id'])
+            for color in [(1, 1, 1), (2, 2, 2)]
+        ]
+        names = {
+            name
+            for image in images
+            for name in [image.original_image.name, image.processed_image.name, *image.variants.values_list('file', flat=True)]
+        }
+        storage = images[0].original_image.storage
+        
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.delete(
+                reverse('image-bulk-delete'),
+                {'ids': [images[0].id], 'urls': [images[1].processed_image.url]},
+                format='json',
+            )
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(response.data['ids']), sorted(image.id for image in images))
+        self.assertFalse(ImageUpload.objects.exists())
+        # Файлы удаляются только задачей после коммита
+        self.assertTrue(names <= set(FileDeletion.objects.values_list('name', flat=True)))
+        self.assertTrue(all(storage.exists(name) for name in names))
+        
+        for callback in callbacks:
+            callback()
+        self.assertFalse(FileDeletion.objects.exists())
+        self.assertFalse(any(storage.exists(name) for name in names))
+    
+    def test_failed_deletion_stays_in_queue(self):
+        FileDeletion.objects.create(name='images/original/00/00/missing.jpg')
+        
+        with mock.patch('django.core.files.storage.FileSystemStorage.delete', side_effect=OSError('busy')):
+            self.assertEqual(purge_file_deletions(), 0)
+        
+        deletion = FileDeletion.objects.get()
+        self.assertEqual(deletion.attempts, 1)
+        self.assertEqual(deletion.last_error, 'busy')
+
+
+class RenderTests(ImageAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.image_id = self.upload(make_image(size=(600, 400))).data['id']
+    
+    def test_signed_url_renders_and_caches(self):
+        url = build_render_url(self.image_id, 200, 200, 'cover', 'webp')
+        
+        response = self.client.get(url)
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        with Image.open(io.BytesIO(b''.join(response.streaming_content))) as rendered:
+            self.assertEqual(rendered.size, (200, 200))
+        self.assertEqual(len(os.listdir(get_cache_dir())), 1)
+    
+    def test_invalid_signature_is_rejected(self):
+        url = build_render_url(self.image_id, 200, 200, 'cover', 'webp')
+        tampered = [
+            url.replace('w=200', 'w=300'),
+            url.replace('fit=cover', 'fit=contain'),
+            url.rsplit('&sig=', 1)[0],
+            url[:-1] + ('0' if url[-1] != '0' else '1'),
+            build_render_url(self.image_id, 200, 200, 'cover', 'webp').replace(f'/{self.image_id}/', f'/{self.image_id + 1}/'),
+        ]
+        for candidate in tampered:
+            with self.subTest(url=candidate):
+                self.assertEqual(self.client.get(candidate).status_code, 403)
+        self.assertFalse(os.path.exists(get_cache_dir()) and os.listdir(get_cache_dir()))
+    
+    def test_signature_is_bound_to_signing_key(self):
+        url = build_render_url(self.image_id, 200, 200, 'cover', 'webp')
+        
+        with override_settings(IMAGE_RENDER_SIGNING_KEY='rotated'):
+            self.assertEqual(self.client.get(url).status_code, 403)
+    
+    def test_cache_files_are_deleted_with_image(self):
+        self.client.get(build_render_url(self.image_id, 200, 200, 'cover', 'webp'))
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(reverse('image-detail', kwargs={'pk': self.image_id}))
+        
+        self.assertEqual(os.listdir(get_cache_dir()), [])
+
+
+class UploadSessionTests(ImageAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.data = make_image(size=(300, 200)).getvalue()
+    
+    def create_session(self, length=None):
+        filename = base64.b64encode(b'large.jpg').decode()
+        response = self.client.post(
+            reverse('image-create-upload-session'),
+            HTTP_UPLOAD_LENGTH=str(length or len(self.data)),
+            HTTP_UPLOAD_METADATA=f'filename {filename}',
+        )
+        self.assertEqual(response.status_code, 201)
+        return response['Location']
+    
+    def patch(self, url, chunk, offset):
+        return self.client.generic(
+            'PATCH', url, chunk,
+            content_type='application/offset+octet-stream',
+            HTTP_UPLOAD_OFFSET=str(offset),
+        )
+    
+    def test_chunks_are_appended_at_offset_and_finalized(self):
+        url = self.create_session()
+        middle = len(self.data) // 2
+        
+        response = self.patch(url, self.data[:middle], 0)
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(int(response['Upload-Offset']), middle)
+        self.assertEqual(int(self.client.head(url)['Upload-Offset']), middle)
+        
+        response = self.client.post(f'{url}finalize/')
+        self.assertEqual(response.status_code, 409)
+        
+        self.patch(url, self.data[middle:], middle)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'{url}finalize/')
+        
+        self.assertEqual(response.status_code, 202)
+        image = ImageUpload.objects.get(id=response.data['id'])
+        self.assertEqual(image.original_size, len(self.data))
+        self.assertEqual(image.status, ImageUpload.STATUS_DONE)
+        self.assertEqual(self.client.head(url).status_code, 404)
+    
+    def test_offset_mismatch_is_a_conflict(self):
+        url = self.create_session()
+        self.patch(url, self.data[:100], 0)
+        
+        response = self.patch(url, self.data[50:150], 50)
+        
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['offset'], 100)
+        self.assertEqual(int(response['Upload-Offset']), 100)
+    
+    def test_chunk_requires_offset_content_type(self):
+        url = self.create_session()
+        
+        response = self.client.generic('PATCH', url, self.data[:100], content_type='application/octet-stream', HTTP_UPLOAD_OFFSET='0')
+        
+        self.assertEqual(response.status_code, 415)
+    
+    def test_non_image_is_rejected_after_header(self):
+        url = self.create_session(length=4096)
+        
+        response = self.patch(url, b'not an image' * 100, 0)
+        
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.head(url).status_code, 404)
+    
+    def test_session_of_another_user_is_not_found(self):
+        url = self.create_session()
+        other = get_user_model().objects.create_user(username='other', email='other@example.com', password='x')
+        self.client.force_authenticate(other)
+        
+        self.assertEqual(self.patch(url, self.data, 0).status_code, 404)
+    
+    @override_settings(IMAGE_UPLOAD_SESSION_TTL=-1)
+    def test_expired_session_is_not_found(self):
+        url = self.create_session()
+        
+        self.assertEqual(self.client.head(url).status_code, 404)
+
+
+class ProcessingQueueThrottleTests(ImageAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.image_id = self.upload().data['id']
+        ImageUpload.objects.filter(id=self.image_id).update(status=ImageUpload.STATUS_PENDING)
+        cache.clear()
+    
+    @override_settings(IMAGE_PROCESSING_QUEUE_LIMIT=1)
+    def test_uploads_get_429_while_queue_is_full(self):
+        response = self.client.post(reverse('image-list'), {'original_image': make_image(color=(5, 5, 5))}, format='multipart')
+        
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+        self.assertEqual(ImageUpload.objects.count(), 1)
+        self.assertEqual(self.client.get(reverse('image-list')).status_code, 200)
+    
+    @override_settings(IMAGE_PROCESSING_QUEUE_LIMIT=1)
+    def test_only_updates_that_enqueue_processing_are_throttled(self):
+        url = reverse('image-detail', kwargs={'pk': self.image_id})
+        
+        self.assertEqual(self.client.patch(url, {'is_compressed': 'false'}, format='multipart').status_code, 200)
+        self.assertEqual(self.client.patch(url, {'encoder_profile': 'standard'}, format='multipart').status_code, 429)
+    
+    @override_settings(IMAGE_PROCESSING_QUEUE_LIMIT=2)
+    def test_uploads_pass_below_limit(self):
+        response = self.upload(make_image(color=(5, 5, 5)))
+        
+        self.assertEqual(response.status_code, 202)
@@ -0,0 +1,242 @@
+"""
+Сессии возобновляемой загрузки (по мотивам протокола tus). Сессия - каталог
+на диске с файлом data (принятые байты) и info.json (заявленная длина, имя,
+параметры обработки, владелец, срок жизни). Смещение - текущий размер data,
+поэтому после обрыва клиент узнает его HEAD-запросом и продолжает с того же
+места. Каталог должен быть общим для всех экземпляров приложения.
+"""
+import base64
+import binascii
+import fcntl
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from .uploadhandlers import SNIFF_BYTES, sniff_image_format
+
+SESSION_ID_PATTERN = r'[0-9a-f]{32}'
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class UploadSessionError(Exception):
+    """Ошибка протокола; status - HTTP-код ответа"""
+    status = 400
+
+
+class SessionNotFound(UploadSessionError):
+    status = 404
+
+
+class OffsetMismatch(UploadSessionError):
+    status = 409
+
+
+class SessionBusy(UploadSessionError):
+    status = 423
+
+
+class InvalidImage(UploadSessionError):
+    status = 400
+
+
+def parse_upload_metadata(header):
+    """Заголовок tus Upload-Metadata: пары "ключ base64(значение)" через запятую"""
+    metadata = {}
+    for pair in (header or '').split(','):
+        key, _, value = pair.strip().partition(' ')
+        if not key:
+            continue
+        try:
+            metadata[key] = base64.b64decode(value).decode() if value else ''
+        except (binascii.Error, UnicodeDecodeError):
+            raise UploadSessionError(f'Некорректное значение {key} в Upload-Metadata')
+    return metadata
+
+
+def get_sessions_dir():
+    return getattr(settings, 'IMAGE_UPLOAD_SESSION_DIR', os.path.join(settings.BASE_DIR, 'upload_sessions'))
+
+
+def get_session_ttl():
+    return getattr(settings, 'IMAGE_UPLOAD_SESSION_TTL', 24 * 60 * 60)
+
+
+class UploadSession:
+    def __init__(self, session_id, info):
+        self.id = session_id
+        self.info = info
+        self.path = os.path.join(get_sessions_dir(), session_id)
+        self.data_path = os.path.join(self.path, 'data')
+    
+    @classmethod
+    def create(cls, user_id, length, filename, options):
+        session = cls(uuid.uuid4().hex, {
+            'user_id': user_id,
+            'length': length,
+            'filename': filename,
+            'options': options,
+            'created_at': time.time(),
+        })
+        os.makedirs(session.path)
+        open(session.data_path, 'wb').close()
+        session.touch()
+        return session
+    
+    @classmethod
+    def load(cls, session_id):
+        """Сессия по id или None, если ее нет или она истекла"""
+        if not re.fullmatch(SESSION_ID_PATTERN, session_id or ''):
+            return None
+        session = cls(session_id, {})
+        try:
+            with open(os.path.join(session.path, 'info.json')) as info:
+                session.info = json.load(info)
+        except (FileNotFoundError, ValueError):
+            return None
+        if session.is_expired:
+            session.delete()
+            return None
+        return session
+    
+    @property
+    def length(self):
+        return self.info['length']
+    
+    @property
+    def offset(self):
+        try:
+            return os.path.getsize(self.data_path)
+        except FileNotFoundError:
+            return 0
+    
+    @property
+    def expires_at(self):
+        return self.info['expires_at']
+    
+    @property
+    def is_expired(self):
+        return self.info.get('expires_at', 0) < time.time()
+    
+    @property
+    def is_complete(self):
+        return self.offset == self.length
+    
+    def touch(self):
+        """Продление срока жизни после активности; info.json пишется атомарно"""
+        self.info['expires_at'] = time.time() + get_session_ttl()
+        tmp_path = os.path.join(self.path, 'info.json.tmp')
+        with open(tmp_path, 'w') as info:
+            json.dump(self.info, info)
+        os.replace(tmp_path, os.path.join(self.path, 'info.json'))
+    
+    @contextmanager
+    def lock(self):
+        """
+        Эксклюзивная блокировка сессии: дозапись и завершение не идут
+        параллельно, второй запрос сразу получает отказ, а не ждет.
+        """
+        try:
+            data = open(self.data_path, 'ab')
+        except FileNotFoundError:
+            raise SessionNotFound('Сессия загрузки завершена или удалена')
+        with data:
+            try:
+                fcntl.flock(data, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise SessionBusy('Сессия занята другим запросом')
+            yield data
+    
+    def append(self, stream, offset, content_length):
+        """
+        Дозапись content_length байт из stream с позиции offset, чанками
+        по 64 КБ. При обрыве соединения принятая часть остается, клиент
+        продолжит с нового смещения. Возвращает новое смещение.
+        """
+        with self.lock() as data:
+            current = data.seek(0, os.SEEK_END)
+            if offset != current:
+                raise OffsetMismatch(f'Смещение {offset} не совпадает с принятым {current}')
+            if offset + content_length > self.length:
+                raise UploadSessionError('Данные выходят за заявленную длину загрузки')
+            
+            remaining = content_length
+            try:
+                while remaining:
+                    chunk = stream.read(min(READ_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    data.write(chunk)
+                    remaining -= len(chunk)
+            finally:
+                data.flush()
+                self.touch()
+            
+            current = data.tell()
+        
+        # Формат проверяется, как только пришел заголовок: не тратим трафик на не-изображение
+        if offset < SNIFF_BYTES and (current >= SNIFF_BYTES or current == self.length):
+            with open(self.data_path, 'rb') as data:
+                if sniff_image_format(data.read(SNIFF_BYTES)) is None:
+                    self.delete()
+                    raise InvalidImage('Файл не является изображением поддерживаемого формата')
+        return current
+    
+    def get_file(self):
+        """Принятый файл для сериализатора загрузки (без копирования)"""
+        with open(self.data_path, 'rb') as data:
+            content_type = sniff_image_format(data.read(SNIFF_BYTES))
+        return SessionUploadedFile(self.data_path, self.info['filename'], content_type, self.length)
+    
+    def delete(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+class SessionUploadedFile(UploadedFile):
+    """
+    Файл сессии в роли загруженного. Как и TemporaryUploadedFile, отдает
+    temporary_file_path: проверка Pillow читает файл с диска, а локальное
+    хранилище переносит его на место вместо копирования.
+    """
+    
+    def __init__(self, path, name, content_type, size):
+        super().__init__(open(path, 'rb'), name, content_type, size)
+        self.path = path
+    
+    def temporary_file_path(self):
+        return self.path
+    
+    def close(self):
+        try:
+            return self.file.close()
+        except FileNotFoundError:
+            pass
+
+
+def purge_expired_sessions():
+    """Удаление истекших и поврежденных сессий. Возвращает число удаленных"""
+    sessions_dir = get_sessions_dir()
+    now = time.time()
+    purged = 0
+    try:
+        entries = list(os.scandir(sessions_dir))
+    except FileNotFoundError:
+        return 0
+    
+    for entry in entries:
+        if not entry.is_dir(follow_symlinks=False):
+            continue
+        try:
+            with open(os.path.join(entry.path, 'info.json')) as info:
+                expires_at = json.load(info).get('expires_at', 0)
+        except (FileNotFoundError, ValueError):
+            # Без info.json (сбой при создании) - по времени изменения каталога
+            expires_at = entry.stat().st_mtime + get_session_ttl()
+        if expires_at < now:
+            shutil.rmtree(entry.path, ignore_errors=True)
+            purged += 1
+    return purged
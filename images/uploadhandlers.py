@@ -0,0 +1,88 @@
+import hashlib
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+# Сигнатуры форматов, которые принимает ImageUpload.original_image
+IMAGE_SIGNATURES = [
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'BM', 'image/bmp'),
+    (b'II*\x00', 'image/tiff'),
+    (b'MM\x00*', 'image/tiff'),
+]
+# Байт заголовка, достаточных для определения формата
+SNIFF_BYTES = 12
+
+
+class UploadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Файл слишком большой'
+    default_code = 'upload_too_large'
+
+
+def sniff_image_format(header):
+    """MIME-тип по первым байтам файла или None, если это не поддерживаемое изображение"""
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'image/webp'
+    for signature, mime_type in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return mime_type
+    return None
+
+
+class StreamingImageUploadHandler(TemporaryFileUploadHandler):
+    """
+    Загрузка изображения потоком во временный файл: память на запрос -
+    один чанк независимо от размера файла. По ходу записи считается
+    SHA-256 (file.content_hash, повторно файл не читается), формат
+    определяется по сигнатуре первых байт и проверяется MAX_IMAGE_SIZE -
+    неподходящий файл отклоняется, не дожидаясь конца передачи.
+    Готовый TemporaryUploadedFile хранилище переносит на место без копирования.
+    """
+    
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.sha256 = hashlib.sha256()
+        self.header = b''
+        self.received = 0
+        self.max_size = getattr(settings, 'MAX_IMAGE_SIZE', 128 * 1024 * 1024)
+    
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > self.max_size:
+            self.reject(UploadTooLarge(f'Файл {self.file_name} больше {self.max_size // (1024 * 1024)} МБ'))
+        
+        if len(self.header) < SNIFF_BYTES:
+            self.header += raw_data[:SNIFF_BYTES - len(self.header)]
+            if len(self.header) >= SNIFF_BYTES:
+                self.check_format()
+        
+        self.sha256.update(raw_data)
+        self.file.write(raw_data)
+    
+    def file_complete(self, file_size):
+        # Файл короче заголовка сигнатуры - проверяем то, что есть
+        if len(self.header) < SNIFF_BYTES:
+            self.check_format()
+        
+        file = super().file_complete(file_size)
+        file.content_hash = self.sha256.hexdigest()
+        return file
+    
+    def check_format(self):
+        mime_type = sniff_image_format(self.header)
+        if mime_type is None:
+            self.reject(ValidationError({
+                self.field_name: [f'Файл {self.file_name} не является изображением поддерживаемого формата']
+            }))
+        # Тип по содержимому, а не заявленный клиентом
+        self.file.content_type = mime_type
+    
+    def reject(self, error):
+        """Удаление временного файла и прерывание разбора запроса с ответом 4xx"""
+        self.upload_interrupted()
+        raise error
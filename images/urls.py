@@ -1,6 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from . import views
+from .negotiation import ImageContentNegotiation
 
 # Попробуем несколько вариантов
 router = DefaultRouter()
@@ -16,6 +17,13 @@ urlpatterns = [
     path('create/', views.ImageUploadViewSet.as_view({'post': 'create'}), name='image-create-direct'),
     path('debug/', views.ImageUploadViewSet.as_view({'get': 'debug_routes'}), name='image-debug-direct'),
     
+    # Файлы изображений с проверкой по базе, тело отдает nginx (X-Accel-Redirect)
+    path(
+        'media/<path:name>',
+        views.ImageUploadViewSet.as_view({'get': 'media'}, content_negotiation_class=ImageContentNegotiation),
+        name='image-media'
+    ),
+    
     # Пути с ID
     path('<int:pk>/', views.ImageUploadViewSet.as_view({
         'get': 'retrieve',
@@ -1,19 +1,43 @@
 from rest_framework import viewsets, status
 from rest_framework.response import Response
 from rest_framework.filters import OrderingFilter
-from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.decorators import action
+from rest_framework.exceptions import Throttled
 from django.shortcuts import get_object_or_404
-from django.http import Http404
+from django.http import Http404, HttpResponseRedirect
+from django.conf import settings
+from django.urls import reverse
+from django.utils.http import http_date
 from drf_spectacular.utils import extend_schema_view, extend_schema
+from .admission import ProcessingQueueThrottle, ServiceBusy, SlotUnavailable, get_queue_stats
+from .models import ImageUpload, ImageVariant
+from .formats import negotiate_format, FORMAT_MIME_TYPES
+from .negotiation import ImageContentNegotiation
+from .processing import FIT_MODES, FIT_CONTAIN
+from .render import render_image, verify_render_signature, build_render_url
+from .serving import media_file_response, IMMUTABLE_CACHE_CONTROL
+from .storage import get_image_storage, get_local_path
+from .serializers import (
+    ImageUploadSerializer, ImageListSerializer, ImageBatchUploadSerializer, ImageUploadSessionSerializer
+)
+from .uploadhandlers import StreamingImageUploadHandler, UploadTooLarge
+from .upload_sessions import SESSION_ID_PATTERN, UploadSession, UploadSessionError, parse_upload_metadata
+import mimetypes
 import os
-from .models import ImageUpload
-from .serializers import ImageUploadSerializer, ImageListSerializer
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Действия, после которых изображение попадает в очередь обработки
+PROCESSING_ACTIONS = [
+    'create', 'batch_upload', 'create_upload_session', 'finalize_upload_session',
+]
+# Обновление ставит обработку в очередь, только если меняет одно из этих полей
+PROCESSING_UPDATE_ACTIONS = ['update', 'partial_update']
+PROCESSING_UPDATE_FIELDS = ['encoder_profile', 'original_image']
+
 
 @extend_schema_view(
     list=extend_schema(description="Получение списка изображений"),
@@ -24,16 +48,25 @@ logger = logging.getLogger(__name__)
     destroy=extend_schema(description="Удаление изображения по ID"),
 )
 class ImageUploadViewSet(viewsets.ModelViewSet):
-    queryset = ImageUpload.objects.all()
+    queryset = ImageUpload.objects.prefetch_related('variants')
     serializer_class = ImageUploadSerializer
     parser_classes = (MultiPartParser, FormParser)
     
+    def initialize_request(self, request, *args, **kwargs):
+        """
+        Файлы пишутся потоком во временный файл с хэшированием и проверкой
+        формата (StreamingImageUploadHandler) вместо буферизации в памяти.
+        Обработчики задаются до того, как DRF прочитает тело запроса.
+        """
+        request.upload_handlers = [StreamingImageUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
+    
     def get_permissions(self):
         """
         Определение разрешений для разных действий.
         GET запросы доступны всем, остальные требуют авторизации.
         """
-        if self.action in ['list', 'retrieve', 'find_by_slug', 'debug_routes']:
+        if self.action in ['list', 'retrieve', 'find_by_slug', 'processing_status', 'best_variant', 'render', 'media', 'debug_routes']:
             permission_classes = [AllowAny]
         else:
             permission_classes = [IsAuthenticated]
@@ -46,9 +79,31 @@ class ImageUploadViewSet(viewsets.ModelViewSet):
     # Явно определяем разрешенные HTTP методы
     http_method_names = ['get', 'post', 'put', 'patch', 'delete', 'head', 'options']
     
+    def get_throttles(self):
+        """
+        Действия, ставящие обработку в очередь, отклоняются с 429, пока очередь
+        заполнена. Проверка идет до чтения тела запроса, файл не принимается.
+        Обновление проверяется только со сменой профиля или оригинала
+        (для этого тело читается), правка остальных полей проходит всегда.
+        """
+        throttles = super().get_throttles()
+        if self.action in PROCESSING_ACTIONS or self.is_processing_update():
+            throttles.append(ProcessingQueueThrottle())
+        return throttles
+    
+    def is_processing_update(self):
+        if self.action not in PROCESSING_UPDATE_ACTIONS:
+            return False
+        return any(field in self.request.data for field in PROCESSING_UPDATE_FIELDS)
+    
+    def throttled(self, request, wait):
+        raise Throttled(wait, detail='Очередь обработки изображений заполнена.')
+    
     def get_serializer_class(self):
         if self.action == 'list':
             return ImageListSerializer
+        if self.action == 'batch_upload':
+            return ImageBatchUploadSerializer
         return ImageUploadSerializer
     
     def create(self, request, *args, **kwargs):
@@ -69,19 +124,7 @@ class ImageUploadViewSet(viewsets.ModelViewSet):
             try:
                 image_upload = serializer.save()
                 logger.info(f"Image created successfully: {image_upload.id}")
-                
-                # Формируем ответ
-                response_data = {
-                    'id': image_upload.id,
-                    'original_url': request.build_absolute_uri(image_upload.original_image.url),
-                    'image_url': request.build_absolute_uri(image_upload.get_image_url()) if image_upload.get_image_url() else None,
-                    'cropped_url': request.build_absolute_uri(image_upload.get_cropped_url()) if image_upload.get_cropped_url() else None,
-                    'is_compressed': image_upload.is_compressed,
-                    'is_cropped': image_upload.is_cropped,
-                    'created_at': image_upload.created_at,
-                }
-                
-                return Response(response_data, status=status.HTTP_201_CREATED)
+                return self.get_created_response(request, image_upload)
                 
             except Exception as e:
                 logger.error(f"Error creating image: {str(e)}")
@@ -93,13 +136,588 @@ class ImageUploadViewSet(viewsets.ModelViewSet):
             logger.error(f"Serializer validation errors: {serializer.errors}")
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
+    def get_created_response(self, request, image_upload):
+        """Ответ на загрузку: обработка идет в фоне, клиент опрашивает status_url"""
+        response_data = {
+            'id': image_upload.id,
+            'status': image_upload.status,
+            'duplicate': image_upload.reused,
+            'status_url': request.build_absolute_uri(
+                reverse('image-processing-status', kwargs={'pk': image_upload.id})
+            ),
+            'original_url': request.build_absolute_uri(image_upload.original_image.url),
+            'image_url': request.build_absolute_uri(image_upload.get_image_url()) if image_upload.get_image_url() else None,
+            'cropped_url': request.build_absolute_uri(image_upload.get_cropped_url()) if image_upload.get_cropped_url() else None,
+            'is_compressed': image_upload.is_compressed,
+            'is_cropped': image_upload.is_cropped,
+            'encoder_profile': image_upload.encoder_profile,
+            'created_at': image_upload.created_at,
+        }
+        # Предупреждение о похожих изображениях (запрошено через check_similar)
+        if getattr(image_upload, 'similar', None) is not None:
+            response_data['similar'] = self.get_similar_data(request, image_upload.similar)
+        
+        # Дубликат уже обработанного файла готов сразу
+        if image_upload.status == ImageUpload.STATUS_DONE:
+            return Response(response_data, status=status.HTTP_200_OK)
+        return Response(response_data, status=status.HTTP_202_ACCEPTED)
+    
+    @extend_schema(
+        description="Загрузка нескольких изображений одним запросом (поле files), обработка идет параллельно",
+        responses={
+            202: {'description': 'Изображения приняты в обработку'},
+            400: {'description': 'Ошибка валидации'}
+        }
+    )
+    @action(detail=False, methods=['post'], url_path='batch')
+    def batch_upload(self, request):
+        """
+        Пакетная загрузка изображений
+        POST /api/images/batch/
+        """
+        logger.info(f"=== POST /api/images/batch/ === files: {len(request.FILES.getlist('files'))}")
+        
+        serializer = self.get_serializer(data=request.data)
+        if not serializer.is_valid():
+            logger.error(f"Batch upload validation errors: {serializer.errors}")
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            results = serializer.save()
+        except Exception as e:
+            logger.error(f"Error in batch upload: {str(e)}")
+            return Response(
+                {'error': f'Ошибка создания изображений: {str(e)}'},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        
+        return Response({
+            'results': [
+                {
+                    'filename': filename,
+                    'id': image_upload.id,
+                    'status': image_upload.status,
+                    'duplicate': duplicate,
+                    'status_url': request.build_absolute_uri(
+                        reverse('image-processing-status', kwargs={'pk': image_upload.id})
+                    ),
+                }
+                for filename, image_upload, duplicate in results
+            ]
+        }, status=status.HTTP_202_ACCEPTED)
+    
+    @extend_schema(
+        description=(
+            "Создание сессии возобновляемой загрузки (по протоколу tus): длина в заголовке Upload-Length, "
+            "имя и параметры в Upload-Metadata или JSON {length, filename, compress, crop, encoder_profile}"
+        ),
+        responses={
+            201: {'description': 'Сессия создана, адрес для PATCH - в заголовке Location'},
+            400: {'description': 'Ошибка валидации'},
+            413: {'description': 'Файл больше MAX_IMAGE_SIZE'}
+        }
+    )
+    @action(detail=False, methods=['post'], url_path='uploads', parser_classes=[JSONParser, FormParser, MultiPartParser])
+    def create_upload_session(self, request):
+        """
+        Создание сессии возобновляемой загрузки
+        POST /api/images/uploads/
+        """
+        try:
+            data = parse_upload_metadata(request.headers.get('Upload-Metadata'))
+        except UploadSessionError as e:
+            return Response({'error': str(e)}, status=e.status)
+        data.update(request.data.items())
+        if request.headers.get('Upload-Length'):
+            data['length'] = request.headers['Upload-Length']
+        
+        serializer = ImageUploadSessionSerializer(data=data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        options = dict(serializer.validated_data)
+        length = options.pop('length')
+        filename = options.pop('filename')
+        max_size = getattr(settings, 'MAX_IMAGE_SIZE', 128 * 1024 * 1024)
+        if length > max_size:
+            raise UploadTooLarge(f'Файл {filename} больше {max_size // (1024 * 1024)} МБ')
+        
+        session = UploadSession.create(request.user.id, length, filename, options)
+        logger.info(f"Upload session {session.id} created: {filename}, {length} bytes")
+        
+        upload_url = request.build_absolute_uri(
+            reverse('image-upload-session', kwargs={'session_id': session.id})
+        )
+        response = Response({
+            'id': session.id,
+            'upload_url': upload_url,
+            'offset': 0,
+            'length': length,
+            'chunk_max_size': getattr(settings, 'IMAGE_UPLOAD_CHUNK_MAX_SIZE', 8 * 1024 * 1024),
+        }, status=status.HTTP_201_CREATED)
+        response['Location'] = upload_url
+        return self.set_upload_session_headers(response, session)
+    
+    @extend_schema(
+        description=(
+            "Сессия возобновляемой загрузки: HEAD/GET - текущее смещение, PATCH - дозапись чанка "
+            "(Content-Type: application/offset+octet-stream, заголовок Upload-Offset), DELETE - отмена"
+        ),
+        responses={
+            200: {'description': 'Смещение и длина загрузки'},
+            204: {'description': 'Чанк принят, новое смещение в Upload-Offset'},
+            409: {'description': 'Upload-Offset не совпадает с принятым объемом'},
+            413: {'description': 'Чанк больше IMAGE_UPLOAD_CHUNK_MAX_SIZE'},
+            415: {'description': 'Неверный Content-Type чанка'},
+            423: {'description': 'Сессию пишет другой запрос'}
+        }
+    )
+    @action(detail=False, methods=['get', 'head', 'patch', 'delete'], url_path=f'uploads/(?P<session_id>{SESSION_ID_PATTERN})')
+    def upload_session(self, request, session_id=None):
+        """
+        Смещение, дозапись и отмена сессии загрузки
+        HEAD/GET/PATCH/DELETE /api/images/uploads/{session_id}/
+        """
+        session = self.get_upload_session(request, session_id)
+        
+        if request.method == 'DELETE':
+            session.delete()
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        
+        if request.method in ('GET', 'HEAD'):
+            response = Response({
+                'id': session.id,
+                'offset': session.offset,
+                'length': session.length,
+                'complete': session.is_complete,
+            })
+            return self.set_upload_session_headers(response, session)
+        
+        if request.content_type != 'application/offset+octet-stream':
+            return Response(
+                {'error': 'Чанк передается с Content-Type: application/offset+octet-stream'},
+                status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+            )
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except (KeyError, ValueError):
+            return Response({'error': 'Передайте Upload-Offset и Content-Length'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        chunk_max_size = getattr(settings, 'IMAGE_UPLOAD_CHUNK_MAX_SIZE', 8 * 1024 * 1024)
+        if content_length > chunk_max_size:
+            raise UploadTooLarge(f'Чанк больше {chunk_max_size // (1024 * 1024)} МБ')
+        
+        try:
+            session.append(request.stream, offset, content_length)
+        except UploadSessionError as e:
+            response = Response({'error': str(e), 'offset': session.offset}, status=e.status)
+            return self.set_upload_session_headers(response, session)
+        
+        response = Response(status=status.HTTP_204_NO_CONTENT)
+        return self.set_upload_session_headers(response, session)
+    
+    @extend_schema(
+        description="Завершение возобновляемой загрузки: создание изображения из принятого файла",
+        responses={
+            200: {'description': 'Дубликат уже обработанного изображения'},
+            202: {'description': 'Изображение создано, обработка в фоне'},
+            400: {'description': 'Файл не прошел проверку'},
+            409: {'description': 'Приняты не все байты'}
+        }
+    )
+    @action(detail=False, methods=['post'], url_path=f'uploads/(?P<session_id>{SESSION_ID_PATTERN})/finalize')
+    def finalize_upload_session(self, request, session_id=None):
+        """
+        Завершение сессии загрузки
+        POST /api/images/uploads/{session_id}/finalize/
+        """
+        session = self.get_upload_session(request, session_id)
+        
+        try:
+            with session.lock():
+                if not session.is_complete:
+                    return Response(
+                        {'error': 'Загрузка не завершена', 'offset': session.offset, 'length': session.length},
+                        status=status.HTTP_409_CONFLICT
+                    )
+                
+                original = session.get_file()
+                try:
+                    serializer = ImageUploadSerializer(
+                        data={'original_image': original, **session.info['options']},
+                        context={'request': request}
+                    )
+                    if not serializer.is_valid():
+                        session.delete()
+                        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+                    image_upload = serializer.save()
+                finally:
+                    original.close()
+        except UploadSessionError as e:
+            return Response({'error': str(e)}, status=e.status)
+        
+        session.delete()
+        logger.info(f"Upload session {session.id} finalized into image {image_upload.id}")
+        return self.get_created_response(request, image_upload)
+    
+    def get_upload_session(self, request, session_id):
+        """Сессия текущего пользователя; чужая и истекшая - 404"""
+        session = UploadSession.load(session_id)
+        if session is None or session.info.get('user_id') != request.user.id:
+            raise Http404
+        return session
+    
+    def set_upload_session_headers(self, response, session):
+        response['Tus-Resumable'] = '1.0.0'
+        response['Upload-Offset'] = session.offset
+        response['Upload-Length'] = session.length
+        response['Upload-Expires'] = http_date(session.expires_at)
+        response['Cache-Control'] = 'no-store'
+        return response
+    
+    @extend_schema(
+        description="Состояние очереди обработки и занятость слотов хоста",
+        responses={200: {'description': 'Глубина очереди, лимит, темп обработки, слоты'}}
+    )
+    @action(detail=False, methods=['get'], url_path='queue')
+    def queue_stats(self, request):
+        """
+        Метрики очереди обработки
+        GET /api/images/queue/
+        """
+        return Response(get_queue_stats())
+    
+    @extend_schema(
+        description="Статус фоновой обработки изображения",
+        responses={
+            200: {'description': 'Текущий статус обработки'},
+            404: {'description': 'Изображение не найдено'}
+        }
+    )
+    @action(detail=True, methods=['get'], url_path='status')
+    def processing_status(self, request, pk=None):
+        """
+        Статус обработки изображения
+        GET /api/images/{id}/status/
+        """
+        image_upload = self.get_object()
+        
+        return Response({
+            'id': image_upload.id,
+            'status': image_upload.status,
+            'error': image_upload.processing_error or None,
+            'image_url': request.build_absolute_uri(image_upload.get_image_url()) if image_upload.get_image_url() else None,
+            'cropped_url': request.build_absolute_uri(image_upload.get_cropped_url()) if image_upload.get_cropped_url() else None,
+            'updated_at': image_upload.updated_at,
+        }, status=status.HTTP_200_OK)
+    
+    def get_similar_data(self, request, matches):
+        """Краткое описание похожих изображений по списку (расстояние, id)"""
+        images = ImageUpload.objects.in_bulk([image_id for _, image_id in matches])
+        data = []
+        for distance, image_id in matches:
+            image = images.get(image_id)
+            if image is None:
+                continue
+            url = image.get_image_url()
+            data.append({
+                'id': image_id,
+                'distance': distance,
+                'image_url': request.build_absolute_uri(url) if url else None,
+                'placeholder': image.placeholder or None,
+            })
+        return data
+    
+    @extend_schema(
+        description="Похожие изображения (пересохранения, легкие кадрирования) по перцептивному хэшу",
+        parameters=[
+            {
+                'name': 'distance',
+                'in': 'query',
+                'description': 'Максимальное расстояние Хэмминга между dHash (по умолчанию IMAGE_SIMILAR_MAX_DISTANCE)',
+                'required': False,
+                'schema': {'type': 'integer'}
+            },
+            {
+                'name': 'limit',
+                'in': 'query',
+                'description': 'Максимум результатов (по умолчанию 20)',
+                'required': False,
+                'schema': {'type': 'integer'}
+            }
+        ],
+        responses={
+            200: {'description': 'Похожие изображения по возрастанию расстояния'},
+            404: {'description': 'Изображение не найдено'},
+            409: {'description': 'Хэш еще не вычислен (изображение не обработано)'}
+        }
+    )
+    @action(detail=True, methods=['get'], url_path='similar')
+    def similar(self, request, pk=None):
+        """
+        Поиск похожих изображений
+        GET /api/images/{id}/similar/?distance=8
+        """
+        image_upload = self.get_object()
+        if image_upload.dhash is None:
+            return Response(
+                {'error': 'Перцептивный хэш еще не вычислен', 'status': image_upload.status},
+                status=status.HTTP_409_CONFLICT
+            )
+        
+        distance_limit = getattr(settings, 'IMAGE_SIMILAR_DISTANCE_LIMIT', 12)
+        try:
+            max_distance = int(request.query_params.get('distance', getattr(settings, 'IMAGE_SIMILAR_MAX_DISTANCE', 8)))
+            limit = int(request.query_params.get('limit', 20))
+        except ValueError:
+            return Response({'error': 'distance и limit должны быть целыми числами'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        max_distance = max(0, min(max_distance, distance_limit))
+        matches = image_upload.find_similar(max_distance)[:max(1, limit)]
+        
+        return Response({
+            'id': image_upload.id,
+            'max_distance': max_distance,
+            'results': self.get_similar_data(request, matches),
+        }, status=status.HTTP_200_OK)
+    
+    @extend_schema(
+        description="Где используется изображение: объекты и URL-поля, ссылающиеся на его файлы",
+        responses={200: {'description': 'Список ссылок'}, 404: {'description': 'Изображение не найдено'}}
+    )
+    @action(detail=True, methods=['get'], url_path='references')
+    def references(self, request, pk=None):
+        """
+        Использование изображения в других приложениях
+        GET /api/images/{id}/references/
+        """
+        image_upload = self.get_object()
+        references = image_upload.references.select_related('content_type')
+        
+        return Response({
+            'id': image_upload.id,
+            'in_use': bool(references),
+            'results': [
+                {
+                    'model': f'{reference.content_type.app_label}.{reference.content_type.model}',
+                    'object_id': reference.object_id,
+                    'field': reference.field,
+                    'position': reference.position,
+                    'url': reference.url,
+                }
+                for reference in references
+            ],
+        }, status=status.HTTP_200_OK)
+    
+    @extend_schema(
+        description="Редирект на копию нужной ширины в самом компактном формате из Accept",
+        parameters=[
+            {
+                'name': 'w',
+                'in': 'query',
+                'description': 'Требуемая ширина в пикселях',
+                'required': False,
+                'schema': {'type': 'integer'}
+            },
+            {
+                'name': 'kind',
+                'in': 'query',
+                'description': 'responsive (по умолчанию) или cropped',
+                'required': False,
+                'schema': {'type': 'string'}
+            }
+        ],
+        responses={
+            302: {'description': 'Редирект на файл копии'},
+            404: {'description': 'Копии не найдены'}
+        }
+    )
+    @action(detail=True, methods=['get'], url_path='best', content_negotiation_class=ImageContentNegotiation)
+    def best_variant(self, request, pk=None):
+        """
+        Выбор копии по ширине и заголовку Accept запроса картинки
+        GET /api/images/{id}/best/?w=640
+        """
+        image_upload = self.get_object()
+        kind = request.query_params.get('kind', ImageVariant.KIND_RESPONSIVE)
+        variants = [v for v in image_upload.variants.all() if v.kind == kind]
+        
+        if not variants:
+            url = image_upload.get_cropped_url() if kind == ImageVariant.KIND_CROPPED else image_upload.get_image_url()
+            if not url:
+                return Response({'error': 'Изображение не найдено'}, status=status.HTTP_404_NOT_FOUND)
+            return HttpResponseRedirect(url)
+        
+        available = sorted({v.format for v in variants})
+        # Браузер без image/webp в Accept получает базовый JPEG
+        fmt = negotiate_format(request, available, default='jpeg')
+        candidates = [v for v in variants if v.format == fmt]
+        
+        try:
+            width = int(request.query_params.get('w', 0))
+        except ValueError:
+            width = 0
+        
+        # Наименьшая копия не уже запрошенной ширины, иначе самая большая
+        variant = next((v for v in candidates if v.width >= width), candidates[-1])
+        
+        response = HttpResponseRedirect(variant.file.url)
+        response['Vary'] = 'Accept'
+        return response
+    
+    def parse_render_params(self, request):
+        """Разбор и проверка параметров рендера w, h, fit, fmt"""
+        max_dimension = getattr(settings, 'IMAGE_RENDER_MAX_DIMENSION', 3840)
+        try:
+            width = int(request.query_params.get('w', 0))
+            height = int(request.query_params.get('h', 0))
+        except ValueError:
+            raise ValueError('Параметры w и h должны быть целыми числами')
+        
+        if width <= 0 and height <= 0:
+            raise ValueError('Нужно указать w и/или h')
+        if width > max_dimension or height > max_dimension:
+            raise ValueError(f'Максимальный размер стороны: {max_dimension}')
+        
+        # Отсутствующая сторона не ограничивает размер
+        width = width if width > 0 else max_dimension
+        height = height if height > 0 else max_dimension
+        
+        fit = request.query_params.get('fit', FIT_CONTAIN)
+        if fit not in FIT_MODES:
+            raise ValueError(f'fit должен быть одним из: {", ".join(FIT_MODES)}')
+        
+        fmt = request.query_params.get('fmt', 'auto')
+        if fmt != 'auto' and fmt not in FORMAT_MIME_TYPES:
+            raise ValueError(f'fmt должен быть auto или одним из: {", ".join(FORMAT_MIME_TYPES)}')
+        
+        return width, height, fit, fmt
+    
+    @extend_schema(
+        description="Копия изображения произвольного размера с кэшированием на диске. Параметры подписываются (sig)",
+        parameters=[
+            {'name': 'w', 'in': 'query', 'required': False, 'schema': {'type': 'integer'}},
+            {'name': 'h', 'in': 'query', 'required': False, 'schema': {'type': 'integer'}},
+            {'name': 'fit', 'in': 'query', 'required': False, 'schema': {'type': 'string', 'enum': list(FIT_MODES)}},
+            {'name': 'fmt', 'in': 'query', 'required': False, 'schema': {'type': 'string'}},
+            {'name': 'sig', 'in': 'query', 'required': True, 'schema': {'type': 'string'}},
+        ],
+        responses={
+            200: {'description': 'Файл изображения'},
+            400: {'description': 'Неверные параметры'},
+            403: {'description': 'Неверная подпись'},
+            404: {'description': 'Изображение не найдено'}
+        }
+    )
+    @action(detail=True, methods=['get'], url_path='render', content_negotiation_class=ImageContentNegotiation)
+    def render(self, request, pk=None):
+        """
+        Рендер копии по запросу
+        GET /api/images/{id}/render/?w=&h=&fit=&fmt=&sig=
+        """
+        try:
+            width, height, fit, fmt = self.parse_render_params(request)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Подписываются исходные значения из запроса
+        if not verify_render_signature(
+            pk,
+            request.query_params.get('w', 0),
+            request.query_params.get('h', 0),
+            fit,
+            fmt,
+            request.query_params.get('sig'),
+        ):
+            return Response({'error': 'Неверная подпись'}, status=status.HTTP_403_FORBIDDEN)
+        
+        image_upload = get_object_or_404(ImageUpload, pk=pk)
+        if not image_upload.original_image:
+            raise Http404
+        
+        output_format = fmt
+        if fmt == 'auto':
+            output_format = negotiate_format(request, list(FORMAT_MIME_TYPES), default='jpeg')
+        
+        try:
+            rendered = render_image(image_upload, width, height, fit, output_format)
+        except FileNotFoundError:
+            raise Http404
+        except SlotUnavailable:
+            raise ServiceBusy(getattr(settings, 'IMAGE_RENDER_RETRY_AFTER', 2))
+        except Exception as e:
+            logger.error(f"Error rendering image {pk}: {str(e)}")
+            return Response(
+                {'error': f'Ошибка обработки изображения: {str(e)}'},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        
+        response = media_file_response(rendered.name, FORMAT_MIME_TYPES[output_format], file=rendered)
+        response['Cache-Control'] = 'public, max-age=31536000'
+        if fmt == 'auto':
+            response['Vary'] = 'Accept'
+        return response
+    
+    @extend_schema(
+        description="Отдача файла изображения по имени в хранилище через nginx (X-Accel-Redirect)",
+        responses={
+            200: {'description': 'Файл изображения'},
+            404: {'description': 'Файл не принадлежит ни одному изображению'}
+        }
+    )
+    def media(self, request, name=None):
+        """
+        Отдача медиафайла после проверки, что он принадлежит изображению
+        GET /api/images/media/{name}
+        """
+        if not ImageUpload.objects.filter_by_file_name(name).exists():
+            raise Http404
+        
+        path = get_local_path(name)
+        if path is None:
+            # Удаленное хранилище (S3) отдает файл само
+            return HttpResponseRedirect(get_image_storage().url(name))
+        if not os.path.isfile(path):
+            raise Http404
+        
+        content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        response = media_file_response(path, content_type)
+        response['Cache-Control'] = getattr(settings, 'IMAGE_MEDIA_CACHE_CONTROL', IMMUTABLE_CACHE_CONTROL)
+        return response
+    
+    @extend_schema(
+        description="Получение подписанного URL рендера для заданных параметров",
+        responses={200: {'description': 'Подписанный URL'}, 400: {'description': 'Неверные параметры'}}
+    )
+    @action(detail=True, methods=['get'], url_path='render-url')
+    def render_url(self, request, pk=None):
+        """
+        Подписанный URL рендера
+        GET /api/images/{id}/render-url/?w=&h=&fit=&fmt=
+        """
+        image_upload = self.get_object()
+        try:
+            _, _, fit, fmt = self.parse_render_params(request)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        url = build_render_url(
+            image_upload.id,
+            request.query_params.get('w', 0),
+            request.query_params.get('h', 0),
+            fit,
+            fmt,
+        )
+        return Response({'url': request.build_absolute_uri(url)})
+    
     @extend_schema(
         description="Поиск изображения по slug (URL) без удаления",
         parameters=[
             {
                 'name': 'slug',
                 'in': 'query',
-                'description': 'URL изображения или его часть',
+                'description': 'URL изображения или имя любого его файла',
                 'required': True,
                 'schema': {'type': 'string'}
             }
@@ -127,61 +745,7 @@ class ImageUploadViewSet(viewsets.ModelViewSet):
         logger.info(f"=== GET /api/images/find/?slug={slug} ===")
         
         try:
-            # Используем ту же логику поиска, что и в delete_by_slug
-            image_upload = None
-            filename = os.path.basename(slug)
-            filename_without_ext = os.path.splitext(filename)[0]
-            
-            logger.info(f"Searching for image with slug: {slug}")
-            logger.info(f"Extracted filename: {filename}")
-            logger.info(f"Filename without extension: {filename_without_ext}")
-            
-            # Поиск по original_image
-            images_by_original = ImageUpload.objects.filter(original_image__icontains=filename)
-            if images_by_original.exists():
-                image_upload = images_by_original.first()
-                logger.info(f"Found by original_image: {image_upload.id}")
-            
-            # Поиск по processed_image
-            if not image_upload:
-                images_by_processed = ImageUpload.objects.filter(processed_image__icontains=filename)
-                if images_by_processed.exists():
-                    image_upload = images_by_processed.first()
-                    logger.info(f"Found by processed_image: {image_upload.id}")
-            
-            # Поиск по cropped_image
-            if not image_upload:
-                images_by_cropped = ImageUpload.objects.filter(cropped_image__icontains=filename)
-                if images_by_cropped.exists():
-                    image_upload = images_by_cropped.first()
-                    logger.info(f"Found by cropped_image: {image_upload.id}")
-            
-            # Поиск по части имени без расширения
-            if not image_upload:
-                images_by_filename_part = ImageUpload.objects.filter(
-                    original_image__icontains=filename_without_ext
-                )
-                if images_by_filename_part.exists():
-                    image_upload = images_by_filename_part.first()
-                    logger.info(f"Found by filename part: {image_upload.id}")
-            
-            if not image_upload:
-                images_by_processed_part = ImageUpload.objects.filter(
-                    processed_image__icontains=filename_without_ext
-                )
-                if images_by_processed_part.exists():
-                    image_upload = images_by_processed_part.first()
-                    logger.info(f"Found by processed filename part: {image_upload.id}")
-            
-            # Дополнительный поиск
-            if not image_upload:
-                for img in ImageUpload.objects.all():
-                    if (img.original_image and filename_without_ext in img.original_image.name) or \
-                       (img.processed_image and filename_without_ext in img.processed_image.name) or \
-                       (img.cropped_image and filename_without_ext in img.cropped_image.name):
-                        image_upload = img
-                        logger.info(f"Found by manual search: {image_upload.id}")
-                        break
+            image_upload = ImageUpload.objects.find_by_slug(slug)
             
             if not image_upload:
                 logger.warning(f"Image not found for slug: {slug}")
@@ -220,7 +784,7 @@ class ImageUploadViewSet(viewsets.ModelViewSet):
             {
                 'name': 'slug',
                 'in': 'query',
-                'description': 'URL изображения или его часть',
+                'description': 'URL изображения или имя любого его файла',
                 'required': True,
                 'schema': {'type': 'string'}
             }
@@ -249,66 +813,7 @@ class ImageUploadViewSet(viewsets.ModelViewSet):
         logger.info(f"=== DELETE /api/images/slug/?slug={slug} ===")
         
         try:
-            # Ищем изображение по различным полям URL
-            image_upload = None
-            
-            # Извлекаем имя файла из slug для более точного поиска
-            filename = os.path.basename(slug)
-            # Убираем расширение для поиска
-            filename_without_ext = os.path.splitext(filename)[0]
-            
-            logger.info(f"Searching for image with slug: {slug}")
-            logger.info(f"Extracted filename: {filename}")
-            logger.info(f"Filename without extension: {filename_without_ext}")
-            
-            # Попробуем найти по имени файла в original_image
-            images_by_original = ImageUpload.objects.filter(original_image__icontains=filename)
-            if images_by_original.exists():
-                image_upload = images_by_original.first()
-                logger.info(f"Found by original_image: {image_upload.id}")
-            
-            # Если не найдено, попробуем найти по processed_image
-            if not image_upload:
-                images_by_processed = ImageUpload.objects.filter(processed_image__icontains=filename)
-                if images_by_processed.exists():
-                    image_upload = images_by_processed.first()
-                    logger.info(f"Found by processed_image: {image_upload.id}")
-            
-            # Если не найдено, попробуем найти по cropped_image
-            if not image_upload:
-                images_by_cropped = ImageUpload.objects.filter(cropped_image__icontains=filename)
-                if images_by_cropped.exists():
-                    image_upload = images_by_cropped.first()
-                    logger.info(f"Found by cropped_image: {image_upload.id}")
-            
-            # Если всё ещё не найдено, попробуем найти по части имени без расширения
-            if not image_upload:
-                images_by_filename_part = ImageUpload.objects.filter(
-                    original_image__icontains=filename_without_ext
-                )
-                if images_by_filename_part.exists():
-                    image_upload = images_by_filename_part.first()
-                    logger.info(f"Found by filename part: {image_upload.id}")
-            
-            # Если всё ещё не найдено, попробуем найти по processed файлу без расширения
-            if not image_upload:
-                images_by_processed_part = ImageUpload.objects.filter(
-                    processed_image__icontains=filename_without_ext
-                )
-                if images_by_processed_part.exists():
-                    image_upload = images_by_processed_part.first()
-                    logger.info(f"Found by processed filename part: {image_upload.id}")
-            
-            # Дополнительный поиск: по ID из имени файла (если имя содержит ID)
-            if not image_upload:
-                # Попробуем извлечь ID из имени файла (например, "3dcab0ad" может быть частью ID или хеша)
-                for img in ImageUpload.objects.all():
-                    if (img.original_image and filename_without_ext in img.original_image.name) or \
-                       (img.processed_image and filename_without_ext in img.processed_image.name) or \
-                       (img.cropped_image and filename_without_ext in img.cropped_image.name):
-                        image_upload = img
-                        logger.info(f"Found by manual search: {image_upload.id}")
-                        break
+            image_upload = ImageUpload.objects.find_by_slug(slug)
             
             if not image_upload:
                 logger.warning(f"Image not found for slug: {slug}")
@@ -317,27 +822,9 @@ class ImageUploadViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_404_NOT_FOUND
                 )
             
-            # Удаляем физические файлы
-            try:
-                if image_upload.original_image and os.path.exists(image_upload.original_image.path):
-                    os.remove(image_upload.original_image.path)
-                    logger.info(f"Deleted original image file: {image_upload.original_image.path}")
-                
-                if image_upload.processed_image and os.path.exists(image_upload.processed_image.path):
-                    os.remove(image_upload.processed_image.path)
-                    logger.info(f"Deleted processed image file: {image_upload.processed_image.path}")
-                
-                if image_upload.cropped_image and os.path.exists(image_upload.cropped_image.path):
-                    os.remove(image_upload.cropped_image.path)
-                    logger.info(f"Deleted cropped image file: {image_upload.cropped_image.path}")
-            
-            except Exception as file_error:
-                logger.warning(f"Error deleting files for image {image_upload.id}: {str(file_error)}")
-                # Продолжаем удаление записи из БД даже если файлы не удалились
-            
-            # Удаляем запись из базы данных
+            # Запись удаляется сразу, файлы - фоновой задачей через очередь удаления
             image_id = image_upload.id
-            image_upload.delete()
+            ImageUpload.objects.filter(id=image_id).delete_with_files()
             
             logger.info(f"Image {image_id} deleted successfully by slug: {slug}")
             
@@ -353,6 +840,66 @@ class ImageUploadViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
     
+    @extend_schema(
+        description="Удаление нескольких изображений по ID и/или URL одной транзакцией",
+        request={
+            'application/json': {
+                'type': 'object',
+                'properties': {
+                    'ids': {'type': 'array', 'items': {'type': 'integer'}},
+                    'urls': {'type': 'array', 'items': {'type': 'string'}},
+                }
+            }
+        },
+        responses={
+            200: {'description': 'Изображения удалены'},
+            400: {'description': 'Не переданы ids или urls'}
+        }
+    )
+    @action(detail=False, methods=['delete'], url_path='bulk', parser_classes=[JSONParser, MultiPartParser, FormParser])
+    def bulk_delete(self, request):
+        """
+        Массовое удаление изображений
+        DELETE /api/images/bulk/ {"ids": [...], "urls": [...]}
+        """
+        ids = request.data.get('ids') or []
+        urls = request.data.get('urls') or []
+        
+        if not isinstance(ids, list) or not isinstance(urls, list) or not (ids or urls):
+            return Response(
+                {'error': 'Передайте непустой список ids и/или urls'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            ids = [int(image_id) for image_id in ids]
+        except (TypeError, ValueError):
+            return Response({'error': 'ids должны быть целыми числами'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        logger.info(f"=== DELETE /api/images/bulk/ === ids: {len(ids)}, urls: {len(urls)}")
+        
+        queryset = ImageUpload.objects.none()
+        if ids:
+            queryset = queryset | ImageUpload.objects.filter(id__in=ids)
+        if urls:
+            queryset = queryset | ImageUpload.objects.filter_by_slugs(urls)
+        
+        try:
+            deleted_ids = queryset.delete_with_files()
+        except Exception as e:
+            logger.error(f"Error in bulk delete: {str(e)}")
+            return Response(
+                {'error': f'Ошибка удаления изображений: {str(e)}'},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        
+        logger.info(f"Bulk deleted images: {deleted_ids}")
+        return Response({
+            'deleted': len(deleted_ids),
+            'ids': deleted_ids,
+            'not_found_ids': sorted(set(ids) - set(deleted_ids)),
+        }, status=status.HTTP_200_OK)
+    
     @extend_schema(
         description="Отладочная информация об API изображений",
         responses={200: {'description': 'Информация о доступных действиях'}}
@@ -385,11 +932,24 @@ class ImageUploadViewSet(viewsets.ModelViewSet):
             'actions': {
                 'list': 'GET /api/images/',
                 'create': 'POST /api/images/',
+                'batch_upload': 'POST /api/images/batch/',
+                'create_upload_session': 'POST /api/images/uploads/',
+                'upload_session': 'HEAD/PATCH/DELETE /api/images/uploads/{session_id}/',
+                'finalize_upload_session': 'POST /api/images/uploads/{session_id}/finalize/',
+                'queue_stats': 'GET /api/images/queue/',
                 'retrieve': 'GET /api/images/{id}/',
                 'update': 'PUT /api/images/{id}/',
                 'partial_update': 'PATCH /api/images/{id}/',
                 'destroy': 'DELETE /api/images/{id}/',
+                'processing_status': 'GET /api/images/{id}/status/',
+                'best_variant': 'GET /api/images/{id}/best/?w=${width}',
+                'render': 'GET /api/images/{id}/render/?w=&h=&fit=&fmt=&sig=',
+                'similar': 'GET /api/images/{id}/similar/?distance=',
+                'references': 'GET /api/images/{id}/references/',
+                'render_url': 'GET /api/images/{id}/render-url/?w=&h=&fit=&fmt=',
+                'media': 'GET /api/images/media/{name}',
                 'delete_by_slug': 'DELETE /api/images/slug/?slug=${image_url}',
+                'bulk_delete': 'DELETE /api/images/bulk/',
                 'debug_routes': 'GET /api/images/debug/',
             },
             'sample_images': images_info
@@ -433,4 +993,7 @@ class ImageUploadViewSet(viewsets.ModelViewSet):
         DELETE /api/images/{id}/
         """
         logger.info(f"=== DELETE /api/images/{kwargs.get('pk')}/ ===")
-        return super().destroy(request, *args, **kwargs)
\ No newline at end of file
+        return super().destroy(request, *args, **kwargs)
+    
+    def perform_destroy(self, instance):
+        ImageUpload.objects.filter(id=instance.id).delete_with_files()
\ No newline at end of file
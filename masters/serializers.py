@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from .models import Master
+from images.serializers import ImageReferenceListSerializer, ImageReferencesField
 from products.serializers import ProductSerializer
 from service_types.serializers import ServiceTypeSerializer
 
@@ -72,13 +73,15 @@ class MasterListSerializer(serializers.ModelSerializer):
     service_types_names = serializers.SerializerMethodField()
     favorite_product_name = serializers.SerializerMethodField()
     favorite_product_id = serializers.IntegerField(source='favorite_product.id', read_only=True)
+    images = ImageReferencesField()
     
     class Meta:
         model = Master
         fields = [
             'id', 'name', 'image', 'job_title', 'experience', 
-            'service_types_names', 'favorite_product_name', 'favorite_product_id'
+            'service_types_names', 'favorite_product_name', 'favorite_product_id', 'images'
         ]
+        list_serializer_class = ImageReferenceListSerializer
     
     def get_service_types_names(self, obj):
         return [st.name for st in obj.service_types.all()]
@@ -2,6 +2,7 @@
 from rest_framework import serializers
 from django.apps import apps
 from .models import Portfolio
+from images.serializers import ImageReferenceListSerializer, ImageReferencesField
 import json
 
 
@@ -120,10 +121,12 @@ class PortfolioListSerializer(serializers.ModelSerializer):
     service_types = ServiceTypesField(read_only=True)
     services = ServicesField(read_only=True)
     master_name = serializers.SerializerMethodField()
+    images = ImageReferencesField()
 
     class Meta:
         model = Portfolio
-        fields = ['id', 'image', 'master_name', 'service_types', 'services']
+        fields = ['id', 'image', 'images', 'master_name', 'service_types', 'services']
+        list_serializer_class = ImageReferenceListSerializer
 
     def get_master_name(self, obj):
         if obj.master is None:
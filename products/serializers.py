@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from .models import Product
+from images.serializers import ImageReferenceListSerializer, ImageReferencesField
 
 
 class ProductSerializer(serializers.ModelSerializer):
@@ -14,10 +15,13 @@ class ProductSerializer(serializers.ModelSerializer):
 
 class ProductListSerializer(serializers.ModelSerializer):
     """Упрощенный сериализатор для списка продуктов"""
+    images = ImageReferencesField()
+    
     class Meta:
         model = Product
         fields = [
-            'id', 'brand', 'name', 'image', 'purpose',
+            'id', 'brand', 'name', 'image', 'images', 'purpose',
             'created_at', 'updated_at'
         ]
-        read_only_fields = ['created_at', 'updated_at']
\ No newline at end of file
+        read_only_fields = ['created_at', 'updated_at']
+        list_serializer_class = ImageReferenceListSerializer
\ No newline at end of file
@@ -52,11 +52,23 @@ class ServiceType(models.Model):
     def __str__(self):
         return self.name
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Название при загрузке: по нему save() узнает, что оно изменилось
+        instance._loaded_name = dict(zip(field_names, values)).get('name')
+        return instance
+    
     def save(self, *args, **kwargs):
+        adding = self._state.adding
         # Генерируем slug при создании или если название изменилось
-        if not self.pk or self._state.adding or 'name' in getattr(self, '_changed_fields', []):
+        if not self.pk or adding or 'name' in getattr(self, '_changed_fields', []):
             self.slug = self.generate_unique_slug()
         super().save(*args, **kwargs)
+        # Название типа входит в поисковый вектор услуг: пересчет только при его смене
+        if not adding and self.name != getattr(self, '_loaded_name', None):
+            self.services.update_search_vector()
+        self._loaded_name = self.name
     
     def generate_unique_slug(self):
         """Генерация уникального slug"""
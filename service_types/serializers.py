@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from .models import ServiceType
+from images.serializers import ImageReferenceListSerializer, ImageReferencesField
 
 
 class ServiceTypeSerializer(serializers.ModelSerializer):
@@ -58,12 +59,14 @@ class ServiceTypeSerializer(serializers.ModelSerializer):
 class ServiceTypeListSerializer(serializers.ModelSerializer):
     """Упрощенный сериализатор для списка типов услуг"""
     services_count = serializers.SerializerMethodField()
+    images = ImageReferencesField()
     
     class Meta:
         model = ServiceType
         fields = [
-            'id', 'name', 'client_types', 'target', 'main_image', 'slug', 'services_count',
+            'id', 'name', 'client_types', 'target', 'main_image', 'images', 'slug', 'services_count',
         ]
+        list_serializer_class = ImageReferenceListSerializer
     
     def get_services_count(self, obj):
         return obj.services.count()
\ No newline at end of file
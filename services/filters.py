@@ -1,7 +1,57 @@
 # services/filters.py
+import re
 import django_filters
-from django.db.models import Q
-from .models import Service
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import F, Q
+from rest_framework.filters import SearchFilter
+from rest_framework.settings import api_settings
+from .models import SEARCH_CONFIG, Service
+
+WORD_PATTERN = re.compile(r'\w+')
+
+
+def build_search_query(terms):
+    """
+    tsquery из слов запроса: все слова обязательны, последнее ищется по префиксу
+    (подсказки по мере ввода). Слова очищаются от операторов tsquery.
+    None - если слов не осталось.
+    """
+    words = [word for term in terms for word in WORD_PATTERN.findall(term)]
+    if not words:
+        return None
+    words[-1] += ':*'
+    return SearchQuery(' & '.join(words), search_type='raw', config=SEARCH_CONFIG)
+
+
+class ServiceSearchFilter(SearchFilter):
+    """
+    Полнотекстовый поиск по search_vector (GIN-индекс) с ранжированием по
+    SearchRank: название важнее типа услуги, тип - описания. Без явного
+    ?ordering= результаты сортируются по релевантности, поэтому фильтр
+    стоит после OrderingFilter. Вне PostgreSQL - обычный SearchFilter
+    по search_fields.
+    """
+    
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+        if connections[queryset.db].vendor != 'postgresql':
+            return super().filter_queryset(request, queryset, view)
+        
+        query = build_search_query(terms)
+        if query is None:
+            return queryset
+        
+        queryset = queryset.filter(search_vector=query)
+        if request.query_params.get(api_settings.ORDERING_PARAM):
+            return queryset
+        # Прежний порядок сохраняется для равной релевантности
+        return queryset.annotate(search_rank=SearchRank(F('search_vector'), query)).order_by(
+            '-search_rank', *queryset.query.order_by
+        )
+
 
 class ServiceFilter(django_filters.FilterSet):
     @staticmethod
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.7 on 2026-10-18 17:50
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+
+def fill_search_vector(apps, schema_editor):
+    """Заполнение search_vector для существующих услуг (те же веса, что в build_search_vector)"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Service = apps.get_model('services', 'Service')
+    ServiceType = apps.get_model('service_types', 'ServiceType')
+    service_type_name = Subquery(ServiceType.objects.filter(pk=OuterRef('service_type_id')).values('name')[:1])
+    Service.objects.using(schema_editor.connection.alias).update(search_vector=(
+        SearchVector('name', weight='A', config='russian')
+        + SearchVector(service_type_name, weight='B', config='russian')
+        + SearchVector('description', weight='C', config='russian')
+        + SearchVector('target', 'client_types', weight='D', config='russian')
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0009_alter_service_client_types_alter_service_target'),
+        ('service_types', '0005_alter_servicetype_target'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='service',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='service',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='service_search_vector_gin'),
+        ),
+        migrations.RunPython(fill_search_vector, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,35 @@
 # services/models.py
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.db import connections, models
+from django.db.models import OuterRef, Subquery
 from slugify import slugify
+from service_types.models import ServiceType
+
+# Конфигурация полнотекстового поиска PostgreSQL (стемминг русского языка)
+SEARCH_CONFIG = 'russian'
+
+
+def build_search_vector():
+    """
+    Поисковый вектор услуги: название (вес A), тип услуги (B), описание (C),
+    целевая аудитория и типы клиентов (D)
+    """
+    service_type_name = Subquery(ServiceType.objects.filter(pk=OuterRef('service_type_id')).values('name')[:1])
+    return (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(service_type_name, weight='B', config=SEARCH_CONFIG)
+        + SearchVector('description', weight='C', config=SEARCH_CONFIG)
+        + SearchVector('target', 'client_types', weight='D', config=SEARCH_CONFIG)
+    )
+
+
+class ServiceQuerySet(models.QuerySet):
+    def update_search_vector(self):
+        """Пересчет search_vector одним UPDATE; вне PostgreSQL поиск идет без него"""
+        if connections[self.db].vendor != 'postgresql':
+            return 0
+        return self.update(search_vector=build_search_vector())
 
 
 class Service(models.Model):
@@ -60,12 +89,18 @@ class Service(models.Model):
         verbose_name='URL slug'
     )
     
+    # Поддерживается в save() услуги и типа услуги (update_search_vector)
+    search_vector = SearchVectorField(null=True, editable=False)
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = ServiceQuerySet.as_manager()
+    
     class Meta:
         verbose_name = 'Услуга'
         verbose_name_plural = 'Услуги'
+        indexes = [GinIndex(fields=['search_vector'], name='service_search_vector_gin')]
     
     def __str__(self):
         return self.name
@@ -74,6 +109,7 @@ class Service(models.Model):
         if not self.slug:
             self.slug = self.generate_unique_slug()
         super().save(*args, **kwargs)
+        Service.objects.filter(pk=self.pk).update_search_vector()
     
     def generate_unique_slug(self):
         """Генерация уникального slug"""
@@ -2,6 +2,7 @@
 from rest_framework import serializers
 from .models import Service
 from service_types.models import ServiceType
+from images.serializers import ImageReferenceListSerializer, ImageReferencesField
 import json
 
 class ServiceSerializer(serializers.ModelSerializer):
@@ -111,7 +112,9 @@ class ServiceSerializer(serializers.ModelSerializer):
 class ServiceListSerializer(serializers.ModelSerializer):
     """Упрощенный сериализатор для списка услуг"""
     service_type_name = serializers.CharField(source='service_type.name', read_only=True)
+    images = ImageReferencesField()
     
     class Meta:
         model = Service
-        fields = '__all__'
\ No newline at end of file
+        exclude = ['search_vector']
+        list_serializer_class = ImageReferenceListSerializer
\ No newline at end of file
@@ -1,3 +1,158 @@
-from django.test import TestCase
+import io
+import shutil
+import tempfile
+from unittest import mock, skipUnless
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+from rest_framework.test import APITestCase
+from images.models import ImageReference, ImageUpload
+from service_types.models import ServiceType
+from .models import Service, ServiceQuerySet
 
-# Create your tests here.
+MEDIA_ROOT = tempfile.mkdtemp(prefix='service-tests-')
+
+
+def make_upload(color):
+    """Загруженное изображение без обработки: ссылки сопоставляются по имени оригинала"""
+    data = io.BytesIO()
+    Image.new('RGB', (64, 64), color).save(data, 'JPEG')
+    return ImageUpload.objects.create(original_image=SimpleUploadedFile(f'{color[0]}.jpg', data.getvalue()))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ServiceImageReferenceTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+    
+    def setUp(self):
+        self.service_type = ServiceType.objects.create(name='Стрижки', description='Стрижки и укладки')
+        self.first = make_upload((10, 0, 0))
+        self.second = make_upload((20, 0, 0))
+    
+    def get_references(self, service):
+        return list(
+            ImageReference.objects
+            .filter(content_type=ContentType.objects.get_for_model(Service), object_id=service.pk)
+            .order_by('position')
+            .values_list('position', 'image_id')
+        )
+    
+    def test_references_follow_main_images(self):
+        service = Service.objects.create(
+            name='Мужская стрижка',
+            service_type=self.service_type,
+            main_images=[
+                f'https://cdn.example.com{self.first.original_image.url}',
+                {'url': self.second.original_image.url},
+                'https://example.com/external.jpg',
+            ],
+        )
+        self.assertEqual(
+            self.get_references(service), [(0, self.first.id), (1, self.second.id), (2, None)]
+        )
+        
+        service.main_images = [self.second.original_image.url]
+        service.save()
+        self.assertEqual(self.get_references(service), [(0, self.second.id)])
+        
+        service_id = service.pk
+        service.delete()
+        self.assertFalse(ImageReference.objects.filter(object_id=service_id).exists())
+    
+    def test_unchanged_images_are_not_resolved_again(self):
+        service = Service.objects.create(
+            name='Мужская стрижка', service_type=self.service_type, main_images=[self.first.original_image.url]
+        )
+        
+        with mock.patch('images.references.resolve_urls') as resolve:
+            service.description = 'Новое описание'
+            service.save()
+        
+        resolve.assert_not_called()
+    
+    def test_deleted_image_leaves_unresolved_reference(self):
+        service = Service.objects.create(
+            name='Мужская стрижка', service_type=self.service_type, main_images=[self.first.original_image.url]
+        )
+        
+        self.first.delete()
+        
+        self.assertEqual(self.get_references(service), [(0, None)])
+
+
+class ServiceSearchTests(APITestCase):
+    def setUp(self):
+        self.client.force_authenticate(
+            get_user_model().objects.create_user(username='editor', email='editor@example.com', password='x')
+        )
+        haircuts = ServiceType.objects.create(name='Стрижки', description='Стрижки и укладки')
+        nails = ServiceType.objects.create(name='Маникюр', description='Уход за ногтями')
+        self.haircut = Service.objects.create(name='Мужская стрижка', service_type=haircuts, description='Машинкой и ножницами')
+        self.styling = Service.objects.create(name='Вечерняя укладка', service_type=haircuts, description='Укладка на торжество')
+        self.manicure = Service.objects.create(name='Классический маникюр', service_type=nails, description='Обрезной маникюр')
+    
+    def search(self, query, **params):
+        response = self.client.get(reverse('service-list'), {'search': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [item['slug'] for item in response.data['result']]
+    
+    def test_search_matches_name_description_and_type(self):
+        self.assertEqual(self.search('маникюр'), [self.manicure.slug])
+        self.assertEqual(set(self.search('Стрижки')), {self.haircut.slug, self.styling.slug})
+        self.assertEqual(self.search('торжество'), [self.styling.slug])
+        self.assertEqual(self.search('педикюр'), [])
+    
+    def test_search_combines_with_filters_and_ordering(self):
+        self.assertEqual(
+            self.search('Стрижки', service_type_id=self.haircut.service_type_id, ordering='name'),
+            [self.styling.slug, self.haircut.slug],
+        )
+    
+    @skipUnless(connection.vendor == 'postgresql', 'Полнотекстовый поиск только в PostgreSQL')
+    def test_search_ranks_name_above_description(self):
+        Service.objects.create(
+            name='Укладка', service_type=self.manicure.service_type, description='После стрижки'
+        )
+        
+        self.assertEqual(self.search('стрижка')[0], self.haircut.slug)
+    
+    @skipUnless(connection.vendor == 'postgresql', 'Полнотекстовый поиск только в PostgreSQL')
+    def test_search_matches_prefix_of_last_word(self):
+        self.assertEqual(self.search('маник'), [self.manicure.slug])
+    
+    @skipUnless(connection.vendor == 'postgresql', 'Полнотекстовый поиск только в PostgreSQL')
+    def test_service_type_rename_is_searchable(self):
+        service_type = self.haircut.service_type
+        service_type.name = 'Барбершоп'
+        service_type.save()
+        
+        self.assertEqual(set(self.search('барбершоп')), {self.haircut.slug, self.styling.slug})
+
+
+class ServiceTypeSearchVectorTests(TestCase):
+    def setUp(self):
+        self.service_type = ServiceType.objects.create(name='Стрижки', description='Стрижки и укладки')
+        Service.objects.create(name='Мужская стрижка', service_type=self.service_type)
+    
+    def test_search_vectors_are_updated_only_on_rename(self):
+        service_type = ServiceType.objects.get(pk=self.service_type.pk)
+        
+        with mock.patch.object(ServiceQuerySet, 'update_search_vector') as update:
+            service_type.description = 'Новое описание'
+            service_type.save()
+            self.assertEqual(update.call_count, 0)
+            
+            service_type.name = 'Барбершоп'
+            service_type.save()
+            self.assertEqual(update.call_count, 1)
+            
+            # После сохранения новое название считается текущим
+            service_type.save()
+            self.assertEqual(update.call_count, 1)
@@ -3,18 +3,18 @@ from rest_framework import viewsets, status
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.filters import OrderingFilter
 from django.db.models import Q
 from .models import Service
 from .serializers import ServiceSerializer, ServiceListSerializer
-from .filters import ServiceFilter
+from .filters import ServiceFilter, ServiceSearchFilter
 from utils.pagination import ServicePagination
 import logging
 
 logger = logging.getLogger(__name__)
 
 class ServiceViewSet(viewsets.ModelViewSet):
-    queryset = Service.objects.select_related('service_type').all()
+    queryset = Service.objects.select_related('service_type').defer('search_vector')
     serializer_class = ServiceSerializer
     
     def get_permissions(self):
@@ -25,8 +25,10 @@ class ServiceViewSet(viewsets.ModelViewSet):
         return [permission() for permission in permission_classes]
     
     pagination_class = ServicePagination
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    # Поиск после сортировки: без ?ordering= результаты упорядочены по релевантности
+    filter_backends = [DjangoFilterBackend, OrderingFilter, ServiceSearchFilter]
     filterset_class = ServiceFilter
+    # Поиск вне PostgreSQL (ServiceSearchFilter переходит на icontains)
     search_fields = [
         'name', 
         'description', 